@@ -1,28 +1,34 @@
 from abc import abstractmethod, ABCMeta
+from typing import Iterator, Optional, TextIO
+from json.encoder import encode_basestring_ascii
+import gzip
 import io
-import json
+import re
 
-from Instructions import Instructions, Instructions0Params
+from Instructions import Instructions, Instructions0Params, Instructions1Params
 
 
-def strip_ansi_colour(text: str) -> iter:
+ANSI_COLOUR = re.compile("\x1b[^m]*m")
+
+# Pieces the streaming JSON writer collects before writing them
+JSON_CHUNK = 1 << 12
+
+# id(node) -> (node, text) of the nodes printed while results are exported,
+# so that nodes printed within others are printed once; None otherwise
+_printed: Optional[dict] = None
+
+
+def strip_ansi_colour(text: str) -> str:
     """Strip ANSI colour sequences from a string.
 
     Args:
         text (str): Text string to be stripped.
 
     Returns:
-        iter[str]: A generator for each returned character. Note,
-        this will include newline characters.
+        str: The text without the sequences.
 
     """
-    buff = io.StringIO(text)
-    while (b := buff.read(1)):
-        if b == '\x1b':
-            while (b := buff.read(1)) != 'm':
-                continue
-        else:
-            yield b
+    return ANSI_COLOUR.sub("", text)
 
 
 class CompilationResult:
@@ -31,6 +37,12 @@ class CompilationResult:
         self.description = description
         self.node = node
 
+    def description_text(self) -> str:
+        return strip_ansi_colour(self.description)
+
+    def node_text(self) -> Optional[str]:
+        return strip_ansi_colour(repr(self.node)) if self.node is not None else None
+
     def to_map(self):
         children = []
 
@@ -38,29 +50,146 @@ class CompilationResult:
             if type(i) == CompilationResult:
                 children.append(i.to_map())
             else:
-                children.append("".join(strip_ansi_colour(str(i))))
+                children.append(strip_ansi_colour(str(i)))
 
         data = {
-            "description": "".join(strip_ansi_colour(self.description)),
-            "description_node": "".join(strip_ansi_colour(self.node.pretty_print(0))) if self.node is not None else None,
+            "description": self.description_text(),
+            "description_node": self.node_text(),
             "code": children
         }
 
         return data
 
-    def to_json(self):
-        map = self.to_map()
-        string = json.dumps(map, indent=4)
-
-        return string
+    def to_json(self, indent: Optional[int] = 4):
+        string = io.StringIO()
+        self.write_json(string, indent)
+
+        return string.getvalue()
+
+    def write_json(self, file: TextIO, indent: Optional[int] = 4, nodes: bool = True):
+        """
+        Writes the JSON of to_map to file while walking the result, without
+        building the map or recursing. Without indent the JSON is compact.
+        Without nodes the printed nodes are left out (null), which keeps the
+        output linear in the size of the code for deep trees. Every node is
+        printed once, also where it is part of the nodes printed around it
+        """
+        global _printed
+        outer = _printed
+        if _printed is None:
+            _printed = {}
+        try:
+            self._write_json(file, indent, nodes)
+        finally:
+            _printed = outer
+
+    def _write_json(self, file: TextIO, indent: Optional[int], nodes: bool):
+        key_separator = ":" if indent is None else ": "
+        # the pieces of the results at a depth, see separators
+        pieces = {}
+        # encoded texts by instruction, description and node
+        instructions = {}
+        descriptions = {}
+        printed = {None: "null"}
+
+        def separators(depth: int) -> tuple[str, str, str, str, str, str]:
+            """What opens a result of depth up to its code, and what separates and closes its items"""
+            newline = [("" if indent is None else "\n" + " " * (indent * d)) for d in (depth, depth + 1, depth + 2)]
+            inner = "," + newline[1]
+            pieces[depth] = ("{" + newline[1] + '"description"' + key_separator,
+                             inner + '"description_node"' + key_separator,
+                             inner + '"code"' + key_separator,
+                             "[]" + newline[0] + "}",
+                             newline[2], "," + newline[2], newline[1] + "]" + newline[0] + "}")
+            return pieces[depth]
+
+        chunk = []
+        append = chunk.append
+        stack = []
+
+        def open_result(result: CompilationResult, depth: int) -> bool:
+            (head, node_key, code_key, empty, first_separator, separator, end) = pieces.get(depth) or separators(depth)
+            description = descriptions.get(result.description)
+            if description is None:
+                description = descriptions[result.description] = encode_basestring_ascii(result.description_text())
+            node = id(result.node) if nodes else None
+            text = printed.get(node)
+            if text is None:
+                text = result.node_text()
+                text = printed[node] = encode_basestring_ascii(text) if text is not None else "null"
+            if result.code:
+                append(head + description + node_key + text + code_key + "[")
+                stack.append((iter(result.code), depth + 2, first_separator, separator, end))
+                return True
+            append(head + description + node_key + text + code_key + empty)
+            return False
+
+        first = open_result(self, 0)
+        while stack:
+            (items, depth, first_separator, separator, end) = stack[-1]
+            for item in items:
+                append(first_separator if first else separator)
+                kind = type(item)
+                if kind == CompilationResult:
+                    first = open_result(item, depth)
+                    break
+                key = item.instruction if kind == Instructions0Params else \
+                    (item.instruction, item.param1) if kind == Instructions1Params else item
+                text = instructions.get(key)
+                if text is None:
+                    text = instructions[key] = encode_basestring_ascii(strip_ansi_colour(str(item)))
+                append(text)
+                first = False
+            else:
+                stack.pop()
+                append(end)
+                first = False
+
+            if len(chunk) >= JSON_CHUNK:
+                file.write("".join(chunk))
+                chunk.clear()
+
+        file.write("".join(chunk))
+
+    def save_json(self, path: str, indent: Optional[int] = 4, compress: Optional[bool] = None, nodes: bool = True):
+        """
+        Writes the JSON to the file at path, compressed with gzip if compress
+        or, by default, if the path ends with .gz
+        """
+        if compress is None:
+            compress = path.endswith(".gz")
+        opener = gzip.open if compress else open
+        with opener(path, "wt", encoding="utf-8") as f:
+            self.write_json(f, indent, nodes)
+
+    def instructions(self) -> Iterator[Instructions]:
+        """The instructions of the result in order, generated without recursion"""
+        stack = [iter(self.code)]
+        while stack:
+            for i in stack[-1]:
+                if type(i) == CompilationResult:
+                    stack.append(iter(i.code))
+                    break
+                yield i
+            else:
+                stack.pop()
 
-    def to_code(self):
+    def to_code(self) -> list[Instructions]:
+        """
+        The instructions of the result as one list. Every instruction is
+        appended once, so flattening takes linear time at any depth
+        """
         code = []
-        for i in self.code:
-            if type(i) == CompilationResult:
-                code += i.to_code()
+        append = code.append
+        stack = [iter(self.code)]
+        while stack:
+            for i in stack[-1]:
+                if type(i) == CompilationResult:
+                    stack.append(iter(i.code))
+                    break
+                append(i)
             else:
-                code.append(i)
+                stack.pop()
         return code
 
 
@@ -82,11 +211,24 @@ class ASTNode(metaclass=ABCMeta):
         pass
 
     @abstractmethod
-    def getType(self):
+    def getType(self, types=None):
         pass
 
     def __repr__(self):
-        return self.pretty_print(0)
+        if _printed is None:
+            return self.pretty_print(0)
+        entry = _printed.get(id(self))
+        if entry is None or entry[0] is not self:
+            entry = _printed[id(self)] = (self, self.pretty_print(0))
+        return entry[1]
+
+    def simplify(self, report: list[str]) -> "ASTNode":
+        """
+        Returns a node computing the same with less code: constants are folded,
+        identities removed and branches with constant conditions pruned. Every
+        change is described in report. Children are simplified in place
+        """
+        return self
 
     def code(self, addressSpace: dict[str, int], n) -> CompilationResult:
         return makeCompilationResult([self.codeR(addressSpace, n), Instructions0Params(
@@ -0,0 +1,139 @@
+from __future__ import annotations
+from collections import defaultdict
+
+
+# Blocks of up to SMALL cells have a free list per size, larger blocks share
+# one free list per power of two
+SMALL = 16
+
+
+def size_class(size: int) -> int:
+    return size if size <= SMALL else SMALL + size.bit_length()
+
+
+class Allocator:
+    """
+    The heap allocator behind NEW and FREE.
+
+    The heap grows down from the end of the memory to NP. Freed blocks are
+    merged with free neighbours and kept in size-segregated free lists, from
+    which NEW serves requests before growing the heap. A free block at NP is
+    given back to the unused memory right away, so programs that never free
+    get the same addresses as with a bump allocator.
+
+    The sizes of the blocks are kept outside the memory, which the program
+    sees exactly as before.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.reset()
+
+    def reset(self):
+        """Frees every block and clears the statistics"""
+        # allocated blocks, address -> size
+        self.blocks: dict[int, int] = {}
+        # free blocks, address -> size and end -> address
+        self.free_blocks: dict[int, int] = {}
+        self.free_ends: dict[int, int] = {}
+        self.lists: dict[int, set[int]] = defaultdict(set)
+        self.free_cells = 0
+        self.top = 0
+
+        self.allocations = 0
+        self.frees = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.peak_heap = 0
+
+    def alloc(self, size: int, NP: int, EP: int) -> tuple[int, int]:
+        """
+        Allocates a block of size cells. Returns its address, or 0 if the heap
+        would run into the stack, and the new NP
+        """
+        address = self.take(size) if self.free_cells >= size > 0 else None
+        if address is None:
+            if NP - size <= EP:
+                return 0, NP
+            NP -= size
+            address = NP
+            self.peak_heap = max(self.peak_heap, self.size - NP)
+
+        if size > 0:
+            self.blocks[address] = size
+            self.allocations += 1
+            self.in_use += size
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+        return address, NP
+
+    def release(self, address: int, NP: int) -> int:
+        """
+        Frees the block at address. Freeing 0 does nothing. Returns the new NP
+        """
+        if address == 0:
+            return NP
+        size = self.blocks.pop(address, None)
+        if size is None:
+            raise Exception(f"Free of {address}, which is not an allocated block")
+        self.frees += 1
+        self.in_use -= size
+
+        start = address
+        end = address + size
+        if start in self.free_ends:
+            start = self.free_ends[start]
+            self.remove(start)
+        if end in self.free_blocks:
+            end += self.remove(end)
+
+        if start == NP:
+            return end
+        self.insert(start, end - start)
+        return NP
+
+    def take(self, size: int):
+        """Removes a free block of at least size cells and returns its address"""
+        for c in range(size_class(size), self.top + 1):
+            for address in self.lists.get(c, ()):
+                found = self.free_blocks[address]
+                if found >= size:
+                    self.remove(address)
+                    if found > size:
+                        self.insert(address + size, found - size)
+                    return address
+        return None
+
+    def insert(self, address: int, size: int):
+        self.free_blocks[address] = size
+        self.free_ends[address + size] = address
+        c = size_class(size)
+        self.lists[c].add(address)
+        self.top = max(self.top, c)
+        self.free_cells += size
+
+    def remove(self, address: int) -> int:
+        size = self.free_blocks.pop(address)
+        del self.free_ends[address + size]
+        self.lists[size_class(size)].remove(address)
+        self.free_cells -= size
+        return size
+
+    def stats(self, NP: int) -> dict[str, int | float]:
+        """
+        Usage of the heap. Fragmentation is the share of the free cells
+        outside the largest free block
+        """
+        largest = max(self.free_blocks.values(), default=0)
+        return {
+            "allocations": self.allocations,
+            "frees": self.frees,
+            "live blocks": len(self.blocks),
+            "in use": self.in_use,
+            "peak in use": self.peak_in_use,
+            "heap": self.size - NP,
+            "peak heap": self.peak_heap,
+            "free": self.free_cells,
+            "free blocks": len(self.free_blocks),
+            "largest free block": largest,
+            "fragmentation": 1 - largest / self.free_cells if self.free_cells else 0.0,
+        }
@@ -0,0 +1,117 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Optional
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+import marshal
+import os
+
+from Instructions import encode, decode
+from Interpreter import Interpreter
+from Output import ListSink
+
+if TYPE_CHECKING:
+    from Instructions import Instructions
+
+
+ENGINES = {
+    "image": Interpreter.run_image,
+    "threaded": Interpreter.run_threaded,
+    "jit": Interpreter.run_jit,
+}
+
+
+class Job:
+    """
+    One run of the program with index program. Before the run, the cells
+    are written to memory, e.g. to give the globals different inputs
+    """
+
+    def __init__(self, program: int = 0, cells: dict[int, int] = None):
+        self.program = program
+        self.cells = cells if cells is not None else {}
+
+
+class Result:
+    def __init__(self, exit_code: int, output: str, steps: int, time: float, error: Optional[str] = None):
+        self.exit_code = exit_code
+        self.output = output
+        self.steps = steps
+        self.time = time
+        self.error = error
+
+    def __repr__(self):
+        if self.error is not None:
+            return f"Result(error={self.error!r}, steps={self.steps}, time={self.time:.4f})"
+        return f"Result(exit_code={self.exit_code}, steps={self.steps}, time={self.time:.4f}, output={self.output!r})"
+
+
+# State of a worker process, set once by the pool initializer: an interpreter
+# per program, whose image is linked once and which is reset for every job
+_interpreters: list[Interpreter] = []
+_engine = None
+
+
+def _initialize(blob: bytes, engine: str):
+    global _interpreters, _engine
+    _interpreters = [Interpreter(decode(encoded), output=ListSink()) for encoded in marshal.loads(blob)]
+    _engine = ENGINES[engine]
+
+
+def _run(job: tuple[int, dict[int, int]]):
+    (program, cells) = job
+    s = _interpreters[program]
+    s.reset()
+    s.output.clear()
+    for (address, value) in cells.items():
+        s.stack[address] = value
+
+    error = None
+    start = perf_counter()
+    try:
+        s.steps = _engine(s)
+    except Exception as e:
+        error = str(e)
+    elapsed = perf_counter() - start
+    if error is not None:
+        # the engines may hold registers of the failed run
+        _interpreters[program] = Interpreter(s.code, output=ListSink(), image=s.image)
+
+    exit_code = s.stack.stack[0] if error is None else None
+    return (exit_code, s.output.getvalue(), s.steps, elapsed, error)
+
+
+def run_batch(programs: list[list[Instructions]], jobs: list[Job] = None, workers: int = None, engine: str = "image") -> list[Result]:
+    """
+    Runs the jobs on a pool of worker processes and returns their results in
+    order. Without jobs, every program runs once. The programs are sent to
+    and linked by each worker once; jobs only carry the program index and the
+    inputs
+    """
+    if jobs is None:
+        jobs = [Job(i) for i in range(len(programs))]
+    if engine not in ENGINES:
+        raise Exception("Unknown engine " + str(engine))
+
+    workers = workers or os.cpu_count() or 1
+    blob = marshal.dumps([encode(code) for code in programs])
+    chunksize = max(1, len(jobs) // (workers * 4))
+
+    with ProcessPoolExecutor(workers, initializer=_initialize, initargs=(blob, engine)) as executor:
+        results = executor.map(
+            _run, [(job.program, job.cells) for job in jobs], chunksize=chunksize)
+        return [Result(*result) for result in results]
+
+
+if __name__ == '__main__':
+    from benchmark import fib
+
+    programs = [fib(k).code({}, 0).to_code() for k in range(1, 21)]
+
+    for workers in sorted({1, os.cpu_count() or 1}):
+        start = perf_counter()
+        results = run_batch(programs * 10, workers=workers)
+        elapsed = perf_counter() - start
+        print(f"{len(results)} jobs on {workers:>3} workers: {elapsed:.4f}s")
+
+    for k, result in zip(range(1, 21), results):
+        print(f"fib({k:>2}) = {result.exit_code:>6} in {result.steps:>7} steps")
@@ -0,0 +1,290 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, BinaryIO, Optional
+from collections.abc import Sequence
+from functools import cached_property
+from array import array
+import mmap
+import struct
+import sys
+
+from ASTNode import CompilationResult, strip_ansi_colour
+from Instructions import Instructions0Params as I0P, Instructions1Params as I1P, CODES, CODE
+from Image import Image, link, operand_numbers, bind_operands
+from Profiler import function_labels
+
+if TYPE_CHECKING:
+    from Instructions import Instructions
+
+
+# A bytecode file is a header, a table of sections and the sections, each
+# aligned to 8 bytes. All numbers are in the byte order of the writer, which
+# the header records.
+MAGIC = b"CMA\0"
+VERSION = 2
+HEADER = struct.Struct("<4sHHI")
+SECTION = struct.Struct("<4sQQ")
+BIG_ENDIAN = 1
+
+# Kinds of operands
+NONE, INT, STR = 0, 1, 2
+
+# Sections and the typecodes of their arrays:
+#   OPS   int32   opcode of every instruction, numbered like Instructions.CODES
+#   KIND  uint8   kind of the operand of every instruction
+#   ARG   int64   operand of every instruction, strings by their index
+#   STRO  int64   offsets of the strings in STRS, one more than strings
+#   STRS  bytes   the UTF-8 strings
+#   LABL  int64   pairs of label string and code address
+#   SYMB  int64   pairs of function name string and code address
+#   DBUG  int64   description string of every instruction (optional)
+#   IOPS, IWGT, IADR int32   ops, weights and addrs of the linked image
+#   IENT  int32   pairs of the entries of the linked image
+#   IAR1, IAR2 int64   the pre-resolved operands of the linked image as numbers
+TYPECODES = {
+    b"OPS ": "i", b"KIND": "B", b"ARG ": "q", b"STRO": "q", b"STRS": "B",
+    b"LABL": "q", b"SYMB": "q", b"DBUG": "q",
+    b"IOPS": "i", b"IWGT": "i", b"IADR": "i", b"IENT": "i", b"IAR1": "q", b"IAR2": "q",
+}
+
+
+def descriptions(result: CompilationResult) -> list[str]:
+    """The description of the innermost compilation result of every instruction"""
+    out = []
+    stack = [(result, iter(result.code))]
+    while stack:
+        (current, items) = stack[-1]
+        item = next(items, stack)
+        if item is stack:
+            stack.pop()
+        elif type(item) == CompilationResult:
+            stack.append((item, iter(item.code)))
+        else:
+            out.append(strip_ansi_colour(current.description))
+    return out
+
+
+def symbols(code: list[Instructions]) -> dict[str, int]:
+    """
+    Function names and the addresses calls jump to. A function starts at the
+    label of its name, which calls use; the labels inside it start with its
+    name and a dot
+    """
+    functions = function_labels(code)
+    table = {}
+    run = []
+    for i, instruction in enumerate(code):
+        if instruction.instruction == I1P.I.JUMP_TARGET:
+            run.append((instruction.param1, i))
+            continue
+        for (label, address) in run:
+            if label in functions:
+                table[label] = address
+        run = []
+    return table
+
+
+class Strings:
+    def __init__(self):
+        self.index: dict[str, int] = {}
+
+    def __call__(self, string: str) -> int:
+        if string not in self.index:
+            self.index[string] = len(self.index)
+        return self.index[string]
+
+    def sections(self) -> dict[bytes, array]:
+        data = [s.encode() for s in self.index]
+        offsets = array("q", [0])
+        for d in data:
+            offsets.append(offsets[-1] + len(d))
+        return {b"STRO": offsets, b"STRS": array("B", b"".join(data))}
+
+
+def write(file: BinaryIO, code: list[Instructions], result: Optional[CompilationResult] = None):
+    """
+    Writes the code, linked, to file. With the compilation result of the code
+    the file gets a debug section
+    """
+    strings = Strings()
+
+    kinds, args = array("B"), array("q")
+    for instruction in code:
+        param = instruction.param1 if isinstance(instruction, I1P) else None
+        if param is None:
+            (kind, arg) = (NONE, 0)
+        elif type(param) == int:
+            (kind, arg) = (INT, param)
+        elif type(param) == str:
+            (kind, arg) = (STR, strings(param))
+        else:
+            raise Exception(f"Cannot write operand {param!r}")
+        kinds.append(kind)
+        args.append(arg)
+
+    image = link(code)
+    (first, second) = operand_numbers(image)
+    sections = {
+        b"OPS ": array("i", [CODE[instruction.instruction] for instruction in code]),
+        b"KIND": kinds,
+        b"ARG ": args,
+        b"LABL": array("q", [x for (label, address) in image.labels.items() for x in (strings(label), address)]),
+        b"SYMB": array("q", [x for (name, address) in symbols(code).items() for x in (strings(name), address)]),
+        b"IOPS": array("i", image.ops),
+        b"IWGT": array("i", image.weights),
+        b"IADR": array("i", image.addrs),
+        b"IENT": array("i", [x for entry in image.entries for x in entry]),
+        b"IAR1": array("q", first),
+        b"IAR2": array("q", second),
+    }
+    if result is not None:
+        sections[b"DBUG"] = array("q", [strings(d) for d in descriptions(result)])
+    sections.update(strings.sections())
+
+    flags = BIG_ENDIAN if sys.byteorder == "big" else 0
+    file.write(HEADER.pack(MAGIC, VERSION, flags, len(sections)))
+    offset = HEADER.size + SECTION.size * len(sections)
+    table = []
+    for (name, data) in sections.items():
+        offset += -offset % 8
+        length = len(data) * data.itemsize
+        table.append((name, offset, length))
+        offset += length
+    for entry in table:
+        file.write(SECTION.pack(*entry))
+    for ((name, offset, length), data) in zip(table, sections.values()):
+        file.write(b"\0" * (offset - file.tell()))
+        data.tofile(file)
+
+
+class Code(Sequence):
+    """
+    The instructions of a bytecode file, each built from the sections when
+    it is first used. Only the reference interpreter and the debug paths use
+    the instructions, the image runs without them
+    """
+
+    def __init__(self, sections: dict[bytes, memoryview], strings: list[str]):
+        (self.ops, self.kinds, self.args) = (sections[b"OPS "], sections[b"KIND"], sections[b"ARG "])
+        self.strings = strings
+        self.instructions: list[Optional[Instructions]] = [None] * len(self.ops)
+
+    def __len__(self):
+        return len(self.instructions)
+
+    def __getitem__(self, i):
+        if type(i) == slice:
+            return [self[k] for k in range(*i.indices(len(self)))]
+        instruction = self.instructions[i]
+        if instruction is None:
+            (op, kind, arg) = (self.ops[i], self.kinds[i], self.args[i])
+            if kind == NONE:
+                instruction = I0P(CODES[op])
+            else:
+                instruction = I1P(CODES[op], self.strings[arg] if kind == STR else arg)
+            self.instructions[i] = instruction
+        return instruction
+
+
+class Bytecode:
+    """
+    A bytecode file mapped into memory. The sections are memoryviews of the
+    mapping. The image tables the interpreter loop indexes stay views of the
+    mapping; with copy=True they are copied into lists, which takes time on
+    loading but makes indexing them about twice as fast.
+
+    The operands of the image hold Python objects, which are built from the
+    numbers of the file on loading. The instructions and the debug
+    descriptions are only built where they are used
+    """
+
+    def __init__(self, file: BinaryIO, copy: bool = False):
+        self.mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.mapping)
+
+        (magic, version, flags, count) = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise Exception("Not a CMa bytecode file")
+        if version != VERSION:
+            raise Exception(f"Unsupported bytecode version {version}")
+        if flags & BIG_ENDIAN != (sys.byteorder == "big"):
+            raise Exception("Bytecode file of another byte order")
+
+        self.sections: dict[bytes, memoryview] = {}
+        for k in range(count):
+            (name, offset, length) = SECTION.unpack_from(
+                view, HEADER.size + k * SECTION.size)
+            self.sections[name] = view[offset:offset + length].cast(TYPECODES[name])
+
+        s = self.sections
+        data = s[b"STRS"]
+        offsets = s[b"STRO"]
+        self.strings = [bytes(data[offsets[k]:offsets[k + 1]]).decode()
+                        for k in range(len(offsets) - 1)]
+
+        self.code = Code(s, self.strings)
+        self.labels = self.table(b"LABL")
+        self.symbols = self.table(b"SYMB")
+
+        entries = s[b"IENT"].tolist()
+        entries = list(zip(entries[0::2], entries[1::2]))
+        (ops, weights, addrs) = (s[b"IOPS"], s[b"IWGT"], s[b"IADR"])
+        if copy:
+            (ops, weights, addrs) = (ops.tolist(), weights.tolist(), addrs.tolist())
+        args = bind_operands(ops.tolist() if not copy else ops, s[b"IAR1"].tolist(), s[b"IAR2"].tolist(), entries)
+        self.image = Image(ops, args, weights, addrs, entries, self.labels)
+
+    @cached_property
+    def debug(self) -> Optional[list[str]]:
+        """The description of every instruction, if the file has them"""
+        s = self.sections
+        return [self.strings[d] for d in s[b"DBUG"].tolist()] if b"DBUG" in s else None
+
+    def table(self, name: bytes) -> dict[str, int]:
+        pairs = self.sections[name]
+        return {self.strings[pairs[k]]: pairs[k + 1] for k in range(0, len(pairs), 2)}
+
+
+def load(path: str, copy: bool = False) -> Bytecode:
+    with open(path, "rb") as f:
+        return Bytecode(f, copy)
+
+
+if __name__ == '__main__':
+    from time import perf_counter
+    import os
+    import tempfile
+
+    from Nodes import *
+    from Interpreter import Interpreter
+    from Output import ListSink
+
+    # a long generated straight line program
+    statements = [Assignment(Variable("int", "x"), Number(0))]
+    for k in range(5000):
+        statements.append(Assignment(Variable("int", "x"), BinaryOperation(
+            Variable("int", "x"), I0P.I.ADD, Number(k))))
+    statements.append(Return(Variable("int", "x")))
+    program = Program([], [FunctionDefinition("int", "main", [],
+                                              DeclareVariable("int", 1, 1, "x", StatementSequence(*statements)))])
+
+    start = perf_counter()
+    result = program.code({}, 0)
+    code = result.to_code()
+    s = Interpreter(code, output=ListSink())
+    compiled = perf_counter() - start
+
+    path = os.path.join(tempfile.mkdtemp(), "program.cma")
+    with open(path, "wb") as f:
+        write(f, code, result)
+
+    start = perf_counter()
+    bytecode = load(path)
+    t = Interpreter(bytecode.code, output=ListSink(), image=bytecode.image)
+    loaded = perf_counter() - start
+
+    print(f"{len(code)} instructions, {os.path.getsize(path)} bytes")
+    print(f"compile and link: {compiled:.4f}s, load: {loaded:.4f}s")
+    s.run_image()
+    t.run_image()
+    print(f"exit codes: {s.stack[0]} {t.stack[0]}")
+    print(f"symbols: {bytecode.symbols}, debug: {bytecode.debug[:3]}")
@@ -0,0 +1,98 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Iterator, Optional
+from contextlib import contextmanager
+
+if TYPE_CHECKING:
+    from Nodes import DeclareVariable
+
+
+# Sizes of the types every program knows; pointers and functions take one cell
+BASE_SIZES = {"int": 1, "void": 1}
+
+_UNBOUND = object()
+
+
+class Context:
+    """
+    What the compilation of a program knows at a point of it: the addresses
+    of the visible names and the sizes and struct layouts of the types.
+
+    Names are bound for the code compiled inside a bind block and unbound
+    when it ends, uncovering the bindings they shadowed, so binding and
+    looking up a name take constant time however many declarations enclose
+    it. The type tables belong to the one compilation.
+    """
+
+    def __init__(self, names: dict[str, tuple] = None, prefix: str = ""):
+        # name -> (kind, address, array size) of variables, (kind, label) of functions
+        self.names: dict[str, tuple] = dict(names) if names is not None else {}
+        self.sizes: dict[str, int] = dict(BASE_SIZES)
+        # struct type -> member -> (type, offset, array size)
+        self.structs: dict[str, dict[str, tuple[str, int, int]]] = {}
+        # prefix and number of the labels generated so far
+        self.prefix = prefix
+        self.labels = 0
+        # the names looked up, which the code depends on
+        self.used: set[str] = set()
+        # id of a statement -> whether it always returns, see always_returns
+        self.returns: dict[int, bool] = {}
+        # size of the parameters of the function compiled, which calls in
+        # tail position must match; None outside of functions
+        self.parameters: Optional[int] = None
+
+    def __getitem__(self, name: str) -> tuple:
+        self.used.add(name)
+        return self.names[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.names
+
+    def __setitem__(self, name: str, value: tuple):
+        """Binds name for the rest of the compilation"""
+        self.names[name] = value
+
+    @contextmanager
+    def bind(self, *bindings: tuple[str, tuple]) -> Iterator[Context]:
+        """Binds the (name, value) pairs until the block ends"""
+        names = self.names
+        shadowed = [(name, names.get(name, _UNBOUND)) for (name, _) in bindings]
+        names.update(bindings)
+        try:
+            yield self
+        finally:
+            for (name, value) in reversed(shadowed):
+                if value is _UNBOUND:
+                    names.pop(name, None)
+                else:
+                    names[name] = value
+
+    def unit(self, name: str) -> Context:
+        """
+        A context to compile the unit name, a function, on its own: it knows
+        the names and types known here, and its labels start with the name
+        """
+        context = Context(prefix=f"{name}.")
+        # bind leaves the names as it found them, so units can share them
+        context.names = self.names
+        context.sizes = dict(self.sizes)
+        context.structs = dict(self.structs)
+        return context
+
+    def size(self, type: str) -> int:
+        if type in self.sizes:
+            return self.sizes[type]
+        if type.endswith("*") or "(" in type:
+            return 1
+        raise Exception(f"Unknown type {type}")
+
+    def declare_struct(self, type: str, body: list[DeclareVariable]) -> int:
+        """Records the layout of the struct type with the members body, returns its size"""
+        layout = {}
+        offset = 0
+        for variable in body:
+            layout[variable.name] = (variable.type, offset, variable.arraySize)
+            offset += variable.typeSize * variable.arraySize
+            self.sizes[variable.type] = variable.typeSize
+        self.structs[type] = layout
+        self.sizes[type] = offset
+        return offset
@@ -0,0 +1,543 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+from Instructions import Instructions0Params as I0P, Instructions1Params as I1P
+
+if TYPE_CHECKING:
+    from Instructions import Instructions
+    from Interpreter import Stack
+
+
+# Integer opcodes of the linked image. JUMP_TARGET is a pseudo-op and never
+# makes it into an image.
+OPCODES = [*I0P.I, *[i for i in I1P.I if i != I1P.I.JUMP_TARGET]]
+OPCODE = {instruction: op for op, instruction in enumerate(OPCODES)}
+
+# Instructions that never continue with the next instruction
+NO_FALLTHROUGH = {I1P.I.JUMP, I0P.I.CALL, I0P.I.RETURN,
+                  I0P.I.HALT, I1P.I.TAILCALL, I1P.I.CALLF}
+
+
+class Image:
+    """
+    A linked, flat CMa program.
+
+    Instruction i of the image is the opcode ops[i] with the pre-resolved
+    operand args[i]. Code addresses that live on the stack (return addresses,
+    function pointers) keep the numbering of the unlinked code, so the stack
+    looks exactly like it does in the reference interpreter.
+
+    The removed JUMP_TARGET pseudo-ops are still accounted for in the step
+    count: weights[i] are the steps charged for executing instruction i and
+    falling through, entries[a] maps an unlinked address a to the linked
+    instruction and the number of JUMP_TARGETs executed when jumping there.
+
+    Returning to the sentinel address jumps past the end of the image, which
+    stops an interpreter loop without halting the program.
+    """
+
+    def __init__(self, ops: list[int], args: list, weights: list[int], addrs: list[int], entries: list[tuple[int, int]], labels: dict[str, int]):
+        self.ops = ops
+        self.args = args
+        self.weights = weights
+        self.addrs = addrs
+        self.entries = entries
+        self.labels = labels
+        self.sentinel = len(entries) - 1
+
+    def __len__(self):
+        return len(self.ops)
+
+    def __repr__(self):
+        return "\n".join(f"{pc: >5}: {OPCODES[op].name} {'' if arg is None else arg}" for pc, (op, arg) in enumerate(zip(self.ops, self.args)))
+
+
+def link(code: list[Instructions]) -> Image:
+    """
+    Turns the output of CompilationResult.to_code() into an Image
+    """
+    return extend(Image([], [], [], [], [(0, 0), (1, 0)], {}), code)
+
+
+def extend(image: Image, code: list[Instructions]) -> Image:
+    """
+    Links the instructions appended to the code of image onto its end, in
+    place. Only the new instructions are linked, and those of the old ones
+    which depend on where the code ends: the last one, the HALTs and, if the
+    code ended with labels, the jumps to them
+    """
+    (labels, entries, addrs) = (image.labels, image.entries, image.addrs)
+    end = len(entries) - 2
+    old = len(addrs)
+
+    # the entries of the end and the sentinel move behind the new code; the
+    # list stays the same, the operands of calls and returns hold it
+    del entries[end:]
+    entries.extend([None] * (len(code) - end + 2))
+    start = addrs[-1] + 1 if addrs else 0
+    trailing = {code[j].param1 for j in range(start, end)}
+    run = []
+    for i in range(start, len(code)):
+        instruction = code[i]
+        if instruction.instruction == I1P.I.JUMP_TARGET:
+            labels[instruction.param1] = i
+            run.append(i)
+            continue
+        for j in run:
+            entries[j] = (len(addrs), i - j)
+        run = []
+        entries[i] = (len(addrs), 0)
+        addrs.append(i)
+    for j in run:
+        entries[j] = (len(addrs), len(code) - j)
+    entries[len(code)] = (len(addrs), 0)
+    entries[len(code) + 1] = (len(addrs) + 1, 0)
+    image.sentinel = len(code) + 1
+
+    image.ops.extend(OPCODE[code[i].instruction] for i in addrs[old:])
+    image.weights.extend(weight(code, addrs, entries, labels, pc) for pc in range(old, len(addrs)))
+    image.args.extend(operands(code, image.ops[old:], addrs[old:], entries, labels))
+
+    halts = []
+    pc = 0
+    while True:
+        try:
+            pc = image.ops.index(_HALT, pc, old)
+        except ValueError:
+            break
+        halts.append(pc)
+        pc += 1
+    jumps = [pc for pc in range(old) if getattr(code[addrs[pc]], "param1", None) in trailing] if trailing else []
+    relink(image, code, [*halts, *jumps, *([old - 1] if old else [])])
+    return image
+
+
+def relink(image: Image, code: list[Instructions], pcs: list[int]):
+    """
+    Links the instructions pcs of image again, after the code at their
+    addresses was replaced by instructions of the same length or labels
+    they use moved
+    """
+    (labels, entries, addrs) = (image.labels, image.entries, image.addrs)
+    for pc in pcs:
+        image.ops[pc] = OPCODE[code[addrs[pc]].instruction]
+        image.weights[pc] = weight(code, addrs, entries, labels, pc)
+        (image.args[pc],) = operands(code, image.ops[pc:pc + 1], addrs[pc:pc + 2], entries, labels)
+
+
+def weight(code: list[Instructions], addrs: list[int], entries: list[tuple[int, int]], labels: dict[str, int], pc: int) -> int:
+    """The steps charged for executing instruction pc of the image and falling through"""
+    i = addrs[pc]
+    instruction = code[i]
+    op = instruction.instruction
+    following = (addrs[pc + 1] if pc + 1 < len(addrs) else len(code)) - i - 1
+
+    weight = 1 if op in NO_FALLTHROUGH else 1 + following
+    if op in (I1P.I.JUMP, I1P.I.CALLF):
+        (_, skip) = entries[address(labels, instruction.param1)]
+        weight += skip
+    return weight
+
+
+def address(labels: dict[str, int], param):
+    return labels[param] if type(param) == str else param
+
+
+_JUMP, _JUMPZ, _JUMPNZ, _CALL, _CALLF, _RETURN, _TAILCALL, _HALT = (OPCODE[i] for i in (
+    I1P.I.JUMP, I1P.I.JUMPZ, I1P.I.JUMPNZ, I0P.I.CALL, I1P.I.CALLF, I0P.I.RETURN, I1P.I.TAILCALL, I0P.I.HALT))
+_OPERAND = [isinstance(instruction, I1P.I) for instruction in OPCODES]
+
+
+def operands(code: list[Instructions], ops: list[int], addrs: list[int], entries: list[tuple[int, int]], labels: dict[str, int]) -> list:
+    """
+    The pre-resolved operands of the image instructions ops at the unlinked
+    addresses addrs
+    """
+    args = []
+    for pc, (op, i) in enumerate(zip(ops, addrs)):
+        if op == _JUMP:
+            (arg, _) = entries[address(labels, code[i].param1)]
+        elif op == _JUMPZ or op == _JUMPNZ:
+            following = (addrs[pc + 1] if pc + 1 < len(addrs) else len(code)) - i - 1
+            (target, skip) = entries[address(labels, code[i].param1)]
+            arg = (target, skip - following)
+        elif op == _CALL:
+            arg = (i + 1, entries)
+        elif op == _CALLF:
+            (target, _) = entries[address(labels, code[i].param1)]
+            arg = (i + 1, target)
+        elif op == _RETURN:
+            arg = entries
+        elif op == _TAILCALL:
+            arg = (code[i].param1, entries)
+        elif op == _HALT:
+            # past the end of the image
+            (arg, _) = entries[len(code)]
+        elif _OPERAND[op]:
+            arg = address(labels, code[i].param1)
+        else:
+            arg = None
+
+        args.append(arg)
+    return args
+
+
+def operand_numbers(image: Image) -> tuple[list[int], list[int]]:
+    """
+    The pre-resolved operands of image as two numbers per instruction, from
+    which bind_operands builds them again without the code. The entries the
+    operands of calls and returns hold are left out
+    """
+    (first, second) = ([], [])
+    entries = image.entries
+    for arg in image.args:
+        if type(arg) == tuple:
+            first.append(arg[0])
+            second.append(0 if arg[1] is entries else arg[1])
+        else:
+            first.append(0 if arg is None or arg is entries else arg)
+            second.append(0)
+    return (first, second)
+
+
+def bind_operands(ops, first: list[int], second: list[int], entries: list[tuple[int, int]]) -> list:
+    """The operands of the image instructions ops from the numbers operand_numbers gives"""
+    args = []
+    append = args.append
+    for (op, a, b) in zip(ops, first, second):
+        if op == _CALL or op == _TAILCALL:
+            append((a, entries))
+        elif op == _JUMPZ or op == _JUMPNZ or op == _CALLF:
+            append((a, b))
+        elif op == _RETURN:
+            append(entries)
+        elif _OPERAND[op] or op == _HALT:
+            append(a)
+        else:
+            append(None)
+    return args
+
+
+# Handlers of the image interpreter. Each handler gets the stack, its cells,
+# the pre-resolved operand and the address of the next instruction, and
+# returns the address of the instruction to execute next.
+
+def _add(S: Stack, M, arg, pc):
+    sp = S.SP - 1
+    M[sp] = M[sp] + M[sp + 1]
+    S.SP = sp
+    return pc
+
+
+def _sub(S: Stack, M, arg, pc):
+    sp = S.SP - 1
+    M[sp] = M[sp] - M[sp + 1]
+    S.SP = sp
+    return pc
+
+
+def _mul(S: Stack, M, arg, pc):
+    sp = S.SP - 1
+    M[sp] = M[sp] * M[sp + 1]
+    S.SP = sp
+    return pc
+
+
+def _div(S: Stack, M, arg, pc):
+    sp = S.SP - 1
+    M[sp] = M[sp] // M[sp + 1]
+    S.SP = sp
+    return pc
+
+
+def _leq(S: Stack, M, arg, pc):
+    sp = S.SP - 1
+    M[sp] = 1 if M[sp] <= M[sp + 1] else 0
+    S.SP = sp
+    return pc
+
+
+def _geq(S: Stack, M, arg, pc):
+    sp = S.SP - 1
+    M[sp] = 1 if M[sp] >= M[sp + 1] else 0
+    S.SP = sp
+    return pc
+
+
+def _lt(S: Stack, M, arg, pc):
+    sp = S.SP - 1
+    M[sp] = 1 if M[sp] < M[sp + 1] else 0
+    S.SP = sp
+    return pc
+
+
+def _gt(S: Stack, M, arg, pc):
+    sp = S.SP - 1
+    M[sp] = 1 if M[sp] > M[sp + 1] else 0
+    S.SP = sp
+    return pc
+
+
+def _eq(S: Stack, M, arg, pc):
+    sp = S.SP - 1
+    M[sp] = 1 if M[sp] == M[sp + 1] else 0
+    S.SP = sp
+    return pc
+
+
+def _neg(S: Stack, M, arg, pc):
+    M[S.SP] = -M[S.SP]
+    return pc
+
+
+def _not(S: Stack, M, arg, pc):
+    M[S.SP] = 1 if M[S.SP] == 0 else 0
+    return pc
+
+
+def _load(S: Stack, M, arg, pc):
+    sp = S.SP
+    a = M[sp]
+    if a < 0:
+        raise Exception(f"Access of address {a} outside of memory")
+    M[sp] = M[a]
+    return pc
+
+
+def _store(S: Stack, M, arg, pc):
+    sp = S.SP
+    a = M[sp]
+    if a < 0:
+        raise Exception(f"Access of address {a} outside of memory")
+    M[a] = M[sp - 1]
+    S.SP = sp - 1
+    return pc
+
+
+def _pop(S: Stack, M, arg, pc):
+    S.SP -= 1
+    return pc
+
+
+def _print(S: Stack, M, arg, pc):
+    S.output.write(f">> {M[S.SP]}")
+    return pc
+
+
+def _new(S: Stack, M, arg, pc):
+    sp = S.SP
+    (M[sp], S.NP) = S.heap.alloc(M[sp], S.NP, S.EP)
+    return pc
+
+
+def _free(S: Stack, M, arg, pc):
+    sp = S.SP
+    S.NP = S.heap.release(M[sp], S.NP)
+    S.SP = sp - 1
+    return pc
+
+
+def _mark(S: Stack, M, arg, pc):
+    sp = S.SP
+    M[sp + 1] = S.EP
+    M[sp + 2] = S.FP
+    S.SP = sp + 2
+    return pc
+
+
+def _call(S: Stack, M, arg, pc):
+    (ret, entries) = arg
+    sp = S.SP
+    (pc, skip) = entries[M[sp]]
+    M[sp] = ret
+    S.FP = sp
+    S.extra += skip
+    return pc
+
+
+def _return(S: Stack, M, arg, pc):
+    fp = S.FP
+    (pc, skip) = arg[M[fp]]
+    S.EP = M[fp - 2]
+    if (S.EP >= S.NP):
+        raise Exception("Stack overflow")
+    S.SP = fp - 3
+    S.FP = M[fp - 1]
+    S.extra += skip
+    return pc
+
+
+def _halt(S: Stack, M, arg, pc):
+    return arg
+
+
+def _loadc(S: Stack, M, arg, pc):
+    sp = S.SP + 1
+    M[sp] = arg
+    S.SP = sp
+    return pc
+
+
+def _loadrc(S: Stack, M, arg, pc):
+    sp = S.SP + 1
+    M[sp] = S.FP + arg
+    S.SP = sp
+    return pc
+
+
+def _jump(S: Stack, M, arg, pc):
+    return arg
+
+
+def _jumpz(S: Stack, M, arg, pc):
+    sp = S.SP
+    S.SP = sp - 1
+    if M[sp] == 0:
+        S.extra += arg[1]
+        return arg[0]
+    return pc
+
+
+def _jumpnz(S: Stack, M, arg, pc):
+    sp = S.SP
+    S.SP = sp - 1
+    if M[sp] != 0:
+        S.extra += arg[1]
+        return arg[0]
+    return pc
+
+
+def _alloc(S: Stack, M, arg, pc):
+    S.SP += arg
+    return pc
+
+
+def _enter(S: Stack, M, arg, pc):
+    S.EP = S.SP + arg
+    if S.EP >= S.NP:
+        raise Exception("Stack overflow")
+    return pc
+
+
+def _slide(S: Stack, M, arg, pc):
+    sp = S.SP
+    tmp = M[sp]
+    sp -= arg
+    M[sp] = tmp
+    S.SP = sp
+    return pc
+
+
+def _tailcall(S: Stack, M, arg, pc):
+    (m, entries) = arg
+    sp = S.SP
+    fp = S.FP
+    (pc, skip) = entries[M[sp]]
+    M[fp - 2 - m:fp - 2] = M[sp - m:sp]
+    S.SP = fp
+    S.extra += skip
+    return pc
+
+
+def _loadr(S: Stack, M, arg, pc):
+    sp = S.SP + 1
+    M[sp] = M[S.FP + arg]
+    S.SP = sp
+    return pc
+
+
+def _storer(S: Stack, M, arg, pc):
+    sp = S.SP
+    M[S.FP + arg] = M[sp]
+    S.SP = sp - 1
+    return pc
+
+
+def _addc(S: Stack, M, arg, pc):
+    M[S.SP] += arg
+    return pc
+
+
+def _callf(S: Stack, M, arg, pc):
+    (ret, pc) = arg
+    sp = S.SP
+    M[sp + 1] = S.EP
+    M[sp + 2] = S.FP
+    sp += 3
+    M[sp] = ret
+    S.SP = S.FP = sp
+    return pc
+
+
+def _loadk(S: Stack, M, arg, pc):
+    sp = S.SP
+    a = M[sp]
+    if not 0 <= a <= len(M) - arg:
+        raise Exception(f"Access of address {a} outside of memory")
+    M[sp:sp + arg] = M[a:a + arg]
+    S.SP = sp + arg - 1
+    return pc
+
+
+def _storek(S: Stack, M, arg, pc):
+    sp = S.SP
+    a = M[sp]
+    if not 0 <= a <= len(M) - arg:
+        raise Exception(f"Access of address {a} outside of memory")
+    M[a:a + arg] = M[sp - arg:sp]
+    S.SP = sp - 1
+    return pc
+
+
+def _move(S: Stack, M, arg, pc):
+    sp = S.SP
+    (a, b) = (M[sp - 1], M[sp])
+    for c in (a, b):
+        if not 0 <= c <= len(M) - arg:
+            raise Exception(f"Access of address {c} outside of memory")
+    M[b:b + arg] = M[a:a + arg]
+    S.SP = sp - 2
+    return pc
+
+
+HANDLER = {
+    I0P.I.ADD: _add,
+    I0P.I.SUB: _sub,
+    I0P.I.MUL: _mul,
+    I0P.I.DIV: _div,
+    I0P.I.LEQ: _leq,
+    I0P.I.GEQ: _geq,
+    I0P.I.LT: _lt,
+    I0P.I.GT: _gt,
+    I0P.I.EQ: _eq,
+    I0P.I.NEG: _neg,
+    I0P.I.NOT: _not,
+    I0P.I.LOAD: _load,
+    I0P.I.STORE: _store,
+    I0P.I.POP: _pop,
+    I0P.I.PRINT: _print,
+    I0P.I.NEW: _new,
+    I0P.I.FREE: _free,
+    I0P.I.MARK: _mark,
+    I0P.I.CALL: _call,
+    I0P.I.RETURN: _return,
+    I0P.I.HALT: _halt,
+    I1P.I.LOADC: _loadc,
+    I1P.I.LOADRC: _loadrc,
+    I1P.I.JUMP: _jump,
+    I1P.I.JUMPZ: _jumpz,
+    I1P.I.ALLOC: _alloc,
+    I1P.I.ENTER: _enter,
+    I1P.I.SLIDE: _slide,
+    I1P.I.TAILCALL: _tailcall,
+    I1P.I.LOADR: _loadr,
+    I1P.I.STORER: _storer,
+    I1P.I.ADDC: _addc,
+    I1P.I.CALLF: _callf,
+    I1P.I.LOADK: _loadk,
+    I1P.I.STOREK: _storek,
+    I1P.I.MOVE: _move,
+    I1P.I.JUMPNZ: _jumpnz,
+}
+
+HANDLERS = [HANDLER[instruction] for instruction in OPCODES]
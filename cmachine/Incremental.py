@@ -0,0 +1,212 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Iterable, Optional
+import hashlib
+import pickle
+
+from Image import Image, link, extend, relink
+
+if TYPE_CHECKING:
+    from Instructions import Instructions
+    from Nodes import Program, FunctionDefinition
+
+
+class Fragment:
+    """
+    The code of a function compiled on its own, with the bindings of the
+    names its compilation looked up and where the code is linked
+    """
+
+    def __init__(self, name: str, code: list[Instructions], names: dict[str, Optional[tuple]]):
+        self.name = name
+        self.code = code
+        self.names = names
+        # first code address, None while not linked
+        self.start: Optional[int] = None
+        # image instructions using labels of other functions, with the labels
+        self.uses: list[tuple[int, str]] = []
+
+    def place(self, image: Image, code: list[Instructions], start: int):
+        """Records where the fragment was linked, at code address start"""
+        self.start = start
+        pc = image.entries[start][0]
+        local = f"{self.name}."
+        self.uses = []
+        for k in range(pc, pc + len(self.code)):
+            if k == len(image.addrs) or image.addrs[k] >= start + len(self.code):
+                break
+            param = getattr(code[image.addrs[k]], "param1", None)
+            if type(param) == str and not param.startswith(local):
+                self.uses.append((k, param))
+
+
+class IncrementalCompiler:
+    """
+    Compiles versions of a program, compiling and linking again only the
+    functions that changed since the last version.
+
+    The compiled functions are kept as fragments, keyed by a hash of their
+    AST and of the types of the program. A fragment is reused as long as
+    the names its compilation looked up, e.g. global variables, bind to the
+    same addresses. The code of a changed function is appended to the code
+    and linked onto the image, where the instructions using its label are
+    patched; its old code stays behind unused. Once the unused code
+    outweighs the rest, the program is laid out and linked anew.
+
+    The code and the image are updated in place, so interpreters of the
+    previous version must not run while compiling the next one.
+    """
+
+    def __init__(self):
+        self.fragments: dict[str, Fragment] = {}
+        self.code: list[Instructions] = []
+        self.image: Optional[Image] = None
+        self.linked: dict[str, Fragment] = {}
+        self.dead = 0
+        # the functions the last version compiled and linked
+        self.compiled: list[str] = []
+        # id(function) -> (function, hash of its AST); the function is kept
+        # so that its id cannot be reused by a later one
+        self.hashes: dict[int, tuple[FunctionDefinition, str]] = {}
+        # the bindings of the names of the last version, and the keys of the
+        # fragments whose compilation looked each name up
+        self.names: dict[str, tuple] = {}
+        self.lookups: dict[str, set[str]] = {}
+        # labels -> the fragments whose code uses them, as placed
+        self.callers: dict[str, list[Fragment]] = {}
+
+    def compile(self, program: Program, changed: Optional[Iterable[str]] = None) -> tuple[list[Instructions], Image]:
+        """
+        Compiles and links the version program of the program. If changed
+        names the functions edited in place since the last version, only
+        those and the functions not compiled before are hashed again;
+        otherwise every function is
+        """
+        (addressSpace, size_of_globals) = program.context({}, 0)
+        prologue = program.prologue(size_of_globals)
+        types = hashlib.sha256(pickle.dumps((addressSpace.sizes, addressSpace.structs))).hexdigest()
+
+        changed = None if changed is None else set(changed)
+        # the fragments looking up names which are bound differently now
+        rebound = set()
+        if addressSpace.names != self.names:
+            for name in self.names.keys() | addressSpace.names.keys():
+                if self.names.get(name) != addressSpace.names.get(name):
+                    rebound |= self.lookups.pop(name, set())
+        self.names = dict(addressSpace.names)
+
+        fragments = {}
+        hashes = {}
+        new = []
+        self.compiled = []
+        for function in program.functions:
+            (stored, digest) = self.hashes.get(id(function), (None, None))
+            if stored is not function or changed is None or function.name in changed:
+                digest = hashlib.sha256(pickle.dumps(function)).hexdigest()
+            hashes[id(function)] = (function, digest)
+            key = types + digest
+            fragment = self.fragments.get(key)
+            if fragment is None or key in rebound:
+                unit = addressSpace.unit(function.name)
+                code = function.code(unit, 0).to_code()
+                fragment = Fragment(function.name, code, {name: addressSpace.names.get(name) for name in unit.used})
+                for name in fragment.names:
+                    self.lookups.setdefault(name, set()).add(key)
+                self.compiled.append(function.name)
+                new.append(fragment)
+            fragments[key] = fragment
+        self.fragments = fragments
+        self.hashes = hashes
+        linked = {fragment.name: fragment for fragment in fragments.values()}
+
+        if self.image is None:
+            self.layout(prologue, linked)
+        else:
+            self.relink(prologue, linked, new)
+        return (self.code, self.image)
+
+    def place(self, fragment: Fragment, start: int):
+        fragment.place(self.image, self.code, start)
+        for (_, label) in fragment.uses:
+            self.callers.setdefault(label, []).append(fragment)
+
+    def layout(self, prologue: list[Instructions], linked: dict[str, Fragment]):
+        """Links the program anew, the functions in order after the prologue"""
+        self.code = [*prologue]
+        starts = []
+        for fragment in linked.values():
+            starts.append(len(self.code))
+            self.code += fragment.code
+        self.image = link(self.code)
+        self.callers = {}
+        for (fragment, start) in zip(linked.values(), starts):
+            self.place(fragment, start)
+        self.linked = linked
+        self.dead = 0
+
+    def relink(self, prologue: list[Instructions], linked: dict[str, Fragment], new: list[Fragment]):
+        """
+        Links the new fragments onto the image and patches the uses of their
+        labels, or lays the program out anew if the unused code would
+        outweigh the rest
+        """
+        image = self.image
+        removed = self.linked.keys() - linked.keys()
+        moved = {fragment.name for fragment in new}
+
+        dead = self.dead + sum(len(self.linked[name].code) for name in removed | moved if name in self.linked)
+        added = sum(len(linked[name].code) for name in moved)
+        if dead > len(self.code) + added - dead:
+            self.layout(prologue, linked)
+            return
+        self.dead = dead
+        for name in removed:
+            del image.labels[name]
+
+        starts = []
+        for fragment in new:
+            starts.append(len(self.code))
+            self.code += fragment.code
+        extend(image, self.code)
+        for (fragment, start) in zip(new, starts):
+            self.place(fragment, start)
+
+        # the prologue never has labels, its instructions are the first ones
+        self.code[:len(prologue)] = prologue
+        pcs = list(range(len(prologue)))
+        for label in moved:
+            # the callers as placed, of which only those still linked unmoved
+            callers = self.callers.get(label, [])
+            self.callers[label] = [fragment for fragment in callers if linked.get(fragment.name) is fragment]
+            for fragment in self.callers[label]:
+                if fragment.name not in moved:
+                    pcs += [pc for (pc, used) in fragment.uses if used == label]
+        relink(image, self.code, pcs)
+        self.linked = linked
+
+
+if __name__ == '__main__':
+    from Parser import parse
+    from Interpreter import Interpreter
+
+    source = """
+int scale;
+int square(int x) { return x * x; }
+int sum(int n) {
+    int i;
+    int s;
+    s = 0;
+    for (i = 1; i <= n; i = i + 1) s = s + square(i);
+    return s;
+}
+int main() { scale = 2; return scale * sum(10); }
+"""
+    compiler = IncrementalCompiler()
+    versions = [source,
+                source.replace("return x * x;", "return x * x * x;"),
+                source.replace("scale * sum(10)", "scale * sum(5)"),
+                "int offset;\n" + source]
+    for version in versions:
+        (code, image) = compiler.compile(parse(version))
+        interpreter = Interpreter(code, image=image)
+        interpreter.run()
+        print(f"{interpreter.stack.stack[0]:>6} compiled {compiler.compiled}")
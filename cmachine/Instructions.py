@@ -49,13 +49,14 @@ class Instructions0Params(Instructions):
         LT = "<"
         GT = ">"
         EQ = "=="
-        NEG = "-"
+        NEG = "neg"
         NOT = "!"
         LOAD = "load"
         STORE = "store"
         POP = "pop"
         PRINT = "print"
         NEW = "new"
+        FREE = "free"
         MARK = "mark"
         CALL = "call"
         RETURN = "return"
@@ -101,20 +102,25 @@ class Instructions0Params(Instructions):
         elif self.instruction == Instructions0Params.I.NOT:
             S[S.SP] = 1 if S[S.SP] == 0 else 0
         elif self.instruction == Instructions0Params.I.PRINT:
-            print(">>", S[S.SP])
+            S.output.write(f">> {S[S.SP]}")
         elif self.instruction == Instructions0Params.I.LOAD:
-            S[S.SP] = S[S[S.SP]]
+            a = S[S.SP]
+            if a < 0:
+                raise Exception(f"Access of address {a} outside of memory")
+            S[S.SP] = S[a]
         elif self.instruction == Instructions0Params.I.STORE:
-            S[S[S.SP]] = S[S.SP-1]
+            a = S[S.SP]
+            if a < 0:
+                raise Exception(f"Access of address {a} outside of memory")
+            S[a] = S[S.SP-1]
             S.SP -= 1
         elif self.instruction == Instructions0Params.I.POP:
             S.SP -= 1
         elif self.instruction == Instructions0Params.I.NEW:
-            if (S.NP - S[S.SP] <= S.EP):
-                S[S.SP] = 0
-            else:
-                S.NP -= S[S.SP]
-                S[S.SP] = S.NP
+            (S[S.SP], S.NP) = S.heap.alloc(S[S.SP], S.NP, S.EP)
+        elif self.instruction == Instructions0Params.I.FREE:
+            S.NP = S.heap.release(S[S.SP], S.NP)
+            S.SP -= 1
         elif self.instruction == Instructions0Params.I.MARK:
             S[S.SP+1] = S.EP
             S[S.SP+2] = S.FP
@@ -169,6 +175,8 @@ class Instructions0Params(Instructions):
             return "Prints the topmost element of the stack"
         elif self.instruction == Instructions0Params.I.NEW:
             return "Allocates a new memory block of the size given by the topmost element of the stack. Returns the address of the block"
+        elif self.instruction == Instructions0Params.I.FREE:
+            return "Frees the memory block whose address is the topmost element of the stack and pops it"
         elif self.instruction == Instructions0Params.I.MARK:
             return "Saves FP and EP on the stack. This is used to mark the beginning of a new stack frame"
         elif self.instruction == Instructions0Params.I.CALL:
@@ -192,6 +200,18 @@ class Instructions1Params(Instructions):
         ALLOC = "ALLOC"
         ENTER = "ENTER"
         SLIDE = "SLIDE"
+        TAILCALL = "TAILCALL"
+        # superinstructions, see Peephole.py
+        LOADR = "LOADR"
+        STORER = "STORER"
+        ADDC = "ADDC"
+        CALLF = "CALLF"
+        # copies of param1 cells, for structs
+        LOADK = "LOADK"
+        STOREK = "STOREK"
+        MOVE = "MOVE"
+        # the test at the bottom of loops
+        JUMPNZ = "JUMPNZ"
 
     def __init__(self, instruction: I, param1):
         self.instruction = instruction
@@ -230,6 +250,51 @@ class Instructions1Params(Instructions):
             tmp = S[S.SP]
             S.SP -= self.param1
             S[S.SP] = tmp
+        elif self.instruction == Instructions1Params.I.TAILCALL:
+            tmp = S[S.SP]
+            S.SP -= 1
+            for i in range(self.param1):
+                S[S.FP - 2 - self.param1 + i] = S[S.SP - self.param1 + 1 + i]
+            S.SP = S.FP
+            state.PC = tmp
+        elif self.instruction == Instructions1Params.I.LOADR:
+            S.SP += 1
+            S[S.SP] = S[S.FP + self.param1]
+        elif self.instruction == Instructions1Params.I.STORER:
+            S[S.FP + self.param1] = S[S.SP]
+            S.SP -= 1
+        elif self.instruction == Instructions1Params.I.ADDC:
+            S[S.SP] = S[S.SP] + self.param1
+        elif self.instruction == Instructions1Params.I.CALLF:
+            S[S.SP+1] = S.EP
+            S[S.SP+2] = S.FP
+            S[S.SP+3] = state.PC
+            S.SP += 3
+            S.FP = S.SP
+            state.PC = self.param1
+        elif self.instruction == Instructions1Params.I.LOADK:
+            a = S[S.SP]
+            if not 0 <= a <= len(S.stack) - self.param1:
+                raise Exception(f"Access of address {a} outside of memory")
+            S.stack[S.SP:S.SP + self.param1] = S.stack[a:a + self.param1]
+            S.SP += self.param1 - 1
+        elif self.instruction == Instructions1Params.I.STOREK:
+            a = S[S.SP]
+            if not 0 <= a <= len(S.stack) - self.param1:
+                raise Exception(f"Access of address {a} outside of memory")
+            S.stack[a:a + self.param1] = S.stack[S.SP - self.param1:S.SP]
+            S.SP -= 1
+        elif self.instruction == Instructions1Params.I.MOVE:
+            (a, b) = (S[S.SP - 1], S[S.SP])
+            for c in (a, b):
+                if not 0 <= c <= len(S.stack) - self.param1:
+                    raise Exception(f"Access of address {c} outside of memory")
+            S.stack[b:b + self.param1] = S.stack[a:a + self.param1]
+            S.SP -= 2
+        elif self.instruction == Instructions1Params.I.JUMPNZ:
+            if S[S.SP] != 0:
+                state.PC = self.param1
+            S.SP -= 1
         else:
             raise Exception("Unknown instruction")
 
@@ -250,5 +315,37 @@ class Instructions1Params(Instructions):
             return "Sets the EXTREME POINTER to SP + param1. Limting the stack to param1 elements"
         elif self.instruction == Instructions1Params.I.SLIDE:
             return "Copies the topmost element (the return value) down param1 elements on the stack. This eliminiates formal parameters"
+        elif self.instruction == Instructions1Params.I.TAILCALL:
+            return "Calls the function at the address given by the topmost element in the current stack frame. The param1 elements below it replace the formal parameters"
+        elif self.instruction == Instructions1Params.I.LOADR:
+            return "Loads the value at the relative address FP + param1 onto the stack (LOADRC param1; load)"
+        elif self.instruction == Instructions1Params.I.STORER:
+            return "Stores the topmost element at the relative address FP + param1 and pops it (LOADRC param1; store; pop)"
+        elif self.instruction == Instructions1Params.I.ADDC:
+            return "Adds the parameter to the topmost element of the stack (LOADC param1; +)"
+        elif self.instruction == Instructions1Params.I.CALLF:
+            return "Calls the function at the address given by the parameter (mark; LOADC param1; call)"
+        elif self.instruction == Instructions1Params.I.LOADK:
+            return "Replaces the address on top of the stack by the param1 cells starting at it"
+        elif self.instruction == Instructions1Params.I.STOREK:
+            return "Stores the param1 cells below the topmost element at the address given by it and pops the address"
+        elif self.instruction == Instructions1Params.I.MOVE:
+            return "Copies param1 cells from the address below the topmost element to the address on top and pops both"
+        elif self.instruction == Instructions1Params.I.JUMPNZ:
+            return "Sets the PC to the value given by the parameter if the topmost element of the stack is not 0. Pops the stack"
         else:
             return "Unknown instruction"
+
+
+# Opcodes of the serialized code. An instruction without parameter is its
+# opcode, one with a parameter the tuple (opcode, parameter).
+CODES = [*Instructions0Params.I, *Instructions1Params.I]
+CODE = {instruction: op for op, instruction in enumerate(CODES)}
+
+
+def encode(code: list[Instructions]) -> list:
+    return [(CODE[i.instruction], i.param1) if isinstance(i, Instructions1Params) else CODE[i.instruction] for i in code]
+
+
+def decode(encoded: list) -> list[Instructions]:
+    return [Instructions0Params(CODES[e]) if type(e) == int else Instructions1Params(CODES[e[0]], e[1]) for e in encoded]
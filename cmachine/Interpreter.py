@@ -1,35 +1,77 @@
 from __future__ import annotations
-from typing import TYPE_CHECKING, Literal, Optional
-from collections import defaultdict
-
-from pyparsing import *
+from typing import TYPE_CHECKING
 
 from Instructions import Instructions1Params, bcolors
+from Image import Image, link, HANDLERS
+from Threaded import thread
+from Jit import Jit
+from Allocator import Allocator
+from Output import Sink, FileSink
+from Trace import Trace, FIELDS, NO_VALUE, ANSI
+from Profiler import Profile, PROGRAM, CALL, RETURN
 
 if TYPE_CHECKING:
     from Instructions import Instructions
 
-from time import sleep
+import asyncio
+
+
+class Uninitialized:
+    """
+    Content of memory cells that were never written. Using it as a number or
+    an address raises, so uninitialized reads are caught where they are used
+    """
+
+    def _fail(self, *args):
+        raise Exception("Read of uninitialized memory")
+
+    __add__ = __radd__ = __sub__ = __rsub__ = __mul__ = __rmul__ = _fail
+    __floordiv__ = __rfloordiv__ = __neg__ = __index__ = _fail
+    __lt__ = __le__ = __gt__ = __ge__ = __eq__ = __ne__ = _fail
+    __hash__ = object.__hash__
+
+    def __repr__(self):
+        return "_"
 
 
-def uncolor(str):
-    ESC = Literal('\x1b')
-    integer = Word(nums)
-    escapeSeq = Combine(ESC + '[' + Optional(delimitedList(integer, ';')) +
-                        oneOf(list(alphas)))
+UNINITIALIZED = Uninitialized()
 
-    def nonAnsiString(s): return Suppress(escapeSeq).transformString(str)
+MEMORY_SIZE = 10000
 
-    return nonAnsiString(str)
+# Instructions run_async executes before yielding to the event loop
+SLICE_STEPS = 1000
 
 
 class Stack:
-    def __init__(self):
-        self.stack: dict[int, int] = defaultdict(lambda: "_")
+    """
+    The memory of the CMa. One preallocated block of cells in which the stack
+    grows up from address 0 and the heap grows down from the end
+    """
+
+    def __init__(self, size: int = MEMORY_SIZE, output: Sink = None):
+        self.stack: list[int] = [UNINITIALIZED] * size
         self.SP: int = -1
-        self.NP = 10000
+        self.NP = size
+        self.EP = -1
+        self.FP = -1
+        self.heap = Allocator(size)
+        self.output = output if output is not None else FileSink()
+        # steps the image interpreter does not count itself (skipped JUMP_TARGETs, compiled code)
+        self.extra = 0
+
+    def reset(self):
+        """
+        Empties the memory for another run. The cells, heap and output stay
+        the same objects, so engines holding them can run again
+        """
+        size = len(self.stack)
+        self.stack[:] = [UNINITIALIZED] * size
+        self.SP = -1
+        self.NP = size
         self.EP = -1
         self.FP = -1
+        self.heap.reset()
+        self.extra = 0
 
     def __getitem__(self, key: int) -> int:
         return self.stack[key]
@@ -38,7 +80,10 @@ class Stack:
         self.stack[key] = value
 
     def to_list(self) -> list[int]:
-        return [self.stack[i] for i in range(self.SP+1)]
+        return self.stack[:self.SP+1]
+
+    def heap_list(self) -> list[int]:
+        return self.stack[self.NP:]
 
     def __repr__(self):
         return str(self.to_list())
@@ -53,13 +98,246 @@ def get_label_positions(code):
 
 
 class Interpreter:
-    def __init__(self, code: list[Instructions]):
-        self.stack: Stack = Stack()
+    def __init__(self, code: list[Instructions], memory: int = MEMORY_SIZE, output: Sink = None, image: Image = None):
+        self.stack: Stack = Stack(memory, output)
+        self.output = self.stack.output
         self.code = code
-        self.jumpLabels = get_label_positions(code)
+        if image is None:
+            self.jumpLabels = get_label_positions(code)
+            self.image: Image = link(code)
+        else:
+            # loaded with the code, e.g. from a bytecode file
+            self.jumpLabels = image.labels
+            self.image = image
+        self.threaded = None
+        self.jit: Jit = None
         self.PC: int = 0
+        self.steps: int = 0
+        self.profile: Profile = None
+
+    def reset(self):
+        """
+        Resets the memory and registers for another run of the program,
+        keeping the image and the engines built on it
+        """
+        self.stack.reset()
+        self.PC = 0
+        self.steps = 0
+
+    def run(self, debug=False, engine="image", trace: Trace = None, profile=False):
+        """
+        Runs the program. The engine is "image" (table dispatch over the linked
+        image), "threaded" (closure threaded) or "jit" (the image interpreter
+        compiling hot functions to Python). Debug runs always interpret the
+        instruction objects, traced runs the image, recording every instruction
+        into trace. Profiled runs leave a Profile in self.profile. The output is
+        flushed when the run ends
+        """
+        try:
+            if debug:
+                step = self.run_instructions(debug=True)
+            elif trace is not None:
+                step = self.run_traced(trace)
+            elif profile:
+                self.profile = Profile(self.code, self.image)
+                step = self.run_profiled(self.profile)
+            elif engine == "image":
+                step = self.run_image()
+            elif engine == "threaded":
+                step = self.run_threaded()
+            elif engine == "jit":
+                step = self.run_jit()
+            else:
+                raise Exception("Unknown engine " + str(engine))
+        finally:
+            self.output.flush()
+
+        self.steps = step
+        print(f"\nExecution finished in {step} steps")
+
+    def run_image(self, handlers=HANDLERS) -> int:
+        """
+        Runs the linked image until the program halts. Returns the number of steps
+        """
+        image = self.image
+        ops, args, weights = image.ops, image.args, image.weights
+        S = self.stack
+        M = S.stack
+        n = len(ops)
+
+        (pc, step) = image.entries[self.PC]
+        S.extra = 0
+
+        while pc < n:
+            step += weights[pc]
+            pc = handlers[ops[pc]](S, M, args[pc], pc + 1)
+
+        self.PC = len(self.code)
+        return step + S.extra
+
+    def run_traced(self, trace: Trace) -> int:
+        """
+        Runs the linked image like run_image, recording each instruction into
+        the trace before executing it. Returns the number of steps
+        """
+        image = self.image
+        ops, args, weights, addrs = image.ops, image.args, image.weights, image.addrs
+        handlers = HANDLERS
+        S = self.stack
+        M = S.stack
+        n = len(ops)
+
+        R = trace.buffer
+        end = trace.capacity * FIELDS
+        i = (trace.count % trace.capacity) * FIELDS
+        recorded = 0
+
+        (pc, step) = image.entries[self.PC]
+        S.extra = 0
 
-    def run(self, debug=False):
+        try:
+            while pc < n:
+                sp = S.SP
+                R[i] = addrs[pc]
+                R[i + 1] = ops[pc]
+                R[i + 2] = sp
+                R[i + 3] = S.FP
+                if sp < 0:
+                    # the stack is empty, M[-1] would be the end of the heap
+                    R[i + 4] = NO_VALUE
+                else:
+                    try:
+                        R[i + 4] = M[sp]
+                    except Exception:
+                        R[i + 4] = NO_VALUE
+                i += FIELDS
+                recorded += 1
+                if i == end:
+                    trace.count += recorded
+                    recorded = 0
+                    trace.flush()
+                    i = 0
+
+                step += weights[pc]
+                pc = handlers[ops[pc]](S, M, args[pc], pc + 1)
+        finally:
+            trace.count += recorded
+            trace.flush()
+
+        self.PC = len(self.code)
+        return step + S.extra
+
+    def run_profiled(self, profile: Profile) -> int:
+        """
+        Runs the linked image like run_image, counting into the profile.
+        Returns the number of steps
+        """
+        image = self.image
+        ops, args, weights = image.ops, image.args, image.weights
+        handlers = HANDLERS
+        S = self.stack
+        M = S.stack
+        n = len(ops)
+
+        hits, kinds, function = profile.hits, profile.kinds, profile.function
+        stacks, calls = profile.stacks, profile.calls
+        paths = [PROGRAM]
+        mark = 0
+
+        (pc, step) = image.entries[self.PC]
+        S.extra = 0
+
+        while pc < n:
+            hits[pc] += 1
+            step += weights[pc]
+            kind = kinds[pc]
+            pc = handlers[ops[pc]](S, M, args[pc], pc + 1)
+
+            if kind:
+                now = step + S.extra
+                stacks[paths[-1]] += now - mark
+                mark = now
+                if kind == RETURN:
+                    paths.pop()
+                else:
+                    name = function[pc]
+                    calls[name] += 1
+                    if kind == CALL:
+                        paths.append(f"{paths[-1]};{name}")
+                    else:
+                        paths[-1] = f"{paths[-1].rpartition(';')[0]};{name}"
+
+        step += S.extra
+        stacks[paths[-1]] += step - mark
+        profile.steps += step
+
+        self.PC = len(self.code)
+        return step
+
+    def run_slice(self, budget: int) -> bool:
+        """
+        Runs at most budget instructions of the linked image, continuing where
+        the last slice stopped. Adds the steps to self.steps and returns
+        whether the program halted
+        """
+        image = self.image
+        ops, args, weights = image.ops, image.args, image.weights
+        handlers = HANDLERS
+        S = self.stack
+        M = S.stack
+        n = len(ops)
+
+        (pc, step) = image.entries[self.PC]
+        S.extra = 0
+
+        for _ in range(budget):
+            if pc >= n:
+                break
+            step += weights[pc]
+            pc = handlers[ops[pc]](S, M, args[pc], pc + 1)
+
+        self.steps += step + S.extra
+        self.PC = image.addrs[pc] if pc < n else len(self.code)
+        return pc >= n
+
+    async def run_async(self, budget: int = SLICE_STEPS) -> int:
+        """
+        Runs the program in slices of budget instructions, yielding to the
+        event loop after each. Returns the number of steps
+        """
+        try:
+            while not self.run_slice(budget):
+                await asyncio.sleep(0)
+        finally:
+            self.output.flush()
+        return self.steps
+
+    def run_jit(self) -> int:
+        """
+        Runs the linked image, compiling functions once they are called often
+        enough. Returns the number of steps
+        """
+        if self.jit is None:
+            self.jit = Jit(self.image, self.stack)
+
+        return self.run_image(self.jit.handlers)
+
+    def run_threaded(self) -> int:
+        """
+        Runs the closure threaded program until the program halts. Returns the number of steps
+        """
+        if self.threaded is None:
+            self.threaded = thread(self.image, self.stack)
+
+        step = self.threaded(self.PC)
+
+        self.PC = len(self.code)
+        return step
+
+    def run_instructions(self, debug=False) -> int:
+        """
+        Runs the program by interpreting the instruction objects. Returns the number of steps
+        """
         step = 0
         while True:
             if self.PC >= len(self.code):
@@ -70,7 +348,7 @@ class Interpreter:
 
             if debug:
 
-                real_ir_length = len(uncolor(str(IR)))
+                real_ir_length = len(ANSI.sub("", str(IR)))
                 registers = f"PC: {self.PC: > 5}, SP: {self.stack.SP: > 5}, FP: {self.stack.FP: > 5}"
                 print(f"Stack:\t{self.stack}")
                 print(
@@ -79,7 +357,9 @@ class Interpreter:
                 print()
 
             IR.interpret(self)
+            if debug:
+                self.output.flush()
 
             step += 1
 
-        print(f"\nExecution finished in {step} steps")
+        return step
@@ -0,0 +1,857 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Callable, Optional
+
+from Instructions import Instructions0Params as I0P, Instructions1Params as I1P
+from Image import OPCODES, OPCODE, HANDLERS
+
+if TYPE_CHECKING:
+    from Image import Image
+    from Interpreter import Stack
+
+
+# Calls of a function before it gets compiled
+JIT_THRESHOLD = 10
+
+# Nesting of compiled calls after which callees are interpreted, so deep
+# recursion does not exhaust the Python stack
+MAX_DEPTH = 200
+
+BINARY = {I0P.I.ADD: "+", I0P.I.SUB: "-", I0P.I.MUL: "*", I0P.I.DIV: "//"}
+COMPARE = {I0P.I.LEQ: "<=", I0P.I.GEQ: ">=",
+           I0P.I.LT: "<", I0P.I.GT: ">", I0P.I.EQ: "=="}
+
+
+class Uncompilable(Exception):
+    pass
+
+
+def var(k: int) -> str:
+    """Name of the Python local holding the frame cell FP + k"""
+    return f"v{k}" if k > 0 else f"p{-k}"
+
+
+class Entry:
+    """
+    A cell of the operand stack while translating. The cell is either the
+    variable living in its frame cell ("var"), a pending Python expression
+    ("expr"), an FP relative address ("addr") or a cell pushed by MARK ("mark")
+    """
+
+    def __init__(self, kind: str, text: str = "", reads=frozenset(), memory=False, condition=False, value=None, home=False):
+        self.kind = kind
+        self.text = text
+        # names the expression reads and whether it reads M
+        self.reads = reads
+        self.memory = memory
+        # text is a Python bool instead of 0 / 1
+        self.condition = condition
+        # the constant of a LOADC, the offset of an address
+        self.value = value
+        # the value is already stored in its memory cell
+        self.home = home
+
+
+def name_entry(name: str, home=False) -> Entry:
+    return Entry("expr", name, frozenset([name]), home=home)
+
+
+def constant(value: int) -> Entry:
+    return Entry("expr", str(value) if value >= 0 else f"({value})", value=value)
+
+
+class Loop:
+    def __init__(self, head: int, exit: int, shape: tuple):
+        self.head = head
+        self.exit = exit
+        self.shape = shape
+        self.exit_shape = None
+
+
+class Translator:
+    """
+    Translates the function starting at an instruction of the image into the
+    source of a Python function. The frame cells the function addresses become
+    Python locals, the operand stack is kept as pending expressions and the
+    branches of the code generator become ifs and while loops. Anything else
+    raises Uncompilable.
+
+    The generated function takes the FP of a frame set up by a call and does
+    what the function's return does, except for jumping back. It charges the
+    same steps as the interpreter. Programs that do not read uninitialized
+    memory see the same results.
+    """
+
+    def __init__(self, image: Image, entry: int, sentinel: int):
+        self.image = image
+        self.entry = entry
+        self.sentinel = sentinel
+        (self.end, self.targets, self.back) = self.region()
+
+        ops, args = image.ops, image.args
+        # block stores may write the cell of the result along with others
+        self.result = any((OPCODES[ops[pc]] in (I1P.I.LOADRC, I1P.I.LOADR, I1P.I.STORER) and args[pc] == -3)
+                          or (OPCODES[ops[pc]] == I1P.I.TAILCALL and args[pc][0] > 0)
+                          or OPCODES[ops[pc]] in (I1P.I.STOREK, I1P.I.MOVE)
+                          for pc in range(entry, self.end))
+        self.params = {-3} if self.result else set()
+        # tail calls of the function itself become a loop around its body
+        self.recursive = any(OPCODES[ops[pc]] == I1P.I.TAILCALL and OPCODES[ops[pc - 1]] == I1P.I.LOADC
+                             and self.callee(args[pc - 1]) == entry
+                             for pc in range(entry + 1, self.end))
+
+        self.lines: list[str] = []
+        self.level = 3 if self.recursive else 2
+        self.stack: list[Entry] = []
+        self.pending = 0
+        self.temps = 0
+        self.loops: list[Loop] = []
+        self.dead = False
+
+    def region(self):
+        """
+        Finds the instructions reachable from the entry without following
+        calls. Returns the end of the region, the jump targets and the back
+        edge of every loop head
+        """
+        ops, args = self.image.ops, self.image.args
+        seen = set()
+        todo = [self.entry]
+        targets = set()
+        back = {}
+        while todo:
+            pc = todo.pop()
+            if pc in seen:
+                continue
+            if pc < self.entry or pc >= len(ops):
+                raise Uncompilable("control leaves the function")
+            seen.add(pc)
+            op = OPCODES[ops[pc]]
+            if op == I1P.I.JUMP:
+                targets.add(args[pc])
+                if args[pc] <= pc:
+                    back[args[pc]] = max(back.get(args[pc], pc), pc)
+                todo.append(args[pc])
+            elif op in (I1P.I.JUMPZ, I1P.I.JUMPNZ):
+                targets.add(args[pc][0])
+                if op == I1P.I.JUMPNZ and args[pc][0] <= pc:
+                    back[args[pc][0]] = max(back.get(args[pc][0], pc), pc)
+                todo += [pc + 1, args[pc][0]]
+            elif op not in (I0P.I.RETURN, I0P.I.HALT, I1P.I.TAILCALL):
+                todo.append(pc + 1)
+        return max(seen) + 1, targets, back
+
+    def callee(self, address) -> Optional[int]:
+        """The instruction a call of an unlinked address continues with"""
+        if type(address) != int or not 0 <= address < len(self.image.entries):
+            return None
+        return self.image.entries[address][0]
+
+    def source(self) -> str:
+        self.block(self.entry, self.end)
+        if not self.dead:
+            raise Uncompilable("control leaves the function")
+
+        name = f"jit_{self.entry}"
+        lines = ["def factory(M, S, J, invoke, call, tail):",
+                 f"    def {name}(fp):",
+                 "        st = 0"]
+        lines += [f"        {var(k)} = M[fp - {-k}]" for k in sorted(self.params, reverse=True)]
+        if self.recursive:
+            lines.append("        while True:")
+        lines += self.lines
+        lines.append(f"    return {name}")
+        return "\n".join(lines) + "\n"
+
+    # Emitting code
+
+    def emit(self, line: str):
+        self.lines.append("    " * self.level + line)
+
+    def count(self, pc: int):
+        self.pending += self.image.weights[pc]
+
+    def flush(self):
+        if self.pending:
+            self.emit(f"st += {self.pending}")
+            self.pending = 0
+
+    def body(self, start: int):
+        """Makes sure the block opened before lines[start] is not empty"""
+        if len(self.lines) == start:
+            self.emit("pass")
+
+    # The operand stack
+
+    def push(self, entry: Entry):
+        self.stack.append(entry)
+
+    def pop(self) -> Entry:
+        if not self.stack:
+            raise Uncompilable("stack underflow")
+        return self.stack.pop()
+
+    def value(self, entry: Entry) -> str:
+        if entry.kind not in ("var", "expr"):
+            raise Uncompilable("address or frame cell escapes")
+        return f"(1 if {entry.text} else 0)" if entry.condition else entry.text
+
+    def moved(self, entry: Entry) -> Entry:
+        """A copy of the cell's value that can live in another cell"""
+        if entry.kind == "var":
+            return name_entry(entry.text)
+        if entry.kind != "expr":
+            raise Uncompilable("address or frame cell escapes")
+        return Entry("expr", entry.text, entry.reads, entry.memory, entry.condition, entry.value)
+
+    def materialize(self, i: int, force=False):
+        """Evaluates a pending expression into a fresh temporary"""
+        e = self.stack[i]
+        if e.kind != "expr" or (not force and (e.value is not None or e.text.isidentifier())):
+            return
+        name = f"t{self.temps}"
+        self.temps += 1
+        self.emit(f"{name} = {self.value(e)}")
+        self.stack[i] = name_entry(name, e.home)
+
+    def invalidate(self, name: str, keep: int = -1):
+        """Evaluates the pending expressions reading a name about to change"""
+        for i, e in enumerate(self.stack):
+            if i != keep and e.kind == "expr" and name in e.reads:
+                self.materialize(i, force=True)
+
+    def invalidate_memory(self):
+        for i, e in enumerate(self.stack):
+            if e.kind == "expr" and e.memory:
+                self.materialize(i, force=True)
+
+    def local(self, k: int) -> str:
+        """Name of the variable in frame cell FP + k"""
+        if k >= 1:
+            if k > len(self.stack) or self.stack[k - 1].kind != "var":
+                raise Uncompilable("address of a temporary")
+        elif k <= -3:
+            self.params.add(k)
+        else:
+            raise Uncompilable("access to the organisational cells")
+        return var(k)
+
+    def shape(self) -> tuple:
+        return tuple(e.kind for e in self.stack)
+
+    def canonicalize(self):
+        """
+        Evaluates all pending expressions into the names s1, s2, ... of their
+        depth, so all paths joining at a label agree on where values live
+        """
+        names, texts = [], []
+        for i, e in enumerate(self.stack):
+            if e.kind not in ("var", "expr"):
+                raise Uncompilable("mark or address across a branch")
+            if e.kind == "expr":
+                name = f"s{i + 1}"
+                if e.text != name or e.condition:
+                    names.append(name)
+                    texts.append(self.value(e))
+                self.stack[i] = name_entry(name)
+        if names:
+            self.emit(f"{', '.join(names)} = {', '.join(texts)}")
+
+    def restore(self, shape: Optional[tuple]):
+        """Continues after a join with the canonical stack of the shape"""
+        if shape is None:
+            self.dead = True
+            self.stack = []
+            return
+        self.dead = False
+        self.stack = [Entry("var", var(i + 1)) if kind == "var" else name_entry(f"s{i + 1}")
+                      for i, kind in enumerate(shape)]
+
+    def join(self, a: Optional[tuple], b: Optional[tuple]):
+        if a is not None and b is not None and a != b:
+            raise Uncompilable("stack differs between paths")
+        self.restore(a if a is not None else b)
+
+    def condition(self, entry: Entry) -> tuple[str, str]:
+        """Python conditions for the cell being non-zero and zero"""
+        if entry.condition:
+            return entry.text, f"not {entry.text}"
+        value = self.value(entry)
+        return f"{value} != 0", f"{value} == 0"
+
+    # Control flow
+
+    def block(self, a: int, b: int):
+        """Translates the instructions a to b, which control enters at a and leaves at b"""
+        ops = self.image.ops
+        pc = a
+        while pc < b:
+            if self.dead:
+                if any(pc <= t < b for t in self.targets):
+                    raise Uncompilable("jump into unreachable code")
+                return
+            if pc in self.back and not (self.loops and self.loops[-1].head == pc):
+                pc = self.loop(pc, b)
+                continue
+            op = OPCODES[ops[pc]]
+            if op == I1P.I.JUMPZ:
+                pc = self.branch(pc, b)
+            elif op == I1P.I.JUMP:
+                self.jump(pc)
+                pc += 1
+            else:
+                self.instruction(pc)
+                pc += 1
+
+    def loop(self, head: int, b: int) -> int:
+        end = self.back[head]
+        if end >= b:
+            raise Uncompilable("loop overlaps its surroundings")
+        self.canonicalize()
+        self.flush()
+        loop = Loop(head, end + 1, self.shape())
+
+        self.emit("while True:")
+        self.level += 1
+        start = len(self.lines)
+        self.loops.append(loop)
+        self.block(head, end)
+        if not self.dead:
+            self.count(end)
+            if OPCODES[self.image.ops[end]] == I1P.I.JUMPNZ:
+                # the condition at the bottom of an inverted loop
+                (_, zero) = self.condition(self.pop())
+                self.canonicalize()
+                self.flush()
+                shape = self.shape()
+                self.emit(f"if {zero}:")
+                self.level += 1
+                self.leave(loop)
+                self.level -= 1
+                self.restore(shape)
+                self.pending = self.image.args[end][1]
+            self.canonicalize()
+            if self.shape() != loop.shape:
+                raise Uncompilable("stack differs between iterations")
+            self.flush()
+        self.body(start)
+        self.loops.pop()
+        self.level -= 1
+
+        self.restore(loop.exit_shape)
+        return end + 1
+
+    def leave(self, loop: Loop):
+        self.canonicalize()
+        if loop.exit_shape is None:
+            loop.exit_shape = self.shape()
+        elif loop.exit_shape != self.shape():
+            raise Uncompilable("stack differs between loop exits")
+        self.flush()
+        self.emit("break")
+        self.dead = True
+
+    def branch(self, pc: int, b: int) -> int:
+        ops, args = self.image.ops, self.image.args
+        (target, extra) = args[pc]
+        self.count(pc)
+        (nonzero, zero) = self.condition(self.pop())
+        self.canonicalize()
+        self.flush()
+        shape = self.shape()
+        loop = self.loops[-1] if self.loops else None
+
+        # the condition of a loop
+        if loop is not None and target == loop.exit:
+            self.emit(f"if {zero}:")
+            self.level += 1
+            self.pending = extra
+            self.leave(loop)
+            self.level -= 1
+            self.restore(shape)
+            return pc + 1
+
+        if not pc < target <= b:
+            raise Uncompilable("unstructured branch")
+
+        self.emit(f"if {nonzero}:")
+        self.level += 1
+        start = len(self.lines)
+        jump = target - 1
+        if jump > pc and OPCODES[ops[jump]] == I1P.I.JUMP and target <= args[jump] <= b:
+            # if-else, the then part ends with a jump over the else part
+            end = args[jump]
+            self.block(pc + 1, jump)
+            if not self.dead:
+                self.count(jump)
+            then = self.close(start)
+
+            self.emit("else:")
+            self.level += 1
+            start = len(self.lines)
+            self.restore(shape)
+            self.pending = extra
+            self.block(target, end)
+            self.join(then, self.close(start))
+            return end
+
+        self.block(pc + 1, target)
+        then = self.close(start)
+        if extra:
+            self.emit("else:")
+            self.emit(f"    st += {extra}")
+        self.join(then, shape)
+        return target
+
+    def close(self, start: int) -> Optional[tuple]:
+        """Ends a branch of an if, returns the shape of its stack or None if it does not continue"""
+        shape = None
+        if not self.dead:
+            self.canonicalize()
+            self.flush()
+            shape = self.shape()
+        self.body(start)
+        self.level -= 1
+        return shape
+
+    def jump(self, pc: int):
+        target = self.image.args[pc]
+        loop = self.loops[-1] if self.loops else None
+        if loop is None:
+            raise Uncompilable("unstructured jump")
+        self.count(pc)
+        if target == loop.head:
+            self.canonicalize()
+            if self.shape() != loop.shape:
+                raise Uncompilable("stack differs between iterations")
+            self.flush()
+            self.emit("continue")
+            self.dead = True
+        elif target == loop.exit:
+            self.leave(loop)
+        else:
+            raise Uncompilable("unstructured jump")
+
+    # Instructions
+
+    def instruction(self, pc: int):
+        op = OPCODES[self.image.ops[pc]]
+        arg = self.image.args[pc]
+        self.count(pc)
+
+        if op == I0P.I.ADD and len(self.stack) >= 2 and self.stack[-2].kind == "addr" and self.stack[-1].kind == "expr" and self.stack[-1].value is not None:
+            # a member of a struct in the frame
+            offset = self.pop().value
+            self.push(Entry("addr", value=self.pop().value + offset))
+        elif op in BINARY or op in COMPARE:
+            b = self.pop()
+            a = self.pop()
+            text = f"({self.value(a)} {BINARY.get(op) or COMPARE[op]} {self.value(b)})"
+            self.push(Entry("expr", text, a.reads | b.reads, a.memory or b.memory, op in COMPARE))
+        elif op == I0P.I.NEG:
+            a = self.pop()
+            self.push(Entry("expr", f"(-{self.value(a)})", a.reads, a.memory))
+        elif op == I0P.I.NOT:
+            a = self.pop()
+            text = f"(not {a.text})" if a.condition else f"({self.value(a)} == 0)"
+            self.push(Entry("expr", text, a.reads, a.memory, True))
+        elif op == I1P.I.ADDC and self.stack and self.stack[-1].kind == "addr":
+            self.push(Entry("addr", value=self.pop().value + arg))
+        elif op == I1P.I.ADDC:
+            a = self.pop()
+            self.push(Entry("expr", f"({self.value(a)} + {arg})", a.reads, a.memory))
+        elif op == I1P.I.LOADC:
+            if type(arg) != int:
+                raise Uncompilable("constant is not a number")
+            self.push(constant(arg))
+        elif op == I1P.I.LOADRC:
+            self.push(Entry("addr", value=arg))
+        elif op == I1P.I.LOADR:
+            self.push(name_entry(self.local(arg)))
+        elif op == I0P.I.LOAD:
+            self.load_block(self.pop(), 1)
+        elif op == I0P.I.STORE:
+            self.store_block(self.pop(), 1)
+        elif op == I1P.I.STORER:
+            name = self.local(arg)
+            self.assign(name, len(self.stack) - 1)
+            self.pop()
+        elif op == I1P.I.LOADK:
+            self.load_block(self.pop(), arg)
+        elif op == I1P.I.STOREK:
+            self.store_block(self.pop(), arg)
+        elif op == I1P.I.MOVE:
+            b = self.pop()
+            self.load_block(self.pop(), arg)
+            self.store_block(b, arg)
+            for _ in range(arg):
+                self.pop()
+        elif op == I0P.I.POP:
+            self.pop()
+        elif op == I1P.I.SLIDE and arg == 0:
+            pass
+        elif op == I1P.I.SLIDE:
+            top = self.moved(self.pop())
+            if arg < -1:
+                raise Uncompilable("slide into unwritten cells")
+            for _ in range(arg):
+                if self.pop().kind == "mark":
+                    raise Uncompilable("slide over a mark")
+            self.push(top)
+            if arg == -1:
+                self.push(self.moved(top))
+        elif op == I1P.I.ALLOC and arg < 0:
+            # the end of the scope of a declaration
+            for _ in range(-arg):
+                self.pop()
+        elif op == I1P.I.ALLOC:
+            for _ in range(arg):
+                k = len(self.stack) + 1
+                self.invalidate(var(k))
+                self.emit(f"{var(k)} = M[fp + {k}]")
+                self.push(Entry("var", var(k)))
+        elif op == I1P.I.ENTER:
+            self.emit(f"S.EP = fp + {len(self.stack) + arg}")
+            self.emit("if S.EP >= S.NP:")
+            self.emit("    raise Exception(\"Stack overflow\")")
+        elif op == I0P.I.PRINT:
+            self.materialize(len(self.stack) - 1)
+            self.emit(f"S.output.write(f\">> {{{self.value(self.stack[-1])}}}\")")
+        elif op == I0P.I.NEW:
+            self.materialize(len(self.stack) - 1)
+            size = self.value(self.pop())
+            name = f"t{self.temps}"
+            self.temps += 1
+            self.emit(f"({name}, S.NP) = S.heap.alloc({size}, S.NP, S.EP)")
+            self.push(name_entry(name))
+        elif op == I0P.I.FREE:
+            self.materialize(len(self.stack) - 1)
+            self.emit(f"S.NP = S.heap.release({self.value(self.pop())}, S.NP)")
+        elif op == I0P.I.MARK:
+            self.push(Entry("mark"))
+            self.push(Entry("mark"))
+        elif op == I0P.I.CALL:
+            target = self.pop()
+            (ret, _) = arg
+            if target.value is not None:
+                (callee, skip) = self.image.entries[target.value]
+                self.pending += skip
+                self.call(callee, ret)
+            else:
+                self.call(f"call({self.value(target)}, ", ret)
+        elif op == I1P.I.CALLF:
+            (ret, callee) = arg
+            self.push(Entry("mark"))
+            self.push(Entry("mark"))
+            self.call(callee, ret)
+        elif op == I1P.I.TAILCALL:
+            self.tail(arg[0], self.pop())
+        elif op == I0P.I.RETURN:
+            self.flush()
+            if self.result:
+                self.emit(f"M[fp - 3] = {var(-3)}")
+            self.emit("S.extra += st")
+            self.emit("S.EP = M[fp - 2]")
+            self.emit("if S.EP >= S.NP:")
+            self.emit("    raise Exception(\"Stack overflow\")")
+            self.emit("return")
+            self.dead = True
+        else:
+            raise Uncompilable(f"unsupported instruction {op.name}")
+
+    def assign(self, name: str, top: int):
+        """Stores the cell top into a variable, the cell then holds the variable"""
+        value = self.value(self.stack[top])
+        self.invalidate(name, keep=top)
+        self.emit(f"{name} = {value}")
+        if self.stack[top].kind == "expr":
+            self.stack[top] = name_entry(name)
+
+    def address(self, entry: Entry, k: int) -> str:
+        """
+        The address a cell holds, evaluated into a temporary unless it is a
+        name or a constant. Raises at run time unless the k cells starting
+        there lie in the memory
+        """
+        text = self.value(entry)
+        if entry.value is not None or text.isidentifier():
+            name = text
+        else:
+            name = f"t{self.temps}"
+            self.temps += 1
+            self.emit(f"{name} = {text}")
+        if k > 1 or entry.value is None or entry.value < 0:
+            self.emit(f"if {name} < 0:" if k == 1 else f"if not 0 <= {name} <= len(M) - {k}:")
+            self.emit(f'    raise Exception(f"Access of address {{{name}}} outside of memory")')
+        return name
+
+    def load_block(self, a: Entry, k: int):
+        """Pushes the k cells starting at the address a"""
+        if a.kind == "addr":
+            for i in range(k):
+                self.push(name_entry(self.local(a.value + i)))
+            return
+        base = self.address(a, k)
+        reads = frozenset([base]) if base.isidentifier() else frozenset()
+        for i in range(k):
+            self.push(Entry("expr", f"M[{base} + {i}]" if i else f"M[{base}]", reads, True))
+
+    def store_block(self, a: Entry, k: int):
+        """Stores the k cells on top of the stack at the address a, the cells stay"""
+        top = len(self.stack) - k
+        if top < 0:
+            raise Uncompilable("stack underflow")
+        if a.kind == "addr":
+            for i in range(k):
+                self.assign(self.local(a.value + i), top + i)
+            return
+        for i in range(top, len(self.stack)):
+            self.materialize(i)
+        self.invalidate_memory()
+        base = self.address(a, k)
+        if k == 1:
+            self.emit(f"M[{base}] = {self.value(self.stack[-1])}")
+            return
+        values = ", ".join(self.value(e) for e in self.stack[top:])
+        self.emit(f"M[{base}:{base} + {k}] = [{values}]")
+
+    def tail(self, m: int, target: Entry):
+        """
+        Replaces the parameters by the topmost m cells and continues with the
+        target in the current frame, which returns for this function
+        """
+        if len(self.stack) < m:
+            raise Uncompilable("stack underflow")
+        values = [self.value(e) for e in self.stack[len(self.stack) - m:]]
+        names = [var(i - 2 - m) for i in range(m)]
+
+        if target.value is not None and self.callee(target.value) == self.entry and not self.loops:
+            self.params.update(i - 2 - m for i in range(m))
+            self.pending += self.image.entries[target.value][1]
+            self.flush()
+            if names:
+                self.emit(f"{', '.join(names)} = {', '.join(values)}")
+            self.emit("continue")
+        else:
+            self.value(target)
+            self.invalidate_memory()
+            for i, value in enumerate(values):
+                self.emit(f"M[fp - {2 + m - i}] = {value}")
+            self.flush()
+            self.emit("S.extra += st")
+            self.emit(f"tail({target.text}, fp)")
+            self.emit("return")
+        self.dead = True
+
+    def call(self, invoke, ret: int):
+        """
+        Calls a function with the stack ending in the cells of MARK. The
+        arguments are written to memory and the result is read back from it.
+        invoke is the instruction of a function known at compile time or the
+        start of the call of a computed one. The function calls itself
+        directly, without going through the Jit
+        """
+        if len(self.stack) < 3 or self.stack[-1].kind != "mark" or self.stack[-2].kind != "mark":
+            raise Uncompilable("call without mark")
+        del self.stack[-2:]
+        d = len(self.stack)
+
+        for i, e in enumerate(self.stack):
+            if e.kind not in ("var", "expr"):
+                raise Uncompilable("address or mark passed to a call")
+            if e.kind == "expr" and not e.home:
+                self.materialize(i)
+                self.emit(f"M[fp + {i + 1}] = {self.value(self.stack[i])}")
+                self.stack[i].home = True
+
+        self.emit(f"M[fp + {d + 1}] = S.EP")
+        self.emit(f"M[fp + {d + 2}] = fp")
+        self.emit(f"M[fp + {d + 3}] = {self.sentinel}")
+        if invoke == self.entry:
+            self.emit(f"if J.depth < {MAX_DEPTH}:")
+            self.emit("    J.depth += 1")
+            self.emit(f"    jit_{self.entry}(fp + {d + 3})")
+            self.emit("    J.depth -= 1")
+            self.emit("else:")
+            self.emit(f"    invoke({invoke}, fp + {d + 3})")
+        elif type(invoke) == int:
+            self.emit(f"invoke({invoke}, fp + {d + 3})")
+        else:
+            self.emit(f"{invoke}fp + {d + 3})")
+        self.pending += self.image.entries[ret][1]
+
+        top = self.stack[-1]
+        if top.kind == "var":
+            self.invalidate(top.text)
+            self.emit(f"{top.text} = M[fp + {d}]")
+        else:
+            name = f"t{self.temps}"
+            self.temps += 1
+            self.emit(f"{name} = M[fp + {d}]")
+            self.stack[-1] = name_entry(name, home=True)
+
+
+class Jit:
+    """
+    Counts the calls of every function run by the image interpreter and
+    replaces functions called more than threshold times by Python functions
+    translated from their code. Functions the Translator can not handle stay
+    interpreted
+    """
+
+    def __init__(self, image: Image, S: Stack, threshold: int = JIT_THRESHOLD):
+        self.image = image
+        self.S = S
+        self.threshold = threshold
+        self.calls: dict[int, int] = {}
+        self.compiled: dict[int, Optional[Callable[[int], None]]] = {}
+        self.sources: dict[int, str] = {}
+        self.failures: dict[int, str] = {}
+        self.depth = 0
+
+        self.entries = image.entries
+        self.sentinel = image.sentinel
+
+        self.handlers = list(HANDLERS)
+        self.handlers[OPCODE[I0P.I.CALL]] = self._call
+        self.handlers[OPCODE[I1P.I.CALLF]] = self._callf
+        self.handlers[OPCODE[I1P.I.TAILCALL]] = self._tailcall
+
+    def function(self, pc: int) -> Optional[Callable[[int], None]]:
+        """The compiled function starting at pc, if there is one to use"""
+        if pc in self.compiled:
+            return self.compiled[pc] if self.depth < MAX_DEPTH else None
+        count = self.calls.get(pc, 0) + 1
+        self.calls[pc] = count
+        if count >= self.threshold:
+            self.compiled[pc] = self.compile(pc)
+        return None
+
+    def compile(self, pc: int) -> Optional[Callable[[int], None]]:
+        try:
+            source = Translator(self.image, pc, self.sentinel).source()
+        except Uncompilable as e:
+            self.failures[pc] = str(e)
+            return None
+        self.sources[pc] = source
+        namespace = {}
+        exec(compile(source, f"<jit {pc}>", "exec"), namespace)
+        return namespace["factory"](self.S.stack, self.S, self, self.invoke, self.call, self.tail)
+
+    def invoke(self, pc: int, fp: int):
+        """Runs the function at pc in the frame fp set up by compiled code"""
+        compiled = self.compiled
+        if pc in compiled:
+            f = compiled[pc] if self.depth < MAX_DEPTH else None
+        else:
+            f = self.function(pc)
+        self.depth += 1
+        if f is None:
+            self.interpret(pc, fp)
+        else:
+            f(fp)
+        self.depth -= 1
+
+    def call(self, address: int, fp: int):
+        """Like invoke, for an unlinked address"""
+        (pc, skip) = self.entries[address]
+        self.S.extra += skip
+        self.invoke(pc, fp)
+
+    def tail(self, address: int, fp: int):
+        """Runs the function at an unlinked address in the frame fp of a compiled function that returns with it"""
+        (pc, skip) = self.entries[address]
+        self.S.extra += skip
+        f = self.function(pc)
+        self.depth += 1
+        if f is None:
+            M = self.S.stack
+            ret = M[fp]
+            M[fp] = self.sentinel
+            self.interpret(pc, fp)
+            M[fp] = ret
+        else:
+            f(fp)
+        self.depth -= 1
+
+    def interpret(self, pc: int, fp: int):
+        """
+        Runs the function at pc in the frame fp with the image interpreter.
+        The function returns to the frame the compiled code saved for it,
+        so SP and FP are restored to what the code running before expects
+        """
+        image = self.image
+        ops, args, weights = image.ops, image.args, image.weights
+        handlers = self.handlers
+        S = self.S
+        M = S.stack
+        n = len(ops)
+
+        (sp, saved) = (S.SP, S.FP)
+        S.SP = S.FP = fp
+        step = 0
+        while pc < n:
+            step += weights[pc]
+            pc = handlers[ops[pc]](S, M, args[pc], pc + 1)
+        S.extra += step
+        if pc != n + 1:
+            raise Exception("Program halted inside a function")
+        (S.SP, S.FP) = (sp, saved)
+
+    # Handlers replacing the calls of the image interpreter
+
+    def _call(self, S: Stack, M, arg, pc):
+        (ret, entries) = arg
+        sp = S.SP
+        (pc, skip) = entries[M[sp]]
+        M[sp] = ret
+        S.extra += skip
+        f = self.function(pc)
+        if f is None:
+            S.FP = sp
+            return pc
+        self.depth += 1
+        f(sp)
+        self.depth -= 1
+        S.SP = sp - 3
+        (pc, skip) = entries[ret]
+        S.extra += skip
+        return pc
+
+    def _callf(self, S: Stack, M, arg, pc):
+        (ret, pc) = arg
+        sp = S.SP
+        M[sp + 1] = S.EP
+        M[sp + 2] = S.FP
+        sp += 3
+        M[sp] = ret
+        f = self.function(pc)
+        if f is None:
+            S.SP = S.FP = sp
+            return pc
+        self.depth += 1
+        f(sp)
+        self.depth -= 1
+        S.SP = sp - 3
+        (pc, skip) = self.entries[ret]
+        S.extra += skip
+        return pc
+
+    def _tailcall(self, S: Stack, M, arg, pc):
+        (m, entries) = arg
+        sp = S.SP
+        fp = S.FP
+        (pc, skip) = entries[M[sp]]
+        M[fp - 2 - m:fp - 2] = M[sp - m:sp]
+        S.SP = fp
+        S.extra += skip
+        f = self.function(pc)
+        if f is None:
+            return pc
+        self.depth += 1
+        f(fp)
+        self.depth -= 1
+        (pc, skip) = entries[M[fp]]
+        S.SP = fp - 3
+        S.FP = M[fp - 1]
+        S.extra += skip
+        return pc
@@ -0,0 +1,169 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+from Instructions import Instructions1Params as I1P
+from Nodes import Program
+from Units import compile_units
+
+if TYPE_CHECKING:
+    from Instructions import Instructions
+
+
+class ObjectFile:
+    """
+    A compiled unit of MiniC, which other units can be linked with.
+
+    The functions are compiled one after the other into code, each with
+    labels of its own. The functions and the globals are the symbols the
+    unit exports; the imports are the symbols it declares and other units
+    define. Globals are laid out from address 1 of the unit's data, like
+    the globals of a program, and the code loads their addresses as their
+    names, which the linker replaces with the addresses.
+    """
+
+    def __init__(self, name: str, code: list[Instructions],
+                 functions: dict[str, tuple[int, int, str]], data: dict[str, tuple[int, str, int]], size_of_data: int,
+                 imports: dict[str, str]):
+        self.name = name
+        self.code = code
+        # function -> (start, end) of its code, type
+        self.functions = functions
+        # global -> address in the data of the unit, type, array size
+        self.data = data
+        self.size_of_data = size_of_data
+        # symbol -> type
+        self.imports = imports
+        # function -> the functions it references, and the positions in code
+        # loading the addresses of globals, with the globals
+        self.references: dict[str, list[str]] = {}
+        self.relocations: dict[str, list[tuple[int, str]]] = {}
+        for (function, (start, end, _)) in functions.items():
+            local = f"{function}."
+            references = []
+            relocations = []
+            for k in range(start, end):
+                symbol = getattr(code[k], "param1", None)
+                if type(symbol) != str or symbol.startswith(local) or code[k].instruction == I1P.I.JUMP_TARGET:
+                    continue
+                if symbol in data or (symbol in imports and "(" not in imports[symbol]):
+                    relocations.append((k, symbol))
+                elif symbol not in references:
+                    references.append(symbol)
+            self.references[function] = references
+            self.relocations[function] = relocations
+
+    def __repr__(self):
+        return f"ObjectFile({self.name}, {len(self.functions)} functions, {len(self.data)} globals, {len(self.imports)} imports)"
+
+    def type(self, symbol: str) -> str:
+        if symbol in self.functions:
+            return self.functions[symbol][2]
+        (_, type, arraySize) = self.data[symbol]
+        return type if arraySize == 1 else f"{type}[{arraySize}]"
+
+
+def compile_object(program: Program, name: str = "<unit>", workers: int = 1) -> ObjectFile:
+    """The object file of the program, which may declare functions and globals it does not define"""
+    (addressSpace, size_of_data) = program.context({}, 0, symbolic=True)
+    results = compile_units(program.functions, addressSpace, 0, workers)
+
+    code = []
+    functions = {}
+    for (function, result) in zip(program.functions, results):
+        start = len(code)
+        code += result.to_code()
+        functions[function.name] = (start, len(code), f"*{function.name}({','.join(p.type for p in function.args)})")
+    data = {}
+    address = 1
+    for variable in program.globalVariables:
+        data[variable.name] = (address, variable.type, variable.arraySize)
+        address += variable.typeSize * variable.arraySize
+    imports = {}
+    for extern in program.externs:
+        imports[extern.name] = extern.type if extern.arraySize == 1 else f"{extern.type}[{extern.arraySize}]"
+    return ObjectFile(name, code, functions, data, size_of_data, imports)
+
+
+def link_objects(objects: list[ObjectFile], entry: str = "main") -> list[Instructions]:
+    """
+    The code of the program made of the objects, which starts by calling
+    entry. The functions and the globals follow each other in the order of
+    the objects, so a single object links to the code of its program. Only
+    the functions entry calls, directly or not, are linked, and the work is
+    proportional to the code linked rather than to the objects.
+
+    The result is code like CompilationResult.to_code() returns; every
+    instruction with a label is a copy, as interpreting an instruction
+    resolves its label in place
+    """
+    # symbol -> object defining it, base address of its data
+    definitions: dict[str, tuple[ObjectFile, int]] = {}
+    base = 0
+    for unit in objects:
+        for symbol in [*unit.functions, *unit.data]:
+            if symbol in definitions:
+                raise Exception(f"{symbol} is defined by {definitions[symbol][0].name} and {unit.name}")
+            definitions[symbol] = (unit, base)
+        base += unit.size_of_data
+    for unit in objects:
+        for (symbol, declared) in unit.imports.items():
+            if symbol not in definitions:
+                raise Exception(f"{symbol}, which {unit.name} imports, is not defined")
+            (owner, _) = definitions[symbol]
+            if owner.type(symbol) != declared:
+                raise Exception(f"{symbol} is {declared} in {unit.name} but {owner.type(symbol)} in {owner.name}")
+    if entry not in definitions or entry not in definitions[entry][0].functions:
+        raise Exception(f"No function {entry}")
+
+    # the functions entry reaches, in the order of the objects
+    linked = [entry]
+    reached = {entry}
+    for function in linked:
+        for symbol in definitions[function][0].references[function]:
+            if symbol not in reached:
+                reached.add(symbol)
+                linked.append(symbol)
+    order = {id(unit): k for (k, unit) in enumerate(objects)}
+    linked.sort(key=lambda function: (order[id(definitions[function][0])], definitions[function][0].functions[function][0]))
+
+    code = Program.prologue(base)
+    code[3] = I1P(I1P.I.LOADC, entry)
+    for function in linked:
+        (unit, _) = definitions[function]
+        (start, end, _) = unit.functions[function]
+        offset = len(code) - start
+        code += [I1P(i.instruction, i.param1) if type(getattr(i, "param1", None)) == str else i for i in unit.code[start:end]]
+        for (k, symbol) in unit.relocations[function]:
+            (owner, base) = definitions[symbol]
+            code[offset + k] = I1P(I1P.I.LOADC, base + owner.data[symbol][0])
+    return code
+
+
+if __name__ == '__main__':
+    from time import perf_counter
+    from Parser import parse_unit
+    from Interpreter import Interpreter
+
+    library = compile_object(parse_unit("""
+int calls;
+int square(int x) { calls = calls + 1; return x * x; }
+int cube(int x) { return x * square(x); }
+int fib(int n) { if (n <= 1) return n; else return fib(n - 1) + fib(n - 2); }
+""", "library.c"), "library")
+    print(library)
+
+    start = perf_counter()
+    programs = []
+    for k in range(1000):
+        program = compile_object(parse_unit(f"""
+extern int calls;
+int cube(int x);
+int main() {{ int r; calls = 0; r = cube({k % 10}) + calls; return r; }}
+""", f"program{k}.c"), f"program{k}")
+        programs.append(link_objects([program, library]))
+    print(f"compiled and linked {len(programs)} programs in {perf_counter() - start:.4f}s, "
+          f"{len(programs[0])} instructions each")
+
+    interpreter = Interpreter(programs[7])
+    interpreter.run()
+    print(f"main returned {interpreter.stack.stack[0]}")
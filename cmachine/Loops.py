@@ -0,0 +1,187 @@
+from __future__ import annotations
+import copy
+from typing import Callable, Optional
+
+from ASTNode import ASTNode
+from Instructions import Instructions0Params as I0P
+from Nodes import (Program, FunctionDefinition, StatementSequence, DeclareVariable, DeclareStruct, If, IfElse,
+                   While, For, Return, Free, Assignment, AddressOf, StructAccess, Variable, BinaryOperation,
+                   UnaryOperator, is_pure)
+
+
+def children(node: ASTNode) -> list[ASTNode]:
+    nodes = []
+    for value in vars(node).values():
+        if isinstance(value, ASTNode):
+            nodes.append(value)
+        elif isinstance(value, (list, tuple)):
+            nodes += [v for v in value if isinstance(v, ASTNode)]
+    return nodes
+
+
+def walk(node: ASTNode):
+    """The node and all nodes below it"""
+    pending = [node]
+    while pending:
+        node = pending.pop()
+        yield node
+        pending += children(node)
+
+
+def root(node: ASTNode) -> Optional[str]:
+    """The variable an L-value is part of, if it is no memory reached through a pointer"""
+    while type(node) == StructAccess:
+        node = node.struct_name
+    return node.name if type(node) == Variable else None
+
+
+def every_iteration(statement: ASTNode, rewrite: Callable[[ASTNode], ASTNode]) -> tuple[ASTNode, bool]:
+    """
+    Rewrites the expressions the statement evaluates whenever it runs, up to
+    a statement that may return. Returns the statement and whether the
+    statements after it always run too
+    """
+    kind = type(statement)
+    if kind == StatementSequence:
+        nodes = list(statement.nodes)
+        for (k, node) in enumerate(nodes):
+            (nodes[k], after) = every_iteration(node, rewrite)
+            if not after:
+                break
+        statement.nodes = tuple(nodes)
+        return (statement, after if nodes else True)
+    if kind in (DeclareVariable, DeclareStruct):
+        (statement.ss, after) = every_iteration(statement.ss, rewrite)
+        return (statement, after)
+    if kind in (If, IfElse):
+        statement.condition = rewrite(statement.condition)
+    elif kind == While:
+        statement.guard = rewrite(statement.guard)
+    elif kind == For:
+        statement.initialization = rewrite(statement.initialization)
+        statement.guard = rewrite(statement.guard)
+    elif kind == Free:
+        statement.pointer = rewrite(statement.pointer)
+    elif kind == Return:
+        statement.value = rewrite(statement.value)
+        return (statement, False)
+    else:
+        return (rewrite(statement), True)
+    return (statement, not any(type(node) == Return for node in walk(statement)))
+
+
+class Hoisting:
+    """
+    Moves the expressions of a function that compute the same in every
+    iteration of a loop out of it, into variables the loop assigns once it
+    is entered. Such an expression is pure, divides by nothing and reads only
+    locals that the loop does not assign and whose address is never taken.
+    It is hoisted only if every iteration evaluates it, so that it is not
+    computed where the loop would not have computed it.
+    """
+
+    def __init__(self, function: FunctionDefinition, report: list[str]):
+        self.report = report
+        self.temporaries = 0
+        self.addressed = {root(node.a) for node in walk(function.body) if type(node) == AddressOf}
+
+    def statement(self, node: ASTNode, scope: frozenset[str]) -> ASTNode:
+        """The statement with the invariants of its loops hoisted, scope are the locals visible to it"""
+        kind = type(node)
+        if kind == StatementSequence:
+            node.nodes = tuple(self.statement(n, scope) for n in node.nodes)
+        elif kind in (DeclareVariable, DeclareStruct):
+            node.ss = self.statement(node.ss, scope | {node.name})
+        elif kind == If:
+            node.then = self.statement(node.then, scope)
+        elif kind == IfElse:
+            node.then = self.statement(node.then, scope)
+            node.else_ = self.statement(node.else_, scope)
+        elif kind in (While, For):
+            node.body = self.statement(node.body, scope)
+            return self.hoist(node, scope)
+        return node
+
+    def hoist(self, loop: While | For, scope: frozenset[str]) -> ASTNode:
+        changed = {root(node.left) for node in walk(loop) if type(node) == Assignment}
+        declared = {node.name for node in walk(loop) if type(node) in (DeclareVariable, DeclareStruct)}
+        constant = scope - changed - declared - self.addressed
+
+        def invariant(node: ASTNode) -> bool:
+            if type(node) not in (BinaryOperation, UnaryOperator) or not is_pure(node):
+                return False
+            for n in walk(node):
+                if type(n) == BinaryOperation and n.operator == I0P.I.DIV:
+                    return False
+                if type(n) == Variable and "(" not in n.type and n.name not in constant:
+                    return False
+            return True
+
+        temporaries: dict[str, Variable] = {}
+        hoisted: list[tuple[Variable, ASTNode]] = []
+
+        def replace(node: ASTNode) -> ASTNode:
+            if invariant(node):
+                key = f"{node}"
+                if key not in temporaries:
+                    self.temporaries += 1
+                    temporaries[key] = Variable(node.getType(), f"invariant.{self.temporaries}")
+                    hoisted.append((temporaries[key], node))
+                return temporaries[key]
+            for (name, value) in vars(node).items():
+                if isinstance(value, ASTNode):
+                    setattr(node, name, replace(value))
+                elif isinstance(value, (list, tuple)) and any(isinstance(v, ASTNode) for v in value):
+                    setattr(node, name, type(value)(replace(v) if isinstance(v, ASTNode) else v for v in value))
+            return node
+
+        # the entry test keeps the condition as it was, the temporaries are
+        # assigned once it passed
+        guard = copy.deepcopy(loop.guard)
+        loop.condition = replace(loop.condition)
+        (loop.body, _) = every_iteration(loop.body, replace)
+        if not hoisted:
+            return loop
+        loop.guard = guard
+        loop.invariants = [*loop.invariants, *(Assignment(variable, expression) for (variable, expression) in hoisted)]
+
+        result = loop
+        for (variable, expression) in hoisted:
+            self.report.append(f"Hoisted {expression} out of {'while' if type(loop) == While else 'for'} ({guard})")
+            result = DeclareVariable(variable.type, 1, 1, variable.name, StatementSequence(result))
+        return result
+
+
+def hoist_invariants(program: Program, report: list[str]) -> Program:
+    """Hoists the loop invariants of the functions of the program, in place. Every hoisted expression is described in report"""
+    for function in program.functions:
+        hoisting = Hoisting(function, report)
+        function.body = hoisting.statement(function.body, frozenset(arg.name for arg in function.args))
+    return program
+
+
+if __name__ == '__main__':
+    from Parser import parse
+    from Interpreter import Interpreter
+    from Output import ListSink
+
+    source = """
+int sum(int n, int w) {
+    int i; int j; int s;
+    s = 0;
+    for (i = 0; i < n - 1; i = i + 1) { j = 0; while (j < w) { s = s + i * w + j; j = j + 1; } }
+    return s;
+}
+int main() { return sum(30, 20); }
+"""
+    for hoist in [False, True]:
+        program = parse(source)
+        report: list[str] = []
+        program = program.simplify(report)
+        if hoist:
+            program = hoist_invariants(program, report)
+            print("\n".join(report))
+            print(program.functions[0])
+        interpreter = Interpreter(program.code({}, 0).to_code(), output=ListSink())
+        steps = interpreter.run_image()
+        print(f"{'hoisted' if hoist else 'as written'}: {interpreter.stack.stack[0]} in {steps} steps")
@@ -5,10 +5,13 @@ from ASTNode import ASTNode, makeCompilationResult
 from Instructions import Instructions0Params as I0P
 from enum import Enum
 from Instructions import Instructions1Params as I1P, bcolors
+from Context import Context
+from Units import compile_units
+from StackDepth import frame_depth
 
 NEWLINE = "\n"
 
-AdressSpace = dict[str, (chr, int)]
+AdressSpace = Context
 
 
 class Number(ASTNode):
@@ -26,14 +29,78 @@ class Number(ASTNode):
         space = "  " * indent
         return f"{space}{self.value}"
 
-    def getType(self):
+    def getType(self, types: Context = None):
         return "int"
 
 
-SIZEOF: dict[str, (int, int)] = {
-    "int": (1, 1),
+# Operators the simplification folds when both operands are constants
+FOLD = {
+    I0P.I.ADD: lambda a, b: a + b,
+    I0P.I.SUB: lambda a, b: a - b,
+    I0P.I.MUL: lambda a, b: a * b,
+    I0P.I.DIV: lambda a, b: a // b,
+    I0P.I.LEQ: lambda a, b: 1 if a <= b else 0,
+    I0P.I.GEQ: lambda a, b: 1 if a >= b else 0,
+    I0P.I.LT: lambda a, b: 1 if a < b else 0,
+    I0P.I.GT: lambda a, b: 1 if a > b else 0,
+    I0P.I.EQ: lambda a, b: 1 if a == b else 0,
 }
-# Shouldnt be global
+
+
+def is_constant(node: ASTNode, value: int = None) -> bool:
+    return type(node) == Number and type(node.value) == int and (value is None or node.value == value)
+
+
+def is_pure(node: ASTNode) -> bool:
+    """Whether evaluating the node has no effect besides computing its value"""
+    if type(node) in (Number, Variable):
+        return True
+    if type(node) == BinaryOperation:
+        return is_pure(node.left) and is_pure(node.right)
+    if type(node) == UnaryOperator:
+        return is_pure(node.node)
+    return False
+
+
+def block_size(types: Context, type: str) -> int:
+    """The cells a value of the type takes, which are more than one for structs only"""
+    return types.size(type) if type in types.structs else 1
+
+
+def load_instruction(types: Context, type: str):
+    """The instruction replacing an address by the value of the type at it"""
+    size = block_size(types, type)
+    return I0P(I0P.I.LOAD) if size == 1 else I1P(I1P.I.LOADK, size)
+
+
+def always_returns(node: ASTNode, known: dict[int, bool]) -> bool:
+    """
+    Whether running the statement always ends with a return. known holds the
+    answers for the nodes asked about before, by their id, so asking for
+    every declaration around the rest of a block takes linear time
+    """
+    pending = [node]
+    while pending:
+        statement = pending[-1]
+        if id(statement) in known:
+            pending.pop()
+            continue
+        kind = type(statement)
+        if kind == StatementSequence:
+            parts = statement.nodes[-1:]
+        elif kind in (DeclareVariable, DeclareStruct):
+            parts = (statement.ss,)
+        elif kind == IfElse:
+            parts = (statement.then, statement.else_)
+        else:
+            parts = ()
+        missing = [part for part in parts if id(part) not in known]
+        if missing:
+            pending += missing
+            continue
+        pending.pop()
+        known[id(statement)] = kind == Return or (len(parts) > 0 and all(known[id(part)] for part in parts))
+    return known[id(node)]
 
 
 class Variable(ASTNode):
@@ -47,11 +114,10 @@ class Variable(ASTNode):
             code = [I1P(I1P.I.LOADC, addressSpace[self.name][1])]
             return makeCompilationResult(code, f"CodeR for {self.name}", self)
 
-        (_, arraySize) = SIZEOF[self.name]
-        if arraySize > 1:
+        if addressSpace[self.name][2] > 1:
             code = self.codeL(addressSpace, n)
         else:
-            code = [self.codeL(addressSpace, n), I0P(I0P.I.LOAD)]
+            code = [self.codeL(addressSpace, n), load_instruction(addressSpace, self.type)]
 
         return makeCompilationResult(code, f"CodeR for {self.name}", self)
 
@@ -67,7 +133,7 @@ class Variable(ASTNode):
         space = "  " * indent
         return f"{space}{bcolors.OKCYAN+self.name+bcolors.ENDC}"
 
-    def getType(self):
+    def getType(self, types: Context = None):
         return self.type
 
 
@@ -80,17 +146,27 @@ class UnaryOperator(ASTNode):
     def codeR(self, addressSpace: AdressSpace, n):
         code = [self.node.codeR(addressSpace, n), I0P(self.operator)]
 
-        makeCompilationResult(code, f"CodeR for {self.operator}", self)
+        return makeCompilationResult(code, f"CodeR for {self.operator}", self)
 
     def codeL(self, addressSpace: AdressSpace, n):
         raise Exception("Cannot load L-value of a unary operator")
 
+    def simplify(self, report: list[str]):
+        self.node = self.node.simplify(report)
+        if is_constant(self.node) and self.operator in (I0P.I.NEG, I0P.I.NOT):
+            value = self.node.value
+            folded = Number(-value if self.operator == I0P.I.NEG else 1 if value == 0 else 0)
+            report.append(f"Folded {self} to {folded}")
+            return folded
+        return self
+
     def pretty_print(self, indent=0):
         space = "  " * indent
-        return f"{space}({self.operator.value} {self.node})"
+        operator = "-" if self.operator == I0P.I.NEG else self.operator.value
+        return f"{space}({operator} {self.node})"
 
-    def getType(self):
-        raise Exception("Cannot get type of a unary operator")
+    def getType(self, types: Context = None):
+        return self.node.getType(types) if self.operator == I0P.I.NEG else "int"
 
 
 class BinaryOperation(ASTNode):
@@ -108,12 +184,35 @@ class BinaryOperation(ASTNode):
     def codeL(self, addressSpace: AdressSpace, n):
         raise Exception("Cannot load L-value of a binary operator")
 
+    def simplify(self, report: list[str]):
+        self.left = self.left.simplify(report)
+        self.right = self.right.simplify(report)
+        left, right, operator = self.left, self.right, self.operator
+
+        if is_constant(left) and is_constant(right) and operator in FOLD:
+            if operator == I0P.I.DIV and right.value == 0:
+                return self
+            folded = Number(FOLD[operator](left.value, right.value))
+            report.append(f"Folded {self} to {folded}")
+            return folded
+
+        if (operator in (I0P.I.ADD, I0P.I.SUB) and is_constant(right, 0)) or (operator in (I0P.I.MUL, I0P.I.DIV) and is_constant(right, 1)):
+            report.append(f"Simplified {self} to {left}")
+            return left
+        if (operator == I0P.I.ADD and is_constant(left, 0)) or (operator == I0P.I.MUL and is_constant(left, 1)):
+            report.append(f"Simplified {self} to {right}")
+            return right
+        if operator == I0P.I.MUL and ((is_constant(right, 0) and is_pure(left)) or (is_constant(left, 0) and is_pure(right))):
+            report.append(f"Simplified {self} to 0")
+            return Number(0)
+        return self
+
     def pretty_print(self, indent=0):
         space = "  " * indent
         return f"{space}({self.left} {self.operator.value} {self.right})"
 
-    def getType(self):
-        return self.left.getType()
+    def getType(self, types: Context = None):
+        return self.left.getType(types)
 
 
 class Assignment(ASTNode):
@@ -122,20 +221,38 @@ class Assignment(ASTNode):
         self.left = left
         self.right = right
 
+    def code(self, addressSpace: AdressSpace, n):
+        size = block_size(addressSpace, self.left.getType(addressSpace))
+        if size == 1:
+            return super().code(addressSpace, n)
+        # a struct whose value is not used is copied from memory to memory
+        if type(self.right) in (Variable, Dereference, ArrayAccess, StructAccess, Arrow):
+            code = [self.right.codeL(addressSpace, n), self.left.codeL(addressSpace, n), I1P(I1P.I.MOVE, size)]
+        else:
+            code = [self.codeR(addressSpace, n), I1P(I1P.I.ALLOC, -size)]
+        return makeCompilationResult(code, f"Code for assignment", self)
+
     def codeR(self, addressSpace: AdressSpace, n):
+        size = block_size(addressSpace, self.left.getType(addressSpace))
+        store = I0P(I0P.I.STORE) if size == 1 else I1P(I1P.I.STOREK, size)
         code = [self.right.codeR(addressSpace, n),
-                self.left.codeL(addressSpace, n), I0P(I0P.I.STORE)]
+                self.left.codeL(addressSpace, n), store]
         return makeCompilationResult(code, f"CodeR for assignment", self)
 
     def codeL(self, addressSpace: AdressSpace, n):
         raise Exception("Cannot load L-value of an assignment")
 
+    def simplify(self, report: list[str]):
+        self.left = self.left.simplify(report)
+        self.right = self.right.simplify(report)
+        return self
+
     def pretty_print(self, indent=0):
         space = "  " * indent
         return f"{space}{self.left} = {self.right}"
 
-    def getType(self):
-        return self.left.getType()
+    def getType(self, types: Context = None):
+        return self.left.getType(types)
 
 
 class Print(ASTNode):
@@ -149,11 +266,15 @@ class Print(ASTNode):
     def codeL(self, addressSpace: AdressSpace, n):
         raise Exception("Cannot load L-value of a print")
 
+    def simplify(self, report: list[str]):
+        self.node = self.node.simplify(report)
+        return self
+
     def pretty_print(self, indent=0):
         space = "  " * indent
         return f"{space}print({self.node});"
 
-    def getType(self):
+    def getType(self, types: Context = None):
         return "void"
 
 
@@ -174,12 +295,16 @@ class Comma(ASTNode):
     def codeL(self, addressSpace: AdressSpace, n):
         raise Exception("Cannot load L-value of a comma")
 
+    def simplify(self, report: list[str]):
+        self.nodes = tuple(node.simplify(report) for node in self.nodes)
+        return self
+
     def pretty_print(self, indent):
         space = "  " * indent
         return f"{space}{', '.join([f'{node}' for node in self.nodes])}"
 
-    def getType(self):
-        return self.nodes[-1].getType()
+    def getType(self, types: Context = None):
+        return self.nodes[-1].getType(types)
 
 
 class StatementSequence(ASTNode):
@@ -198,14 +323,15 @@ class StatementSequence(ASTNode):
     def codeL(self, addressSpace: AdressSpace, n):
         raise Exception("Cannot load L-value of a statement sequence")
 
+    def simplify(self, report: list[str]):
+        self.nodes = tuple(node.simplify(report) for node in self.nodes)
+        return self
+
     def pretty_print(self, indent):
         return f"{NEWLINE.join([f'{node.pretty_print(indent)}' for node in self.nodes])}"
 
-    def getType(self):
-        return self.nodes[-1].getType()
-
-
-LABEL_COUNTER = 0
+    def getType(self, types: Context = None):
+        return self.nodes[-1].getType(types)
 
 
 def base10ToBase26Letter_A_is_ONE(num):  # 1-based
@@ -223,10 +349,17 @@ def base10ToBase26Letter_A_is_ONE(num):  # 1-based
     return s[::-1]
 
 
-def label_generator():
-    global LABEL_COUNTER
-    LABEL_COUNTER += 1
-    return f"{base10ToBase26Letter_A_is_ONE(LABEL_COUNTER)}"
+def print_invariants(invariants: list[ASTNode], indent: int) -> str:
+    """The statements a loop runs once it is entered, on a line of their own"""
+    if not invariants:
+        return ""
+    return f"{NEWLINE}{'  ' * indent}once: {', '.join(f'{invariant}' for invariant in invariants)}"
+
+
+def label_generator(addressSpace: AdressSpace):
+    """A new label, named after the unit of code being compiled"""
+    addressSpace.labels += 1
+    return f"{addressSpace.prefix}{base10ToBase26Letter_A_is_ONE(addressSpace.labels)}"
 
 
 class If(ASTNode):
@@ -235,7 +368,7 @@ class If(ASTNode):
         self.then = then
 
     def code(self, addressSpace: AdressSpace, n):
-        A = label_generator()
+        A = label_generator(addressSpace)
         code = [self.condition.codeR(addressSpace, n), I1P(
             I1P.I.JUMPZ, A), self.then.code(addressSpace, n), I1P(I1P.I.JUMP_TARGET, A)]
         return makeCompilationResult(code, f"Code for if", self)
@@ -246,11 +379,22 @@ class If(ASTNode):
     def codeL(self, addressSpace: AdressSpace, n):
         raise Exception("Cannot load L-value of an if statement")
 
+    def simplify(self, report: list[str]):
+        self.condition = self.condition.simplify(report)
+        self.then = self.then.simplify(report)
+        if is_constant(self.condition):
+            if self.condition.value != 0:
+                report.append(f"Replaced if ({self.condition}) by its body")
+                return self.then
+            report.append(f"Removed if ({self.condition})")
+            return StatementSequence()
+        return self
+
     def pretty_print(self, indent):
         space = "  " * indent
         return f"{space}{bcolors.OKORANGE}if{bcolors.ENDC} ({self.condition}):{NEWLINE}{self.then.pretty_print(indent+1)}"
 
-    def getType(self):
+    def getType(self, types: Context = None):
         raise Exception("Cannot get type of an if statement")
 
 
@@ -261,8 +405,8 @@ class IfElse(ASTNode):
         self.else_ = else_
 
     def code(self, addressSpace: AdressSpace, n):
-        A = label_generator()
-        B = label_generator()
+        A = label_generator(addressSpace)
+        B = label_generator(addressSpace)
         code = [self.condition.codeR(addressSpace, n), I1P(I1P.I.JUMPZ, A), self.then.code(addressSpace, n), I1P(
             I1P.I.JUMP, B), I1P(I1P.I.JUMP_TARGET, A), self.else_.code(addressSpace, n), I1P(I1P.I.JUMP_TARGET, B)]
         return makeCompilationResult(code, f"Code for if else", self)
@@ -273,11 +417,23 @@ class IfElse(ASTNode):
     def codeL(self, addressSpace: AdressSpace, n):
         raise Exception("Cannot load L-value of an if statement")
 
+    def simplify(self, report: list[str]):
+        self.condition = self.condition.simplify(report)
+        self.then = self.then.simplify(report)
+        self.else_ = self.else_.simplify(report)
+        if is_constant(self.condition):
+            if self.condition.value != 0:
+                report.append(f"Replaced if ({self.condition}) else by its then branch")
+                return self.then
+            report.append(f"Replaced if ({self.condition}) else by its else branch")
+            return self.else_
+        return self
+
     def pretty_print(self, indent):
         space = "  " * indent
         return f"{space}{bcolors.OKORANGE}if{bcolors.ENDC} ({self.condition}):{NEWLINE}{self.then.pretty_print(indent+1)}{NEWLINE}{space}{bcolors.OKORANGE}else{bcolors.ENDC}:{NEWLINE}{self.else_.pretty_print(indent+1)}"
 
-    def getType(self):
+    def getType(self, types: Context = None):
         raise Exception("Cannot get type of an if statement")
 
 
@@ -285,12 +441,19 @@ class While(ASTNode):
     def __init__(self, condition: ASTNode, body: ASTNode):
         self.condition = condition
         self.body = body
+        # the condition tested on entering the loop and the statements run
+        # then, see Loops.py. The condition is tested after every iteration
+        self.guard = condition
+        self.invariants: list[ASTNode] = []
 
     def code(self, addressSpace: AdressSpace, n):
-        A = label_generator()
-        B = label_generator()
-        code = [I1P(I1P.I.JUMP_TARGET, A), self.condition.codeR(addressSpace, n), I1P(I1P.I.JUMPZ, B),
-                self.body.code(addressSpace, n), I1P(I1P.I.JUMP, A), I1P(I1P.I.JUMP_TARGET, B)]
+        A = label_generator(addressSpace)
+        B = label_generator(addressSpace)
+        # the condition is tested at the bottom, so an iteration takes no JUMP
+        code = [self.guard.codeR(addressSpace, n), I1P(I1P.I.JUMPZ, B),
+                *[invariant.code(addressSpace, n) for invariant in self.invariants],
+                I1P(I1P.I.JUMP_TARGET, A), self.body.code(addressSpace, n),
+                self.condition.codeR(addressSpace, n), I1P(I1P.I.JUMPNZ, A), I1P(I1P.I.JUMP_TARGET, B)]
         return makeCompilationResult(code, f"Code for while", self)
 
     def codeR(self, addressSpace: AdressSpace, n):
@@ -299,11 +462,22 @@ class While(ASTNode):
     def codeL(self, addressSpace: AdressSpace, n):
         raise Exception("Cannot load L-value of a while statement")
 
+    def simplify(self, report: list[str]):
+        guarded = self.guard is not self.condition
+        self.condition = self.condition.simplify(report)
+        self.guard = self.guard.simplify(report) if guarded else self.condition
+        self.invariants = [invariant.simplify(report) for invariant in self.invariants]
+        self.body = self.body.simplify(report)
+        if is_constant(self.guard, 0):
+            report.append(f"Removed while ({self.guard})")
+            return StatementSequence()
+        return self
+
     def pretty_print(self, indent):
         space = "  " * indent
-        return f"{space}{bcolors.OKORANGE}while{bcolors.ENDC} ({self.condition}):{NEWLINE}{self.body.pretty_print(indent+1)}"
+        return f"{space}{bcolors.OKORANGE}while{bcolors.ENDC} ({self.condition}):{print_invariants(self.invariants, indent + 1)}{NEWLINE}{self.body.pretty_print(indent+1)}"
 
-    def getType(self):
+    def getType(self, types: Context = None):
         raise Exception("Cannot get type of a while statement")
 
 
@@ -313,13 +487,18 @@ class For(ASTNode):
         self.condition = condition
         self.increment = increment
         self.body = body
+        # as for While
+        self.guard = condition
+        self.invariants: list[ASTNode] = []
 
     def code(self, addressSpace: AdressSpace, n):
-        A = label_generator()
-        B = label_generator()
+        A = label_generator(addressSpace)
+        B = label_generator(addressSpace)
 
-        code = [self.initialization.codeR(addressSpace, n), I0P(I0P.I.POP), I1P(I1P.I.JUMP_TARGET, A), self.condition.codeR(addressSpace, n), I1P(
-            I1P.I.JUMPZ, B), self.body.code(addressSpace, n), self.increment.codeR(addressSpace, n), I0P(I0P.I.POP), I1P(I1P.I.JUMP, A), I1P(I1P.I.JUMP_TARGET, B)]
+        code = [self.initialization.code(addressSpace, n), self.guard.codeR(addressSpace, n), I1P(I1P.I.JUMPZ, B),
+                *[invariant.code(addressSpace, n) for invariant in self.invariants],
+                I1P(I1P.I.JUMP_TARGET, A), self.body.code(addressSpace, n), self.increment.code(addressSpace, n),
+                self.condition.codeR(addressSpace, n), I1P(I1P.I.JUMPNZ, A), I1P(I1P.I.JUMP_TARGET, B)]
 
         return makeCompilationResult(code, f"Code for for", self)
 
@@ -329,11 +508,24 @@ class For(ASTNode):
     def codeL(self, addressSpace: AdressSpace, n):
         raise Exception("Cannot load L-value of a for statement")
 
+    def simplify(self, report: list[str]):
+        guarded = self.guard is not self.condition
+        self.initialization = self.initialization.simplify(report)
+        self.condition = self.condition.simplify(report)
+        self.guard = self.guard.simplify(report) if guarded else self.condition
+        self.invariants = [invariant.simplify(report) for invariant in self.invariants]
+        self.increment = self.increment.simplify(report)
+        self.body = self.body.simplify(report)
+        if is_constant(self.guard, 0):
+            report.append(f"Replaced for ({self.initialization}; {self.guard}; ...) by its initialization")
+            return self.initialization
+        return self
+
     def pretty_print(self, indent):
         space = "  " * indent
-        return f"{space}{bcolors.OKORANGE}for{bcolors.ENDC} ({self.initialization}; {self.condition}; {self.increment}):{NEWLINE}{self.body.pretty_print(indent+1)}"
+        return f"{space}{bcolors.OKORANGE}for{bcolors.ENDC} ({self.initialization}; {self.condition}; {self.increment}):{print_invariants(self.invariants, indent + 1)}{NEWLINE}{self.body.pretty_print(indent+1)}"
 
-    def getType(self):
+    def getType(self, types: Context = None):
         raise Exception("Cannot get type of a for statement")
 
 
@@ -346,13 +538,15 @@ class DeclareVariable(ASTNode):
         self.ss = ss
 
     def code(self, addressSpace: AdressSpace, n):
-        newAdressSpace = addressSpace.copy()
         totalSize = self.typeSize * self.arraySize
-        newAdressSpace[self.name] = ('L', n)
-        SIZEOF[self.type] = (self.typeSize, 1)
-        SIZEOF[self.name] = (self.typeSize, self.arraySize)
-        code = [I1P(I1P.I.ALLOC, totalSize),
-                self.ss.code(newAdressSpace, n + totalSize)]
+        addressSpace.sizes[self.type] = self.typeSize
+        with addressSpace.bind((self.name, ('L', n, self.arraySize))):
+            code = [I1P(I1P.I.ALLOC, totalSize),
+                    self.ss.code(addressSpace, n + totalSize)]
+        # the cells are freed where the scope ends, so loops and branches
+        # leave the stack as they found it
+        if not always_returns(self.ss, addressSpace.returns):
+            code.append(I1P(I1P.I.ALLOC, -totalSize))
         return makeCompilationResult(code, f"Code for declaration", self)
 
     def codeR(self, addressSpace: AdressSpace, n):
@@ -361,18 +555,18 @@ class DeclareVariable(ASTNode):
     def codeL(self, addressSpace: AdressSpace, n):
         raise Exception("Cannot load L-value of a declaration")
 
+    def simplify(self, report: list[str]):
+        self.ss = self.ss.simplify(report)
+        return self
+
     def pretty_print(self, indent):
         space = "  " * indent
         return f"{space}{bcolors.OKMAGENTA}{self.type}{bcolors.ENDC}{f'[{self.arraySize}]' if self.arraySize !=1 else ''} {bcolors.OKCYAN}{self.name}{bcolors.ENDC};{NEWLINE}{self.ss.pretty_print(indent)}"
 
-    def getType(self):
+    def getType(self, types: Context = None):
         return self.type
 
 
-# Shouldnt be global
-STRUCT_ADRESS_SPACES: dict[str, dict[str, (str, int)]] = {}
-
-
 class DeclareStruct(ASTNode):
     def __init__(self, type: str, body: list[DeclareVariable], name: str, ss: ASTNode):
         self.type = type
@@ -381,19 +575,12 @@ class DeclareStruct(ASTNode):
         self.ss = ss
 
     def code(self, addressSpace: AdressSpace, n):
-        newAdressSpace = addressSpace.copy()
-        structAdressSpace = {}
-        currentOffset = 0
-        for variable in self.body:
-            structAdressSpace[variable.name] = (variable.type, currentOffset)
-            currentOffset += variable.typeSize * variable.arraySize
-            SIZEOF[variable.type] = (variable.typeSize, variable.arraySize)
-            SIZEOF[variable.name] = (variable.typeSize, variable.arraySize)
-        STRUCT_ADRESS_SPACES[self.type] = structAdressSpace
-        SIZEOF[self.type] = (currentOffset, 1)
-        newAdressSpace[self.name] = ('L', n)
-        code = [I1P(I1P.I.ALLOC, currentOffset),
-                self.ss.code(newAdressSpace, n + currentOffset)]
+        currentOffset = addressSpace.declare_struct(self.type, self.body)
+        with addressSpace.bind((self.name, ('L', n, 1))):
+            code = [I1P(I1P.I.ALLOC, currentOffset),
+                    self.ss.code(addressSpace, n + currentOffset)]
+        if not always_returns(self.ss, addressSpace.returns):
+            code.append(I1P(I1P.I.ALLOC, -currentOffset))
         return makeCompilationResult(code, f"Code for struct declaration", self)
 
     def codeR(self, addressSpace: AdressSpace, n):
@@ -402,6 +589,10 @@ class DeclareStruct(ASTNode):
     def codeL(self, addressSpace: AdressSpace, n):
         raise Exception("Cannot load L-value of a struct")
 
+    def simplify(self, report: list[str]):
+        self.ss = self.ss.simplify(report)
+        return self
+
     def pretty_print(self, indent):
         space = "  " * indent
         bracket_open = "{"
@@ -410,8 +601,8 @@ class DeclareStruct(ASTNode):
                            for variable in self.body])
         return f"{space}{bcolors.OKORANGE}struct{bcolors.ENDC} {self.type} {bracket_open}{NEWLINE}{children}{bracket_close} {self.name}{NEWLINE}{self.ss.pretty_print(indent)}"
 
-    def getType(self):
-        return self.getType
+    def getType(self, types: Context = None):
+        return self.type
 
 
 class ArrayAccess(ASTNode):
@@ -420,21 +611,26 @@ class ArrayAccess(ASTNode):
         self.e2 = e2
 
     def codeL(self, addressSpace: AdressSpace, n):
-        typeSize = SIZEOF[self.e1.getType()][0]
+        typeSize = addressSpace.size(self.e1.getType(addressSpace))
         code = [self.e1.codeR(addressSpace, n), self.e2.codeR(addressSpace, n),
                 I1P(I1P.I.LOADC, typeSize), I0P(I0P.I.MUL), I0P(I0P.I.ADD)]
         return makeCompilationResult(code, f"CodeL for array access", self)
 
     def codeR(self, addressSpace: AdressSpace, n):
-        code = [self.codeL(addressSpace, n), I0P(I0P.I.LOAD)]
+        code = [self.codeL(addressSpace, n), load_instruction(addressSpace, self.getType(addressSpace))]
         return makeCompilationResult(code, f"CodeR for array access", self)
 
+    def simplify(self, report: list[str]):
+        self.e1 = self.e1.simplify(report)
+        self.e2 = self.e2.simplify(report)
+        return self
+
     def pretty_print(self, indent):
         space = "  " * indent
         return f"{space}{self.e1}[{self.e2}]"
 
-    def getType(self):
-        return self.e1.getType().replace("*", "")
+    def getType(self, types: Context = None):
+        return self.e1.getType(types).replace("*", "")
 
 
 class StructAccess(ASTNode):
@@ -443,22 +639,26 @@ class StructAccess(ASTNode):
         self.member_name = member_name
 
     def codeL(self, addressSpace: AdressSpace, n):
-        structAdressSpace = STRUCT_ADRESS_SPACES.get(self.struct_name.name)
+        structAdressSpace = addressSpace.structs[self.struct_name.getType(addressSpace)]
         offset = structAdressSpace[self.member_name][1]
         code = [self.struct_name.codeL(addressSpace, n),
                 I1P(I1P.I.LOADC, offset), I0P(I0P.I.ADD)]
         return makeCompilationResult(code, f"CodeL for struct access", self)
 
     def codeR(self, addressSpace: AdressSpace, n):
-        code = [self.codeL(addressSpace, n), I0P(I0P.I.LOAD)]
+        structAdressSpace = addressSpace.structs[self.struct_name.getType(addressSpace)]
+        if structAdressSpace[self.member_name][2] > 1:
+            code = self.codeL(addressSpace, n)
+        else:
+            code = [self.codeL(addressSpace, n), load_instruction(addressSpace, self.getType(addressSpace))]
         return makeCompilationResult(code, f"CodeR for struct access", self)
 
     def pretty_print(self, indent):
         space = "  " * indent
         return f"{space}{self.struct_name}.{self.member_name}"
 
-    def getType(self):
-        return self.struct_name.getType().replace("*", "")
+    def getType(self, types: Context = None):
+        return types.structs[self.struct_name.getType(types)][self.member_name][0]
 
 
 class Malloc(ASTNode):
@@ -466,37 +666,73 @@ class Malloc(ASTNode):
         self.size = size
 
     def codeR(self, addressSpace: AdressSpace, n):
-        return [self.size.codeR(addressSpace, n), I0P(I0P.I.NEW)]
+        code = [self.size.codeR(addressSpace, n), I0P(I0P.I.NEW)]
+        return makeCompilationResult(code, f"CodeR for malloc", self)
 
     def codeL(self, addressSpace: AdressSpace, n):
         raise Exception("Cannot load L-value of a malloc")
 
+    def simplify(self, report: list[str]):
+        self.size = self.size.simplify(report)
+        return self
+
     def pretty_print(self, indent):
         space = "  " * indent
         return f"{space}{bcolors.OKRED}malloc{bcolors.ENDC}({self.size})"
 
-    def getType(self):
+    def getType(self, types: Context = None):
         return "void*"
 
 
+class Free(ASTNode):
+    def __init__(self, pointer: ASTNode):
+        self.pointer = pointer
+
+    def code(self, addressSpace: AdressSpace, n):
+        code = [self.pointer.codeR(addressSpace, n), I0P(I0P.I.FREE)]
+        return makeCompilationResult(code, f"Code for free", self)
+
+    def codeR(self, addressSpace: AdressSpace, n):
+        raise Exception("Cannot load R-value of a free")
+
+    def codeL(self, addressSpace: AdressSpace, n):
+        raise Exception("Cannot load L-value of a free")
+
+    def simplify(self, report: list[str]):
+        self.pointer = self.pointer.simplify(report)
+        return self
+
+    def pretty_print(self, indent=0):
+        space = "  " * indent
+        return f"{space}{bcolors.OKRED}free{bcolors.ENDC}({self.pointer});"
+
+    def getType(self, types: Context = None):
+        return "void"
+
+
 class Dereference(ASTNode):
     def __init__(self, a: ASTNode):
         self.a = a
 
     def codeR(self, addressSpace: AdressSpace, n):
-        code = [self.a.codeR(addressSpace, n), I0P(I0P.I.LOAD)]
+        code = [self.a.codeR(addressSpace, n), load_instruction(addressSpace, self.getType(addressSpace))]
         return makeCompilationResult(code, f"CodeR for dereference", self)
 
     def codeL(self, addressSpace: AdressSpace, n):
         code = [self.a.codeR(addressSpace, n)]
         return makeCompilationResult(code, f"CodeL for dereference", self)
 
+    def simplify(self, report: list[str]):
+        self.a = self.a.simplify(report)
+        return self
+
     def pretty_print(self, indent):
         space = "  " * indent
         return f"{space}*{self.a}"
 
-    def getType(self):
-        return self.a.getType().replace("*", "")
+    def getType(self, types: Context = None):
+        pointer = self.a.getType(types)
+        return pointer[:-1] if pointer.endswith("*") else pointer
 
 
 class AddressOf(ASTNode):
@@ -510,12 +746,16 @@ class AddressOf(ASTNode):
     def codeL(self, addressSpace: AdressSpace, n):
         raise Exception("Cannot load L-value of an address of")
 
+    def simplify(self, report: list[str]):
+        self.a = self.a.simplify(report)
+        return self
+
     def pretty_print(self, indent):
         space = "  " * indent
         return f"{space}&{self.a}"
 
-    def getType(self):
-        return self.a.getType() + "*"
+    def getType(self, types: Context = None):
+        return self.a.getType(types) + "*"
 
 
 class Arrow(ASTNode):
@@ -524,24 +764,24 @@ class Arrow(ASTNode):
         self.member_name = member_name
 
     def codeR(self, addressSpace: AdressSpace, n):
-        (_, arraySize) = SIZEOF[self.member_name]
-        if arraySize > 1:
+        structAdressSpace = addressSpace.structs[self.a.getType(addressSpace).replace("*", "")]
+        if structAdressSpace[self.member_name][2] > 1:
             code = self.codeL(addressSpace, n)
         else:
-            code = [self.codeL(addressSpace, n), I0P(I0P.I.LOAD)]
+            code = [self.codeL(addressSpace, n), load_instruction(addressSpace, self.getType(addressSpace))]
         return makeCompilationResult(code, f"CodeR for arrow", self)
 
     def codeL(self, addressSpace: AdressSpace, n):
         code = [self.a.codeR(addressSpace, n), I1P(I1P.I.LOADC,
-                                                   STRUCT_ADRESS_SPACES[self.a.type.replace("*", "")][self.member_name][1]), I0P(I0P.I.ADD)]
+                                                   addressSpace.structs[self.a.getType(addressSpace).replace("*", "")][self.member_name][1]), I0P(I0P.I.ADD)]
         return makeCompilationResult(code, f"CodeL for arrow", self)
 
     def pretty_print(self, indent):
         space = "  " * indent
         return f"{space}{self.a}->{self.member_name}"
 
-    def getType(self):
-        return STRUCT_ADRESS_SPACES[self.a.type.replace("*", "")][self.member_name][0]
+    def getType(self, types: Context = None):
+        return types.structs[self.a.getType(types).replace("*", "")][self.member_name][0]
 
 
 class FunctionDefinition(ASTNode):
@@ -552,19 +792,24 @@ class FunctionDefinition(ASTNode):
         self.body = body
 
     def code(self, addressSpace: AdressSpace, n):
-        _f = label_generator()
-        addressSpace[self.name] = ('G', _f)
-        newAdressSpace = addressSpace.copy()
+        addressSpace[self.name] = ('G', self.name)
+        bindings = []
         argOffset = 0
         for arg in self.args:
-            argOffset += SIZEOF[arg.getType()][0]
-            newAdressSpace[arg.name] = ('L', -2 - argOffset)
-            SIZEOF[arg.type] = (SIZEOF[arg.getType()][0], 1)
-            SIZEOF[arg.name] = (SIZEOF[arg.getType()][0], 1)
-        SIZEOF[self.name] = (1, 1)
-        code = [I1P(I1P.I.JUMP_TARGET, _f), I1P(I1P.I.ENTER, 500),
-                self.body.code(newAdressSpace, 1), I0P(I0P.I.RETURN)]
-        return makeCompilationResult(code, f"Code for function definition", self)
+            argOffset += arg.typeSize
+            bindings.append((arg.name, ('L', -2 - argOffset, 1)))
+            addressSpace.sizes[arg.type] = arg.typeSize
+        enter = I1P(I1P.I.ENTER, 0)
+        (parameters, addressSpace.parameters) = (addressSpace.parameters, argOffset)
+        try:
+            with addressSpace.bind(*bindings):
+                code = [I1P(I1P.I.JUMP_TARGET, self.name), enter,
+                        self.body.code(addressSpace, 1), I0P(I0P.I.RETURN)]
+        finally:
+            addressSpace.parameters = parameters
+        result = makeCompilationResult(code, f"Code for function definition", self)
+        enter.param1 = frame_depth(result.to_code())
+        return result
 
     def codeR(self, addressSpace: AdressSpace, n):
         raise Exception("Cannot load R-value of a function definition")
@@ -572,13 +817,17 @@ class FunctionDefinition(ASTNode):
     def codeL(self, addressSpace: AdressSpace, n):
         raise Exception("Cannot load L-value of a function definition")
 
+    def simplify(self, report: list[str]):
+        self.body = self.body.simplify(report)
+        return self
+
     def pretty_print(self, indent):
         space = "  " * indent
         # return f"{space}{bcolors.OKMAGENTA+self.type+bcolors.ENDC} {bcolors.OKRED+self.name+bcolors.ENDC} ({', '.join([str(arg).replace("\n","") for arg in self.args])}){NEWLINE}{self.body.pretty_print(indent+1)}"
 
         return f"{space}{bcolors.OKMAGENTA+self.type+bcolors.ENDC} {bcolors.OKRED+self.name+bcolors.ENDC} ({', '.join([str(arg).replace(NEWLINE, '') for arg in self.args])}){NEWLINE}{self.body.pretty_print(indent+1)}"
 
-    def getType(self):
+    def getType(self, types: Context = None):
         return self.type
 
 
@@ -592,20 +841,41 @@ class FunctionCall(ASTNode):
         parameter_size = 0
         for arg in reversed(self.args):
             instructions.append(arg.codeR(addressSpace, n))
-            parameter_size += SIZEOF[arg.getType()][0]
+            parameter_size += addressSpace.size(arg.getType(addressSpace))
+        if parameter_size == 0:
+            # the callee returns its value in the cell below the frame, as
+            # Program.prologue reserves it for main
+            instructions.append(I1P(I1P.I.ALLOC, 1))
         instructions += [I0P(I0P.I.MARK), self.function.codeR(addressSpace, n),
-                         I0P(I0P.I.CALL), I1P(I1P.I.SLIDE, parameter_size-1)]
+                         I0P(I0P.I.CALL), I1P(I1P.I.SLIDE, max(parameter_size - 1, 0))]
         code = instructions
         return makeCompilationResult(code, f"CodeR for function call", self)
 
+    def parameterSize(self, types: Context):
+        return sum(types.size(arg.getType(types)) for arg in self.args)
+
+    def codeTail(self, addressSpace: AdressSpace, n):
+        """
+        Code for a call in tail position, which reuses the frame of the calling
+        function. Only valid if the parameters of both have the same size
+        """
+        instructions = [arg.codeR(addressSpace, n) for arg in reversed(self.args)]
+        instructions += [self.function.codeR(addressSpace, n),
+                         I1P(I1P.I.TAILCALL, self.parameterSize(addressSpace))]
+        return makeCompilationResult(instructions, f"Code for tail call", self)
+
     def codeL(self, addressSpace: AdressSpace, n):
         raise Exception("Cannot load L-value of a function call")
 
+    def simplify(self, report: list[str]):
+        self.args = [arg.simplify(report) for arg in self.args]
+        return self
+
     def pretty_print(self, indent):
         space = "  " * indent
         return f"{space}{bcolors.OKRED+ self.function.name+bcolors.ENDC}({', '.join([f'{arg}' for arg in self.args])})"
 
-    def getType(self):
+    def getType(self, types: Context = None):
         return "void"
 
 
@@ -614,6 +884,8 @@ class Return(ASTNode):
         self.value = value
 
     def code(self, addressSpace: AdressSpace, n):
+        if type(self.value) == FunctionCall and self.value.parameterSize(addressSpace) == addressSpace.parameters:
+            return self.value.codeTail(addressSpace, n)
         code = [self.value.codeR(addressSpace, n), I1P(I1P.I.LOADRC, -3),
                 I0P(I0P.I.STORE), I0P(I0P.I.RETURN)]
         return makeCompilationResult(code, f"Code for return", self)
@@ -624,40 +896,78 @@ class Return(ASTNode):
     def codeL(self, addressSpace: AdressSpace, n):
         raise Exception("Cannot load L-value of a return")
 
+    def simplify(self, report: list[str]):
+        self.value = self.value.simplify(report)
+        return self
+
     def pretty_print(self, indent):
         space = "  " * indent
         return f"{space}{bcolors.BOLD}return{bcolors.ENDC} {self.value}"
 
-    def getType(self):
+    def getType(self, types: Context = None):
         return "void"
 
 
 class Program(ASTNode):
-    def __init__(self, globalVariables: list[DeclareVariable], functions: list[FunctionDefinition]):
+    def __init__(self, globalVariables: list[DeclareVariable], functions: list[FunctionDefinition],
+                 structs: list[tuple[str, list[DeclareVariable]]] = None, externs: list[DeclareVariable] = None):
         self.globalVariables = globalVariables
         self.functions = functions
-
-    def code(self, addressSpace: AdressSpace, n):
+        # struct types and their members, declared before everything else
+        self.structs = structs if structs is not None else []
+        # globals and functions (typed "*name(...)") other units define, see Linker.py
+        self.externs = externs if externs is not None else []
+
+    def context(self, addressSpace: AdressSpace | dict, n, symbolic: bool = False) -> tuple[Context, int]:
+        """
+        The context the functions are compiled in and the size of the
+        globals. Symbolic contexts load the addresses of globals as their
+        names, which a linker replaces with the addresses
+        """
+        if self.externs and not symbolic:
+            raise Exception(f"Program does not define {', '.join(e.name for e in self.externs)}, link it with the units defining them")
+        # every compilation of a program starts with its own type tables
+        addressSpace = Context(addressSpace.names if isinstance(addressSpace, Context) else addressSpace)
+        for (type, members) in self.structs:
+            addressSpace.declare_struct(type, members)
+
+        # the globals take the cells from n + 1 on, each from its first cell
         size_of_globals = 0
         for globalVariable in self.globalVariables:
+            address = globalVariable.name if symbolic else n + size_of_globals + 1
             size_of_globals += globalVariable.typeSize * globalVariable.arraySize
-            addressSpace[globalVariable.name] = ('G', n + size_of_globals)
-            SIZEOF[globalVariable.type] = (
-                globalVariable.typeSize, globalVariable.arraySize)
-            SIZEOF[globalVariable.name] = (
-                globalVariable.typeSize, globalVariable.arraySize)
-
-        functionCode = []
-
-        newAdressSpace = addressSpace.copy()
+            addressSpace[globalVariable.name] = ('G', address, globalVariable.arraySize)
+            addressSpace.sizes[globalVariable.type] = globalVariable.typeSize
+        for extern in self.externs:
+            if "(" in extern.type:
+                addressSpace[extern.name] = ('G', extern.name)
+            else:
+                addressSpace[extern.name] = ('G', extern.name, extern.arraySize)
+                addressSpace.sizes[extern.type] = extern.typeSize
+
+        # functions are labelled with their names, so every function can be
+        # compiled on its own and in any order
         for function in self.functions:
-            newAdressSpace[function.name] = (
-                'G', function.name)
-            functionCode += [I1P(I1P.I.JUMP_TARGET, function.name),
-                             function.code(newAdressSpace, n)]
-
-        instructions = [I1P(I1P.I.ENTER, size_of_globals+4), I1P(I1P.I.ALLOC, size_of_globals+1), I0P(I0P.I.MARK),
-                        I1P(I1P.I.LOADC, "main"), I0P(I0P.I.CALL), I1P(I1P.I.SLIDE, size_of_globals), I0P(I0P.I.HALT)]
+            addressSpace[function.name] = ('G', function.name)
+        return (addressSpace, size_of_globals)
+
+    @staticmethod
+    def prologue(size_of_globals: int) -> list:
+        """The code before the functions, which calls main"""
+        code = [I1P(I1P.I.ENTER, 0), I1P(I1P.I.ALLOC, size_of_globals+1), I0P(I0P.I.MARK),
+                I1P(I1P.I.LOADC, "main"), I0P(I0P.I.CALL), I1P(I1P.I.SLIDE, size_of_globals), I0P(I0P.I.HALT)]
+        code[0].param1 = frame_depth(code)
+        return code
+
+    def code(self, addressSpace: AdressSpace | dict, n, workers: int = 1):
+        """
+        Code for the program. With more than one worker the functions are
+        compiled in a pool of that many processes; the code is the same
+        """
+        (addressSpace, size_of_globals) = self.context(addressSpace, n)
+        functionCode = compile_units(self.functions, addressSpace, n, workers)
+
+        instructions = self.prologue(size_of_globals)
         instructions += functionCode
 
         return makeCompilationResult(instructions, f"Code for program", self)
@@ -668,9 +978,16 @@ class Program(ASTNode):
     def codeL(self, addressSpace: AdressSpace, n):
         raise Exception("Cannot load L-value of a return")
 
+    def simplify(self, report: list[str]):
+        self.functions = [function.simplify(report) for function in self.functions]
+        return self
+
     def pretty_print(self, indent):
         space = "  " * indent
-        return f"{space}{NEWLINE.join([f'{globalVariable.pretty_print(indent)}' for globalVariable in self.globalVariables])}{NEWLINE}{(NEWLINE+NEWLINE).join([f'{function.pretty_print(indent)}' for function in self.functions])}"
+        bracket_open = "{"
+        bracket_close = "}"
+        structs = "".join([f"{space}{bcolors.OKORANGE}struct{bcolors.ENDC} {type} {bracket_open}{NEWLINE}{''.join([member.pretty_print(indent+1) for member in members])}{bracket_close}{NEWLINE}" for (type, members) in self.structs])
+        return f"{structs}{space}{NEWLINE.join([f'{globalVariable.pretty_print(indent)}' for globalVariable in self.globalVariables])}{NEWLINE}{(NEWLINE+NEWLINE).join([f'{function.pretty_print(indent)}' for function in self.functions])}"
 
-    def getType(self):
+    def getType(self, types: Context = None):
         return "void"
@@ -0,0 +1,703 @@
+from __future__ import annotations
+from typing import Optional
+import re
+
+from ASTNode import ASTNode
+from Instructions import Instructions0Params as I0P
+from Nodes import *
+from Context import Context
+
+
+KEYWORDS = {"int", "void", "struct", "extern", "if", "else", "while", "for", "return",
+            "print", "malloc", "free", "sizeof"}
+
+# A token with the spaces and comments before it. At the end of the source
+# the token is empty
+TOKEN = re.compile(r"""
+    ( (?: \s+ | //[^\n]* | /\*.*?\*/ )*
+      (?: (\d+)
+        | ([A-Za-z_]\w*)
+        | (/\*)
+        | (-> | \+\+ | -- | [-+*/=!<>]= | [-+*/=!<>&(){}\[\];,.])
+        | \Z ) )
+""", re.VERBOSE | re.DOTALL)
+
+# Binding powers of the binary operators; assignments bind right to left
+ASSIGNMENT = 10
+BINARY = {
+    "==": (30, I0P.I.EQ), "!=": (30, I0P.I.EQ),
+    "<": (40, I0P.I.LT), "<=": (40, I0P.I.LEQ), ">": (40, I0P.I.GT), ">=": (40, I0P.I.GEQ),
+    "+": (50, I0P.I.ADD), "-": (50, I0P.I.SUB),
+    "*": (60, I0P.I.MUL), "/": (60, I0P.I.DIV),
+}
+COMPOUND = {"+=": I0P.I.ADD, "-=": I0P.I.SUB, "*=": I0P.I.MUL, "/=": I0P.I.DIV}
+
+
+class ParseError(Exception):
+    def __init__(self, message: str, line: int, column: int, text: str, filename: str):
+        self.message = message
+        self.line = line
+        self.column = column
+        self.filename = filename
+        super().__init__(f"{filename}:{line}:{column}: {message}\n    {text}\n    {' ' * (column - 1)}^")
+
+
+def tokenize(source: str, filename: str = "<source>") -> tuple[list[str], list, list[int]]:
+    """
+    The kinds, values and positions of the tokens of source, ended by an "end"
+    token. The kind of keywords and operators is their text
+    """
+    kinds, values, positions = [], [], []
+    position = 0
+    for (text, number, name, unterminated, operator) in TOKEN.findall(source):
+        position += len(text)
+        if name:
+            kinds.append(name if name in KEYWORDS else "name")
+            values.append(name)
+            positions.append(position - len(name))
+        elif operator:
+            kinds.append(operator)
+            values.append(operator)
+            positions.append(position - len(operator))
+        elif number:
+            kinds.append("number")
+            values.append(int(number))
+            positions.append(position - len(number))
+        elif unterminated:
+            raise error(source, filename, position - 2, "Unterminated comment")
+        else:
+            break
+
+    if position != len(source):
+        # findall skips what matches no token, find the first such character
+        position = 0
+        while (match := TOKEN.match(source, position)) and match.end() > position:
+            position = match.end()
+        while source[position].isspace():
+            position += 1
+        raise error(source, filename, position, f"Unexpected character {source[position]!r}")
+
+    kinds.append("end")
+    values.append(None)
+    positions.append(len(source))
+    return kinds, values, positions
+
+
+def error(source: str, filename: str, position: int, message: str) -> ParseError:
+    line = source.count("\n", 0, position) + 1
+    start = source.rfind("\n", 0, position) + 1
+    end = source.find("\n", position)
+    text = source[start:end if end != -1 else len(source)]
+    return ParseError(message, line, position - start + 1, text, filename)
+
+
+class Parser:
+    """
+    Recursive descent parser of MiniC with precedence climbing (Pratt) for
+    the expressions. Produces the nodes of Nodes.py, typing every variable
+    with its declaration. The struct definitions go to the program, which
+    declares them before compiling anything else.
+
+    Declarations may appear anywhere in a block; a declaration's node holds
+    the rest of the block as its statements. Functions can call themselves
+    and the functions defined or declared before them. Functions declared
+    but not defined and extern globals are defined by other units, see
+    Linker.py.
+    """
+
+    def __init__(self, source: str, filename: str = "<source>"):
+        self.source = source
+        self.filename = filename
+        (self.kinds, self.values, self.positions) = tokenize(source, filename)
+        self.i = 0
+        # innermost scope last, variable name -> type, array size
+        self.scopes: list[dict[str, tuple[str, int]]] = [{}]
+        self.functions: dict[str, str] = {}
+        self.defined: set[str] = set()
+        # the struct layouts and type sizes, as the compilation will know them
+        self.types = Context()
+        self.structs: list[tuple[str, list[DeclareVariable]]] = []
+        # postfix increments: id(node) -> (node, the assignment it wraps); the
+        # node is kept so that its id cannot be reused by a later node
+        self.postfix: dict[int, tuple[ASTNode, ASTNode]] = {}
+
+    # Tokens
+
+    def next(self):
+        value = self.values[self.i]
+        self.i += 1
+        return value
+
+    def accept(self, kind: str) -> bool:
+        if self.kinds[self.i] == kind:
+            self.i += 1
+            return True
+        return False
+
+    def expect(self, kind: str):
+        if self.kinds[self.i] != kind:
+            raise self.error(f"Expected {kind!r} but found {self.describe()}")
+        return self.next()
+
+    def describe(self, i: Optional[int] = None) -> str:
+        i = self.i if i is None else i
+        if self.kinds[i] == "end":
+            return "the end of the input"
+        return repr(str(self.values[i]))
+
+    def error(self, message: str, i: Optional[int] = None) -> ParseError:
+        return error(self.source, self.filename, self.positions[self.i if i is None else i], message)
+
+    # Types and scopes
+
+    def size(self, type: str) -> int:
+        if type.endswith("*") or type in self.types.sizes:
+            return self.types.size(type)
+        raise self.error(f"Unknown type {type!r}")
+
+    def lookup(self, name: str) -> Optional[str]:
+        for scope in reversed(self.scopes):
+            if name in scope:
+                return scope[name][0]
+        return self.functions.get(name)
+
+    def is_array(self, name: str) -> bool:
+        for scope in reversed(self.scopes):
+            if name in scope:
+                return scope[name][1] > 1
+        return False
+
+    def declare(self, name: str, type: str, i: int, count: int = 1):
+        if name in self.scopes[-1]:
+            raise self.error(f"Redeclaration of {name!r}", i)
+        self.scopes[-1][name] = (type, count)
+
+    def starts_type(self) -> bool:
+        return self.kinds[self.i] in ("int", "void", "struct")
+
+    def type(self) -> str:
+        if self.accept("struct"):
+            start = self.i
+            type = self.expect("name")
+            if type not in self.types.structs:
+                raise self.error(f"Unknown struct {type!r}", start)
+        elif self.kinds[self.i] in ("int", "void"):
+            type = self.next()
+        else:
+            raise self.error(f"Expected a type but found {self.describe()}")
+        while self.accept("*"):
+            type += "*"
+        return type
+
+    def struct_definition(self) -> Optional[tuple[str, list[DeclareVariable]]]:
+        """
+        Parses "struct name { members }" if the tokens start with it, leaving
+        the declarator. Returns the struct and its members
+        """
+        if not (self.kinds[self.i] == "struct" and self.kinds[self.i + 1] == "name" and self.kinds[self.i + 2] == "{"):
+            return None
+        self.i += 1
+        start = self.i
+        type = self.next()
+        if type in self.types.structs:
+            raise self.error(f"Redefinition of struct {type!r}", start)
+        self.i += 1
+        members = []
+        names = set()
+        while not self.accept("}"):
+            i = self.i
+            member_type = self.type() if not (self.kinds[self.i] == "struct" and self.values[self.i + 1] == type) else self.self_pointer(type)
+            name = self.expect("name")
+            if name in names:
+                raise self.error(f"Duplicate member {name!r}", i)
+            names.add(name)
+            count = self.array_size()
+            self.expect(";")
+            members.append(DeclareVariable(member_type, self.size(member_type), count, name, StatementSequence()))
+        if not members:
+            raise self.error(f"Struct {type!r} has no members", start)
+        self.types.declare_struct(type, members)
+        self.structs.append((type, members))
+        return type, members
+
+    def self_pointer(self, type: str) -> str:
+        # a member pointing to the struct being defined
+        self.i += 2
+        if self.kinds[self.i] != "*":
+            raise self.error(f"Struct {type!r} cannot contain itself")
+        pointer = type
+        while self.accept("*"):
+            pointer += "*"
+        return pointer
+
+    def array_size(self) -> int:
+        if not self.accept("["):
+            return 1
+        i = self.i
+        count = self.expect("number")
+        if count < 1:
+            raise self.error("Array size must be positive", i)
+        self.expect("]")
+        return count
+
+    # Program
+
+    def program(self, entry: Optional[str] = "main") -> Program:
+        """The program, which has to define the function entry unless it is None"""
+        globals = []
+        functions = []
+        # the names declared here and defined by other units
+        externs: dict[str, DeclareVariable] = {}
+        while self.kinds[self.i] != "end":
+            struct = self.struct_definition()
+            if struct is not None and self.accept(";"):
+                continue
+            extern = self.accept("extern")
+            type = struct[0] if struct is not None else self.type()
+            start = self.i
+            name = self.expect("name")
+            if self.kinds[self.i] == "(":
+                function = self.function(type, name, start)
+                if function is None:
+                    externs.setdefault(name, DeclareVariable(self.functions[name], 1, 1, name, StatementSequence()))
+                else:
+                    externs.pop(name, None)
+                    functions.append(function)
+                continue
+            while True:
+                count = self.array_size()
+                if self.kinds[self.i] == "=":
+                    raise self.error("Global variables cannot be initialized")
+                self.declare(name, type, start, count)
+                variable = DeclareVariable(type, self.size(type), count, name, StatementSequence())
+                if extern:
+                    externs[name] = variable
+                else:
+                    globals.append(variable)
+                if not self.accept(","):
+                    break
+                start = self.i
+                name = self.expect("name")
+            self.expect(";")
+
+        if entry is not None and entry not in self.defined:
+            raise self.error(f"No function {entry}")
+        return Program(globals, functions, self.structs, list(externs.values()))
+
+    def function(self, type: str, name: str, start: int) -> Optional[FunctionDefinition]:
+        """The function definition, None for a declaration"""
+        if name in self.defined or name in self.scopes[0]:
+            raise self.error(f"Redefinition of {name!r}", start)
+        if type in self.types.structs:
+            # the result is a single cell
+            raise self.error(f"Functions cannot return the struct {type!r}", start)
+        self.expect("(")
+        parameters = []
+        self.scopes.append({})
+        if self.kinds[self.i] == "void" and self.kinds[self.i + 1] == ")":
+            self.i += 1
+        elif self.kinds[self.i] != ")":
+            while True:
+                parameter_type = self.type()
+                i = self.i
+                parameter = self.expect("name")
+                if self.accept("["):
+                    self.expect("]")
+                    parameter_type = parameter_type + "*"
+                self.declare(parameter, parameter_type, i)
+                parameters.append(DeclareVariable(parameter_type, self.size(parameter_type), 1, parameter, StatementSequence()))
+                if not self.accept(","):
+                    break
+        self.expect(")")
+
+        # the type of the function as a variable, which tells Variable to load its address
+        function_type = f"*{name}({','.join(p.type for p in parameters)})"
+        if self.functions.get(name, function_type) != function_type:
+            raise self.error(f"Conflicting declarations of {name!r}", start)
+        self.functions[name] = function_type
+        if self.accept(";"):
+            self.scopes.pop()
+            return None
+        self.defined.add(name)
+        self.expect("{")
+        body = self.block()
+        self.scopes.pop()
+        return FunctionDefinition(type, name, parameters, body)
+
+    # Statements
+
+    def block(self) -> ASTNode:
+        """The items of a block up to its "}", which was opened already"""
+        self.scopes.append({})
+        # statements, and declarations as (type, count, name, initializer, members)
+        items = []
+        while not self.accept("}"):
+            if self.kinds[self.i] == "end":
+                raise self.error("Expected '}' but found the end of the input")
+            if self.starts_type():
+                self.declaration(items)
+            else:
+                items.append(self.statement())
+        self.scopes.pop()
+
+        # every declaration holds the statements following it
+        tail = []
+        for item in reversed(items):
+            if type(item) != tuple:
+                tail.append(item)
+                continue
+            (variable_type, count, name, initializer, members) = item
+            statements = [*([Assignment(Variable(variable_type, name), initializer)] if initializer is not None else []),
+                          *reversed(tail)]
+            if members is not None and count == 1:
+                node = DeclareStruct(variable_type, members, name, StatementSequence(*statements))
+            else:
+                node = DeclareVariable(variable_type, self.size(variable_type), count, name, StatementSequence(*statements))
+            tail = [node]
+        if len(tail) == 1 and type(tail[0]) in (DeclareVariable, DeclareStruct):
+            return tail[0]
+        return StatementSequence(*reversed(tail))
+
+    def declaration(self, items: list):
+        struct = self.struct_definition()
+        if struct is not None and self.accept(";"):
+            return
+        (type, members) = struct if struct is not None else (self.type(), None)
+        while True:
+            start = self.i
+            name = self.expect("name")
+            count = self.array_size()
+            initializer = None
+            if self.accept("="):
+                if count > 1 or members is not None:
+                    raise self.error("Only scalars can be initialized", start)
+                initializer = self.expression(ASSIGNMENT)
+                self.assigned(type, initializer, start)
+            self.declare(name, type, start, count)
+            items.append((type, count, name, initializer, members))
+            # further declarators declare plain variables of the struct
+            members = None
+            if not self.accept(","):
+                break
+        self.expect(";")
+
+    def statement(self) -> ASTNode:
+        kind = self.kinds[self.i]
+        if kind == "{":
+            self.i += 1
+            return self.block()
+        if kind == ";":
+            self.i += 1
+            return StatementSequence()
+        if kind == "if":
+            self.i += 1
+            condition = self.condition()
+            then = self.statement()
+            if self.accept("else"):
+                return IfElse(condition, then, self.statement())
+            return If(condition, then)
+        if kind == "while":
+            self.i += 1
+            condition = self.condition()
+            return While(condition, self.statement())
+        if kind == "for":
+            self.i += 1
+            self.expect("(")
+            initialization = self.discarded(self.expression()) if self.kinds[self.i] != ";" else Number(0)
+            self.expect(";")
+            condition = self.expression() if self.kinds[self.i] != ";" else Number(1)
+            self.expect(";")
+            increment = self.discarded(self.expression()) if self.kinds[self.i] != ")" else Number(0)
+            self.expect(")")
+            return For(initialization, condition, increment, self.statement())
+        if kind == "return":
+            self.i += 1
+            value = self.expression() if self.kinds[self.i] != ";" else Number(0)
+            self.expect(";")
+            return Return(value)
+        if kind == "free":
+            self.i += 1
+            self.expect("(")
+            pointer = self.expression()
+            self.expect(")")
+            self.expect(";")
+            return Free(pointer)
+        if kind == "else":
+            raise self.error("'else' without 'if'")
+        expression = self.discarded(self.expression())
+        self.expect(";")
+        return expression
+
+    def condition(self) -> ASTNode:
+        self.expect("(")
+        condition = self.expression()
+        self.expect(")")
+        return condition
+
+    def discarded(self, node: ASTNode) -> ASTNode:
+        """The node for an expression whose value is not used"""
+        (stored, assignment) = self.postfix.get(id(node), (None, None))
+        return assignment if stored is node else node
+
+    # Expressions
+
+    def expression(self, power: int = 0) -> ASTNode:
+        left = self.prefix()
+        while True:
+            kind = self.kinds[self.i]
+            if kind in BINARY:
+                (binding, operator) = BINARY[kind]
+                if binding <= power:
+                    return left
+                self.i += 1
+                right = self.expression(binding)
+                left = BinaryOperation(left, operator, right)
+                if kind == "!=":
+                    left = UnaryOperator(I0P.I.NOT, left)
+            elif kind == "=" or kind in COMPOUND:
+                if ASSIGNMENT < power:
+                    return left
+                self.assignable(left, arithmetic=kind != "=")
+                self.i += 1
+                start = self.i
+                right = self.expression(ASSIGNMENT - 1)
+                if kind != "=":
+                    right = BinaryOperation(left, COMPOUND[kind], right)
+                self.assigned(left.getType(self.types), right, start)
+                left = Assignment(left, right)
+            else:
+                return left
+
+    def assignable(self, node: ASTNode, i: Optional[int] = None, arithmetic: bool = False):
+        if type(node) not in (Variable, Dereference, ArrayAccess, StructAccess, Arrow) or "(" in node.getType(self.types):
+            raise self.error("Cannot assign to this expression", i)
+        if type(node) == Variable and self.is_array(node.name):
+            raise self.error(f"Cannot assign to the array {node.name!r}", i)
+        if type(node) in (StructAccess, Arrow):
+            struct = node.struct_name.getType(self.types) if type(node) == StructAccess else node.a.getType(self.types)[:-1]
+            if self.types.structs[struct][node.member_name][2] > 1:
+                raise self.error(f"Cannot assign to the array {node.member_name!r}", i)
+        if arithmetic and node.getType(self.types) in self.types.structs:
+            raise self.error("Cannot do arithmetic on a struct", i)
+
+    def assigned(self, type: str, value: ASTNode, i: int):
+        """Checks that a struct is assigned a struct of its type, which is copied as a whole"""
+        structs = self.types.structs
+        value_type = value.getType(self.types) if isinstance(value, (Variable, Dereference, ArrayAccess, StructAccess, Arrow, Assignment)) else None
+        if (type in structs or value_type in structs) and value_type != type:
+            raise self.error(f"Cannot assign {'this expression' if value_type is None else repr(value_type)} to {type!r}", i)
+
+    def passed(self, function: str, type: str, value: ASTNode, i: int):
+        """Checks that an argument of the function fits its parameter of the type, like assigned"""
+        structs = self.types.structs
+        value_type = value.getType(self.types) if isinstance(value, (Variable, Dereference, ArrayAccess, StructAccess, Arrow, Assignment)) else None
+        if (type in structs or value_type in structs) and value_type != type:
+            raise self.error(f"Cannot pass {'this expression' if value_type is None else repr(value_type)} to {function!r} as {type!r}", i)
+
+    def prefix(self) -> ASTNode:
+        i = self.i
+        kind = self.kinds[i]
+        if kind == "-":
+            self.i += 1
+            operand = self.prefix()
+            if type(operand) == Number:
+                return Number(-operand.value)
+            return UnaryOperator(I0P.I.NEG, operand)
+        if kind == "!":
+            self.i += 1
+            return UnaryOperator(I0P.I.NOT, self.prefix())
+        if kind == "*":
+            self.i += 1
+            return Dereference(self.prefix())
+        if kind == "&":
+            self.i += 1
+            operand = self.prefix()
+            if type(operand) not in (Variable, Dereference, ArrayAccess, StructAccess, Arrow):
+                raise self.error("Cannot take the address of this expression", i + 1)
+            return AddressOf(operand)
+        if kind in ("++", "--"):
+            self.i += 1
+            operand = self.prefix()
+            self.assignable(operand, i + 1, arithmetic=True)
+            return Assignment(operand, BinaryOperation(operand, I0P.I.ADD if kind == "++" else I0P.I.SUB, Number(1)))
+        return self.postfix_expression(self.primary())
+
+    def postfix_expression(self, node: ASTNode) -> ASTNode:
+        while True:
+            kind = self.kinds[self.i]
+            i = self.i
+            if kind == "[":
+                self.i += 1
+                index = self.expression()
+                self.expect("]")
+                node = ArrayAccess(node, index)
+            elif kind == ".":
+                self.i += 1
+                node = StructAccess(node, self.member(node.getType(self.types), i))
+            elif kind == "->":
+                self.i += 1
+                pointer = node.getType(self.types)
+                if not pointer.endswith("*"):
+                    raise self.error(f"'->' on {pointer!r}, which is no pointer", i)
+                node = Arrow(node, self.member(pointer[:-1], i))
+            elif kind == "(":
+                if type(node) != Variable:
+                    raise self.error("Only named functions can be called", i)
+                function_type = node.getType(self.types)
+                if "(" not in function_type:
+                    raise self.error(f"{node.name!r} is no function", i)
+                # *f(int,int*) -> int, int*
+                parameters = [p for p in function_type[function_type.index("(") + 1:-1].split(",") if p]
+                self.i += 1
+                arguments = []
+                if not self.accept(")"):
+                    while True:
+                        start = self.i
+                        argument = self.expression(ASSIGNMENT - 1)
+                        if len(arguments) < len(parameters):
+                            self.passed(node.name, parameters[len(arguments)], argument, start)
+                        arguments.append(argument)
+                        if not self.accept(","):
+                            break
+                    self.expect(")")
+                if len(arguments) != len(parameters):
+                    raise self.error(f"{node.name!r} takes {len(parameters)} arguments but is called with {len(arguments)}", i)
+                node = FunctionCall(node, arguments)
+            elif kind in ("++", "--"):
+                # x++ is (x = x + 1) - 1, or x = x + 1 when the value is not used
+                self.assignable(node, i, arithmetic=True)
+                self.i += 1
+                (step, back) = (I0P.I.ADD, I0P.I.SUB) if kind == "++" else (I0P.I.SUB, I0P.I.ADD)
+                assignment = Assignment(node, BinaryOperation(node, step, Number(1)))
+                node = BinaryOperation(assignment, back, Number(1))
+                self.postfix[id(node)] = (node, assignment)
+            else:
+                return node
+
+    def member(self, type: str, i: int) -> str:
+        name = self.expect("name")
+        if type not in self.types.structs:
+            raise self.error(f"{type!r} is no struct", i)
+        if name not in self.types.structs[type]:
+            raise self.error(f"Struct {type!r} has no member {name!r}", self.i - 1)
+        return name
+
+    def primary(self) -> ASTNode:
+        i = self.i
+        kind = self.kinds[i]
+        if kind == "number":
+            return Number(self.next())
+        if kind == "name":
+            name = self.next()
+            type = self.lookup(name)
+            if type is not None:
+                return Variable(type, name)
+            if self.kinds[self.i] == "(":
+                # without prototypes the types of later functions are unknown
+                raise self.error(f"Undefined function {name!r}, functions must be defined before their calls", i)
+            raise self.error(f"Undeclared variable {name!r}", i)
+        if kind == "(":
+            self.i += 1
+            node = self.expression()
+            self.expect(")")
+            return node
+        if kind in ("print", "malloc"):
+            self.i += 1
+            self.expect("(")
+            argument = self.expression()
+            self.expect(")")
+            return Print(argument) if kind == "print" else Malloc(argument)
+        if kind == "sizeof":
+            self.i += 1
+            self.expect("(")
+            size = self.size(self.type())
+            self.expect(")")
+            return Number(size)
+        raise self.error(f"Expected an expression but found {self.describe()}")
+
+
+def parse(source: str, filename: str = "<source>") -> Program:
+    """The program of the MiniC source"""
+    return Parser(source, filename).program()
+
+
+def parse_unit(source: str, filename: str = "<source>") -> Program:
+    """The program of a MiniC source linked with others, which needs no main"""
+    return Parser(source, filename).program(entry=None)
+
+
+def parse_file(path: str) -> Program:
+    with open(path) as f:
+        return parse(f.read(), path)
+
+
+if __name__ == '__main__':
+    from time import perf_counter
+    from Interpreter import Interpreter
+    from Output import ListSink
+
+    source = """
+    struct node {
+        int value;
+        struct node* next;
+    };
+
+    int total;
+
+    int fib(int n) {
+        if (n <= 1)
+            return n;
+        return fib(n - 1) + fib(n - 2);
+    }
+
+    int sum(struct node* list) {
+        int s = 0;
+        while (list) {
+            s += list->value;
+            list = list->next;
+        }
+        return s;
+    }
+
+    int main() {
+        struct node* list = 0;
+        int i;
+        for (i = 0; i < 10; i++) {
+            struct node* n = malloc(sizeof(struct node));
+            n->value = fib(i);
+            n->next = list;
+            list = n;
+        }
+        total = sum(list);
+        print(total);
+        return total;
+    }
+    """
+    s = Interpreter(parse(source).code({}, 0).to_code(), output=ListSink())
+    s.run()
+    print(f"Exit code: {s.stack.stack[0]}, output: {s.output.getvalue()!r}")
+
+    # throughput on a large generated program
+    lines = []
+    for k in range(2000):
+        lines += [f"int f{k}(int n, int* p) {{",
+                  "    int i;",
+                  "    int s = 0;",
+                  "    for (i = 0; i < n; i++) {",
+                  f"        s = s + i * {k} - (p[i] / 2);",
+                  "        if (s > 1000) s = s - 1000; else s += 1;",
+                  "    }",
+                  "    return s;",
+                  "}"]
+    lines += ["int main() { return f0(1, 0); }"]
+    source = "\n".join(lines)
+
+    start = perf_counter()
+    program = parse(source)
+    parsed = perf_counter() - start
+    print(f"{len(lines)} lines parsed in {parsed:.4f}s, {len(lines) / parsed:,.0f} lines/s")
+
+    try:
+        parse("int main() {\n    int x = 1;\n    return x +;\n}")
+    except ParseError as e:
+        print(e)
@@ -0,0 +1,74 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+from Instructions import Instructions0Params as I0P, Instructions1Params as I1P
+from StackDepth import labels_of, rise
+
+if TYPE_CHECKING:
+    from Instructions import Instructions
+
+
+def matches(instruction: Instructions, kind) -> bool:
+    return instruction.instruction == kind
+
+
+def fuse(code: list[Instructions], i: int):
+    """
+    Tries to fuse the instructions starting at code[i] into a superinstruction.
+    Returns the replacement and the number of instructions it replaces
+    """
+    a = code[i]
+    b = code[i + 1] if i + 1 < len(code) else None
+    c = code[i + 2] if i + 2 < len(code) else None
+
+    # SLIDE 0 (after calls with one parameter cell) does nothing
+    if matches(a, I1P.I.SLIDE) and a.param1 == 0:
+        return [], 1
+
+    if b is None:
+        return [a], 1
+
+    # mark; LOADC f; call -> CALLF f
+    if matches(a, I0P.I.MARK) and matches(b, I1P.I.LOADC) and c is not None and matches(c, I0P.I.CALL):
+        return [I1P(I1P.I.CALLF, b.param1)], 3
+
+    if matches(a, I1P.I.LOADRC):
+        # LOADRC k; store; pop -> STORER k
+        if matches(b, I0P.I.STORE) and c is not None and matches(c, I0P.I.POP):
+            return [I1P(I1P.I.STORER, a.param1)], 3
+        # LOADRC k; load -> LOADR k
+        if matches(b, I0P.I.LOAD):
+            return [I1P(I1P.I.LOADR, a.param1)], 2
+
+    if matches(a, I1P.I.LOADC) and type(a.param1) == int:
+        # LOADC c; + -> ADDC c
+        if matches(b, I0P.I.ADD):
+            return [I1P(I1P.I.ADDC, a.param1)], 2
+        # LOADC c; - -> ADDC -c
+        if matches(b, I0P.I.SUB):
+            return [I1P(I1P.I.ADDC, -a.param1)], 2
+
+    return [a], 1
+
+
+def optimize(code: list[Instructions]) -> list[Instructions]:
+    """
+    Replaces common instruction sequences of the code generator by
+    superinstructions. Sequences never span a JUMP_TARGET, so every jump still
+    lands on an instruction boundary. The code must not have been run yet, as
+    running resolves labels to addresses of the unoptimized code.
+
+    Superinstructions put fewer cells on the stack than the sequences they
+    replace, so the stack depth of every ENTER is computed again
+    """
+    optimized = []
+    i = 0
+    while i < len(code):
+        (replacement, length) = fuse(code, i)
+        optimized += replacement
+        i += length
+    labels = labels_of(optimized)
+    for (pc, instruction) in enumerate(optimized):
+        if matches(instruction, I1P.I.ENTER):
+            optimized[pc] = I1P(I1P.I.ENTER, rise(optimized, pc, labels, lambda label: 0))
+    return optimized
@@ -0,0 +1,134 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from collections import defaultdict
+import json
+
+from Instructions import Instructions0Params as I0P, Instructions1Params as I1P
+from Image import OPCODES, OPCODE
+
+if TYPE_CHECKING:
+    from Instructions import Instructions
+    from Image import Image
+
+
+# Name of the code before the first function (the call of main)
+PROGRAM = "program"
+
+# Boundary kinds of the profiling loop
+CALL, RETURN, TAILCALL = 1, 2, 3
+
+BOUNDARIES = {
+    OPCODE[I0P.I.CALL]: CALL,
+    OPCODE[I1P.I.CALLF]: CALL,
+    OPCODE[I0P.I.RETURN]: RETURN,
+    OPCODE[I1P.I.TAILCALL]: TAILCALL,
+}
+
+
+def function_labels(code: list[Instructions]) -> set[str]:
+    """The labels used as function pointers, as opposed to jump targets"""
+    return {i.param1 for i in code
+            if i.instruction in (I1P.I.LOADC, I1P.I.CALLF) and type(i.param1) == str}
+
+
+class Profile:
+    """
+    Where a run of the image spent its steps.
+
+    The profiling loop counts how often every instruction was executed and,
+    at calls, tail calls and returns, charges the steps since the last such
+    boundary to the current call stack. Everything else is derived from these
+    counts after the run.
+    """
+
+    def __init__(self, code: list[Instructions], image: Image):
+        self.code = code
+        self.image = image
+        self.hits = [0] * len(image)
+        self.calls: dict[str, int] = defaultdict(int)
+        # call stack "f;g;h" -> steps spent with h on top
+        self.stacks: dict[str, int] = defaultdict(int)
+        self.steps = 0
+
+        # the function every instruction of the image belongs to
+        functions = function_labels(code)
+        self.function = []
+        name = PROGRAM
+        for pc, address in enumerate(image.addrs):
+            start = image.addrs[pc - 1] + 1 if pc > 0 else 0
+            # a function starts at the label of its name, which calls use; the
+            # labels inside it start with its name and a dot
+            labels = [code[i].param1 for i in range(start, address)]
+            name = next((label for label in labels if label in functions), name)
+            self.function.append(name)
+
+        self.kinds = [BOUNDARIES.get(op, 0) for op in image.ops]
+
+    def opcodes(self) -> dict[str, int]:
+        """Executions per opcode"""
+        counts = defaultdict(int)
+        for (op, hits) in zip(self.image.ops, self.hits):
+            if hits:
+                counts[OPCODES[op].name] += hits
+        return dict(sorted(counts.items(), key=lambda item: -item[1]))
+
+    def functions(self) -> dict[str, dict[str, int]]:
+        """Calls, inclusive and exclusive steps per function"""
+        result = defaultdict(lambda: {"calls": 0, "inclusive": 0, "exclusive": 0})
+        for (stack, steps) in self.stacks.items():
+            names = stack.split(";")
+            result[names[-1]]["exclusive"] += steps
+            for name in set(names):
+                result[name]["inclusive"] += steps
+        for (name, calls) in self.calls.items():
+            result[name]["calls"] = calls
+        return dict(sorted(result.items(), key=lambda item: -item[1]["inclusive"]))
+
+    def hot_ranges(self, n: int = 10) -> list[dict]:
+        """
+        The n ranges of consecutive instructions executed equally often with
+        the most steps, as unlinked code addresses
+        """
+        image = self.image
+        ranges = []
+        start = 0
+        for pc in range(1, len(image) + 1):
+            if pc < len(image) and self.hits[pc] == self.hits[start] and self.function[pc] == self.function[start]:
+                continue
+            if self.hits[start]:
+                ranges.append({
+                    "start": image.addrs[start],
+                    "end": image.addrs[pc - 1],
+                    "function": self.function[start],
+                    "executions": self.hits[start],
+                    "steps": self.hits[start] * sum(image.weights[start:pc]),
+                })
+            start = pc
+        return sorted(ranges, key=lambda r: -r["steps"])[:n]
+
+    def to_map(self) -> dict:
+        return {
+            "steps": self.steps,
+            "opcodes": self.opcodes(),
+            "functions": self.functions(),
+            "hot ranges": self.hot_ranges(),
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_map(), indent=4)
+
+    def collapsed(self) -> str:
+        """The call stacks in the collapsed format of flame graph tools"""
+        return "".join(f"{stack} {steps}\n" for (stack, steps) in self.stacks.items() if steps)
+
+
+if __name__ == '__main__':
+    from benchmark import fib
+    from Interpreter import Interpreter
+    from Output import ListSink
+
+    s = Interpreter(fib(15).code({}, 0).to_code(), output=ListSink())
+    s.run(profile=True)
+
+    print(s.profile.to_json())
+    print(s.profile.collapsed())
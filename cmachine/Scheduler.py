@@ -0,0 +1,90 @@
+from __future__ import annotations
+from typing import Optional
+from collections import deque
+from time import perf_counter
+import asyncio
+
+from Interpreter import Interpreter, SLICE_STEPS
+
+
+class Scheduler:
+    """
+    Runs many interpreters in one event loop. The interpreters take turns
+    round robin, each running a slice of budget instructions, and the
+    scheduler yields to the event loop after every slice, so neither a long
+    program nor the programs together can starve the other tasks.
+
+    Programs taking more than max_steps steps are stopped with an exception.
+    """
+
+    def __init__(self, budget: int = SLICE_STEPS, max_steps: Optional[int] = None):
+        self.budget = budget
+        self.max_steps = max_steps
+        self.ready: deque[tuple[Interpreter, asyncio.Future]] = deque()
+        self.worker: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self.ready)
+
+    def submit(self, interpreter: Interpreter) -> asyncio.Future:
+        """
+        Queues the interpreter. The returned future resolves to the number of
+        steps once the program halted; cancelling it drops the program
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.ready.append((interpreter, future))
+
+        if self.worker is None or self.worker.done():
+            self.worker = loop.create_task(self.work())
+        return future
+
+    async def run(self, interpreters: list[Interpreter], return_exceptions=False) -> list:
+        """
+        Runs all interpreters to completion. Returns their step counts
+        """
+        return await asyncio.gather(*(self.submit(interpreter) for interpreter in interpreters),
+                                    return_exceptions=return_exceptions)
+
+    async def work(self):
+        while self.ready:
+            (interpreter, future) = self.ready.popleft()
+            if future.cancelled():
+                continue
+
+            try:
+                halted = interpreter.run_slice(self.budget)
+                if not halted and self.max_steps is not None and interpreter.steps > self.max_steps:
+                    raise Exception(f"Step limit of {self.max_steps} exceeded")
+            except Exception as e:
+                interpreter.output.flush()
+                future.set_exception(e)
+            else:
+                if halted:
+                    interpreter.output.flush()
+                    future.set_result(interpreter.steps)
+                else:
+                    self.ready.append((interpreter, future))
+
+            await asyncio.sleep(0)
+
+
+if __name__ == '__main__':
+    from benchmark import fib
+
+    def interpreter(k: int) -> Interpreter:
+        return Interpreter(fib(k).code({}, 0).to_code())
+
+    async def main():
+        scheduler = Scheduler()
+        start = perf_counter()
+
+        async def timed(name, s):
+            steps = await scheduler.submit(s)
+            print(f"{name:>10} {steps:>10} {s.stack.stack[0]:>8} {perf_counter() - start:>10.4f}")
+
+        print(f"{'program':>10} {'steps':>10} {'result':>8} {'done [s]':>10}")
+        await asyncio.gather(timed("fib(22)", interpreter(22)),
+                             *(timed(f"fib({k})", interpreter(k)) for k in range(1, 16)))
+
+    asyncio.run(main())
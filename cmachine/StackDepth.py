@@ -0,0 +1,158 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Callable, Optional
+
+from Instructions import Instructions0Params as I0P, Instructions1Params as I1P
+
+if TYPE_CHECKING:
+    from Instructions import Instructions
+
+
+# Change of SP by the instructions, calls counted once they returned. ALLOC,
+# SLIDE and LOADK change it by their parameter
+EFFECTS = {
+    **{i: -1 for i in (I0P.I.ADD, I0P.I.SUB, I0P.I.MUL, I0P.I.DIV, I0P.I.LEQ, I0P.I.GEQ, I0P.I.LT,
+                       I0P.I.GT, I0P.I.EQ, I0P.I.STORE, I0P.I.POP, I0P.I.FREE)},
+    **{i: 0 for i in (I0P.I.NEG, I0P.I.NOT, I0P.I.LOAD, I0P.I.PRINT, I0P.I.NEW, I0P.I.RETURN, I0P.I.HALT)},
+    I0P.I.MARK: 2,
+    # the callee's frame starts at SP and returns to SP - 3
+    I0P.I.CALL: -3,
+    I1P.I.LOADC: 1,
+    I1P.I.LOADRC: 1,
+    I1P.I.JUMP: 0,
+    I1P.I.JUMPZ: -1,
+    I1P.I.JUMPNZ: -1,
+    I1P.I.JUMP_TARGET: 0,
+    I1P.I.ENTER: 0,
+    I1P.I.TAILCALL: 0,
+    I1P.I.LOADR: 1,
+    I1P.I.STORER: -1,
+    I1P.I.ADDC: 0,
+    # mark; LOADC f; call
+    I1P.I.CALLF: 0,
+    I1P.I.STOREK: -1,
+    I1P.I.MOVE: -2,
+}
+
+# Instructions the code after them is not reached from
+ENDS = {I1P.I.JUMP, I0P.I.RETURN, I0P.I.HALT, I1P.I.TAILCALL}
+
+
+def effect(instruction: Instructions) -> int:
+    if instruction.instruction == I1P.I.ALLOC:
+        return instruction.param1
+    if instruction.instruction == I1P.I.SLIDE:
+        return -instruction.param1
+    if instruction.instruction == I1P.I.LOADK:
+        return instruction.param1 - 1
+    return EFFECTS[instruction.instruction]
+
+
+def callee(code: list[Instructions], pc: int) -> Optional[str]:
+    """The label of the function the call code[pc] calls, None if it is computed"""
+    instruction = code[pc]
+    if instruction.instruction == I1P.I.CALLF:
+        label = instruction.param1
+    elif pc > 0 and code[pc - 1].instruction == I1P.I.LOADC:
+        label = code[pc - 1].param1
+    else:
+        return None
+    return label if type(label) == str else None
+
+
+def rise(code: list[Instructions], start: int, labels: dict[str, int], calls: Callable[[Optional[str]], Optional[int]]) -> Optional[int]:
+    """
+    How far the stack grows above SP at code[start] while the code from
+    there runs, following its branches. calls(label) is how far a call of
+    the function at label grows the stack above the frame pointer of the
+    function, None if that is not known, which makes the result None
+    """
+    depths: dict[int, int] = {}
+    pending = [(start, 0)]
+    highest = 0
+    while pending:
+        (pc, depth) = pending.pop()
+        while pc < len(code):
+            if pc in depths:
+                if depths[pc] != depth:
+                    raise Exception(f"Stack depth at {pc} is {depths[pc]} or {depth} depending on the path")
+                break
+            depths[pc] = depth
+            instruction = code[pc]
+            kind = instruction.instruction
+            if kind in (I0P.I.CALL, I1P.I.CALLF, I1P.I.TAILCALL):
+                above = calls(callee(code, pc))
+                if above is None:
+                    return None
+                # where the frame pointer of the callee is; a tail call reuses the frame
+                frame = {I0P.I.CALL: depth, I1P.I.CALLF: depth + 3, I1P.I.TAILCALL: 0}[kind]
+                highest = max(highest, frame + above)
+            depth += effect(instruction)
+            highest = max(highest, depth)
+            if kind in (I1P.I.JUMP, I1P.I.JUMPZ, I1P.I.JUMPNZ):
+                pending.append((labels[instruction.param1], depth))
+            if kind in ENDS:
+                break
+            pc += 1
+    return highest
+
+
+def labels_of(code: list[Instructions]) -> dict[str, int]:
+    return {i.param1: pc for (pc, i) in enumerate(code) if i.instruction == I1P.I.JUMP_TARGET}
+
+
+def frame_depth(code: list[Instructions]) -> int:
+    """
+    The most cells the code of a function, starting at its frame pointer,
+    puts on the stack: the parameter of its ENTER. The cells a call puts on
+    the stack up to the frame pointer of the callee count, the callee's
+    frame does not
+    """
+    return rise(code, 0, labels_of(code), lambda label: 0)
+
+
+def stack_size(code: list[Instructions]) -> Optional[int]:
+    """
+    The cells of memory the stack of the program takes at most, following
+    its calls. None if that depends on the run: the program recurses or
+    calls functions through pointers. A run needs the stack size and what
+    the program allocates on the heap
+    """
+    labels = labels_of(code)
+    rises: dict[str, Optional[int]] = {}
+
+    def calls(label: Optional[str]) -> Optional[int]:
+        if label is None or label not in labels:
+            return None
+        if label not in rises:
+            # None while the function is analyzed: recursion has no bound
+            rises[label] = None
+            rises[label] = rise(code, labels[label], labels, calls)
+        return rises[label]
+
+    # the program starts with SP at -1
+    return rise(code, 0, labels, calls)
+
+
+if __name__ == '__main__':
+    from Parser import parse
+    from Interpreter import Interpreter
+    from Output import ListSink
+
+    source = """
+int g;
+int sum(int a, int b) { return a + b; }
+int weight(int x) { int y; y = sum(x, x) * 3; return sum(y, sum(y, x)); }
+int main() { g = weight(2); print(weight(g)); return 0; }
+"""
+    code = parse(source).code({}, 0).to_code()
+    print(" ".join(f"{i.param1}: ENTER {code[pc + 1].param1}" for (pc, i) in enumerate(code)
+                   if i.instruction == I1P.I.JUMP_TARGET and code[pc + 1].instruction == I1P.I.ENTER))
+    size = stack_size(code)
+    print(f"stack size {size}")
+    # the program allocates nothing, the stack is all the memory it needs
+    interpreter = Interpreter(code, memory=size, output=ListSink())
+    interpreter.run()
+    print(interpreter.output.lines)
+
+    fib = parse("int fib(int n) { if (n <= 1) return n; else return fib(n - 1) + fib(n - 2); } int main() { return fib(10); }")
+    print(f"stack size of fib {stack_size(fib.code({}, 0).to_code())}")
@@ -0,0 +1,411 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Callable
+
+from Instructions import Instructions0Params as I0P, Instructions1Params as I1P
+from Image import OPCODES
+
+if TYPE_CHECKING:
+    from Image import Image
+    from Interpreter import Stack
+
+
+def thread(image: Image, S: Stack) -> Callable[[int], int]:
+    """
+    Turns every instruction of the image into a closure with its operand and
+    successor bound, operating on the memory S. The registers live in closure
+    cells while the program runs and are written back to S afterwards.
+
+    Returns a function that runs the program from an unlinked address until it
+    halts and returns the number of steps.
+    """
+    M = S.stack
+    heap = S.heap
+    output = S.output
+    entries = image.entries
+    weights = image.weights
+    n = len(image)
+
+    SP = FP = EP = NP = 0
+    skipped = 0
+
+    def make_add(arg, nxt):
+        def h():
+            nonlocal SP
+            SP -= 1
+            M[SP] = M[SP] + M[SP + 1]
+            return nxt
+        return h
+
+    def make_sub(arg, nxt):
+        def h():
+            nonlocal SP
+            SP -= 1
+            M[SP] = M[SP] - M[SP + 1]
+            return nxt
+        return h
+
+    def make_mul(arg, nxt):
+        def h():
+            nonlocal SP
+            SP -= 1
+            M[SP] = M[SP] * M[SP + 1]
+            return nxt
+        return h
+
+    def make_div(arg, nxt):
+        def h():
+            nonlocal SP
+            SP -= 1
+            M[SP] = M[SP] // M[SP + 1]
+            return nxt
+        return h
+
+    def make_leq(arg, nxt):
+        def h():
+            nonlocal SP
+            SP -= 1
+            M[SP] = 1 if M[SP] <= M[SP + 1] else 0
+            return nxt
+        return h
+
+    def make_geq(arg, nxt):
+        def h():
+            nonlocal SP
+            SP -= 1
+            M[SP] = 1 if M[SP] >= M[SP + 1] else 0
+            return nxt
+        return h
+
+    def make_lt(arg, nxt):
+        def h():
+            nonlocal SP
+            SP -= 1
+            M[SP] = 1 if M[SP] < M[SP + 1] else 0
+            return nxt
+        return h
+
+    def make_gt(arg, nxt):
+        def h():
+            nonlocal SP
+            SP -= 1
+            M[SP] = 1 if M[SP] > M[SP + 1] else 0
+            return nxt
+        return h
+
+    def make_eq(arg, nxt):
+        def h():
+            nonlocal SP
+            SP -= 1
+            M[SP] = 1 if M[SP] == M[SP + 1] else 0
+            return nxt
+        return h
+
+    def make_neg(arg, nxt):
+        def h():
+            M[SP] = -M[SP]
+            return nxt
+        return h
+
+    def make_not(arg, nxt):
+        def h():
+            M[SP] = 1 if M[SP] == 0 else 0
+            return nxt
+        return h
+
+    def make_load(arg, nxt):
+        def h():
+            a = M[SP]
+            if a < 0:
+                raise Exception(f"Access of address {a} outside of memory")
+            M[SP] = M[a]
+            return nxt
+        return h
+
+    def make_store(arg, nxt):
+        def h():
+            nonlocal SP
+            a = M[SP]
+            if a < 0:
+                raise Exception(f"Access of address {a} outside of memory")
+            M[a] = M[SP - 1]
+            SP -= 1
+            return nxt
+        return h
+
+    def make_pop(arg, nxt):
+        def h():
+            nonlocal SP
+            SP -= 1
+            return nxt
+        return h
+
+    def make_print(arg, nxt):
+        def h():
+            output.write(f">> {M[SP]}")
+            return nxt
+        return h
+
+    def make_new(arg, nxt):
+        def h():
+            nonlocal NP
+            (M[SP], NP) = heap.alloc(M[SP], NP, EP)
+            return nxt
+        return h
+
+    def make_free(arg, nxt):
+        def h():
+            nonlocal SP, NP
+            NP = heap.release(M[SP], NP)
+            SP -= 1
+            return nxt
+        return h
+
+    def make_mark(arg, nxt):
+        def h():
+            nonlocal SP
+            M[SP + 1] = EP
+            M[SP + 2] = FP
+            SP += 2
+            return nxt
+        return h
+
+    def make_call(arg, nxt):
+        (ret, _) = arg
+
+        def h():
+            nonlocal FP, skipped
+            (pc, skip) = entries[M[SP]]
+            M[SP] = ret
+            FP = SP
+            skipped += skip
+            return pc
+        return h
+
+    def make_return(arg, nxt):
+        def h():
+            nonlocal SP, FP, EP, skipped
+            (pc, skip) = entries[M[FP]]
+            EP = M[FP - 2]
+            if (EP >= NP):
+                raise Exception("Stack overflow")
+            SP = FP - 3
+            FP = M[SP + 2]
+            skipped += skip
+            return pc
+        return h
+
+    def make_halt(arg, nxt):
+        def h():
+            return n
+        return h
+
+    def make_loadc(arg, nxt):
+        def h():
+            nonlocal SP
+            SP += 1
+            M[SP] = arg
+            return nxt
+        return h
+
+    def make_loadrc(arg, nxt):
+        def h():
+            nonlocal SP
+            SP += 1
+            M[SP] = FP + arg
+            return nxt
+        return h
+
+    def make_jump(arg, nxt):
+        def h():
+            return arg
+        return h
+
+    def make_jumpz(arg, nxt):
+        (target, skip) = arg
+
+        def h():
+            nonlocal SP, skipped
+            SP -= 1
+            if M[SP + 1] == 0:
+                skipped += skip
+                return target
+            return nxt
+        return h
+
+    def make_jumpnz(arg, nxt):
+        (target, skip) = arg
+
+        def h():
+            nonlocal SP, skipped
+            SP -= 1
+            if M[SP + 1] != 0:
+                skipped += skip
+                return target
+            return nxt
+        return h
+
+    def make_alloc(arg, nxt):
+        def h():
+            nonlocal SP
+            SP += arg
+            return nxt
+        return h
+
+    def make_enter(arg, nxt):
+        def h():
+            nonlocal EP
+            EP = SP + arg
+            if EP >= NP:
+                raise Exception("Stack overflow")
+            return nxt
+        return h
+
+    def make_slide(arg, nxt):
+        def h():
+            nonlocal SP
+            tmp = M[SP]
+            SP -= arg
+            M[SP] = tmp
+            return nxt
+        return h
+
+    def make_tailcall(arg, nxt):
+        (m, _) = arg
+
+        def h():
+            nonlocal SP, skipped
+            (pc, skip) = entries[M[SP]]
+            M[FP - 2 - m:FP - 2] = M[SP - m:SP]
+            SP = FP
+            skipped += skip
+            return pc
+        return h
+
+    def make_loadr(arg, nxt):
+        def h():
+            nonlocal SP
+            SP += 1
+            M[SP] = M[FP + arg]
+            return nxt
+        return h
+
+    def make_storer(arg, nxt):
+        def h():
+            nonlocal SP
+            M[FP + arg] = M[SP]
+            SP -= 1
+            return nxt
+        return h
+
+    def make_addc(arg, nxt):
+        def h():
+            M[SP] += arg
+            return nxt
+        return h
+
+    def make_callf(arg, nxt):
+        (ret, target) = arg
+
+        def h():
+            nonlocal SP, FP
+            M[SP + 1] = EP
+            M[SP + 2] = FP
+            SP += 3
+            M[SP] = ret
+            FP = SP
+            return target
+        return h
+
+    def make_loadk(arg, nxt):
+        def h():
+            nonlocal SP
+            a = M[SP]
+            if not 0 <= a <= len(M) - arg:
+                raise Exception(f"Access of address {a} outside of memory")
+            M[SP:SP + arg] = M[a:a + arg]
+            SP += arg - 1
+            return nxt
+        return h
+
+    def make_storek(arg, nxt):
+        def h():
+            nonlocal SP
+            a = M[SP]
+            if not 0 <= a <= len(M) - arg:
+                raise Exception(f"Access of address {a} outside of memory")
+            M[a:a + arg] = M[SP - arg:SP]
+            SP -= 1
+            return nxt
+        return h
+
+    def make_move(arg, nxt):
+        def h():
+            nonlocal SP
+            (a, b) = (M[SP - 1], M[SP])
+            for c in (a, b):
+                if not 0 <= c <= len(M) - arg:
+                    raise Exception(f"Access of address {c} outside of memory")
+            M[b:b + arg] = M[a:a + arg]
+            SP -= 2
+            return nxt
+        return h
+
+    makers = {
+        I0P.I.ADD: make_add,
+        I0P.I.SUB: make_sub,
+        I0P.I.MUL: make_mul,
+        I0P.I.DIV: make_div,
+        I0P.I.LEQ: make_leq,
+        I0P.I.GEQ: make_geq,
+        I0P.I.LT: make_lt,
+        I0P.I.GT: make_gt,
+        I0P.I.EQ: make_eq,
+        I0P.I.NEG: make_neg,
+        I0P.I.NOT: make_not,
+        I0P.I.LOAD: make_load,
+        I0P.I.STORE: make_store,
+        I0P.I.POP: make_pop,
+        I0P.I.PRINT: make_print,
+        I0P.I.NEW: make_new,
+        I0P.I.FREE: make_free,
+        I0P.I.MARK: make_mark,
+        I0P.I.CALL: make_call,
+        I0P.I.RETURN: make_return,
+        I0P.I.HALT: make_halt,
+        I1P.I.LOADC: make_loadc,
+        I1P.I.LOADRC: make_loadrc,
+        I1P.I.JUMP: make_jump,
+        I1P.I.JUMPZ: make_jumpz,
+        I1P.I.ALLOC: make_alloc,
+        I1P.I.ENTER: make_enter,
+        I1P.I.SLIDE: make_slide,
+        I1P.I.TAILCALL: make_tailcall,
+        I1P.I.LOADR: make_loadr,
+        I1P.I.STORER: make_storer,
+        I1P.I.ADDC: make_addc,
+        I1P.I.CALLF: make_callf,
+        I1P.I.LOADK: make_loadk,
+        I1P.I.STOREK: make_storek,
+        I1P.I.MOVE: make_move,
+        I1P.I.JUMPNZ: make_jumpnz,
+    }
+
+    handlers = [makers[OPCODES[op]](arg, pc + 1)
+                for pc, (op, arg) in enumerate(zip(image.ops, image.args))]
+
+    def run(address: int) -> int:
+        nonlocal SP, FP, EP, NP, skipped
+        (SP, FP, EP, NP) = (S.SP, S.FP, S.EP, S.NP)
+        skipped = 0
+
+        (pc, step) = entries[address]
+        try:
+            while pc < n:
+                step += weights[pc]
+                pc = handlers[pc]()
+        finally:
+            (S.SP, S.FP, S.EP, S.NP) = (SP, FP, EP, NP)
+
+        return step + skipped
+
+    return run
@@ -0,0 +1,97 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, BinaryIO, Optional
+from array import array
+import re
+
+from Instructions import bcolors
+
+if TYPE_CHECKING:
+    from Instructions import Instructions
+
+
+# Every record is FIELDS int64s: the (unlinked) address of the instruction,
+# its opcode, SP, FP and the topmost element of the stack before executing it
+FIELDS = 5
+PC, OP, SP, FP, TOP = range(FIELDS)
+
+# Stands for tops that are no int64 (uninitialized cells, huge numbers) and
+# for the top of the empty stack
+NO_VALUE = -2**63
+
+TRACE_CAPACITY = 1 << 16
+
+ANSI = re.compile("\x1b\\[[0-9;]*[A-Za-z]")
+
+
+class Trace:
+    """
+    The records of the instructions a run executed, kept in a ring buffer of
+    the last capacity records. Given a binary file, every record is also
+    appended to it whenever the ring fills up and when the run ends, so the
+    whole run can be loaded again.
+
+    JUMP_TARGETs are not executed by the image interpreter and therefore not
+    recorded.
+    """
+
+    def __init__(self, capacity: int = TRACE_CAPACITY, file: Optional[BinaryIO] = None):
+        self.capacity = capacity
+        self.buffer = array("q", bytes(8 * FIELDS * capacity))
+        self.file = file
+        # records ever made and records written to the file
+        self.count = 0
+        self.written = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def first(self) -> int:
+        """Number of the oldest record still in the buffer"""
+        return self.count - len(self)
+
+    def __getitem__(self, k: int) -> tuple[int, ...]:
+        """Record number k of the run"""
+        if not self.first() <= k < self.count:
+            raise IndexError(f"Record {k} is not in the trace")
+        i = (k % self.capacity) * FIELDS
+        return tuple(self.buffer[i:i + FIELDS])
+
+    def flush(self):
+        """Appends the records not yet written to the file"""
+        if self.file is None:
+            return
+        k = self.written
+        while k < self.count:
+            start = k % self.capacity
+            stop = min(start + self.count - k, self.capacity)
+            self.buffer[start * FIELDS:stop * FIELDS].tofile(self.file)
+            k += stop - start
+        self.written = self.count
+
+    @staticmethod
+    def load(file: BinaryIO) -> Trace:
+        """Reads all records of a trace file"""
+        records = array("q", file.read())
+        trace = Trace(0)
+        trace.capacity = trace.count = trace.written = len(records) // FIELDS
+        trace.buffer = records
+        return trace
+
+    def render(self, code: list[Instructions], start: int = -20, stop: Optional[int] = None) -> str:
+        """
+        Renders the retained records start to stop, counted like a list of
+        them, as the listing of a debug run
+        """
+        lines = []
+        for k in range(*slice(start, stop).indices(len(self))):
+            (pc, op, sp, fp, top) = self[self.first() + k]
+            IR = code[pc]
+            real_ir_length = len(ANSI.sub("", str(IR)))
+            top = "_" if top == NO_VALUE else top
+            lines.append(
+                f"Record {self.first() + k}, top of stack: {top}")
+            lines.append(
+                f"Instruction: {str(IR)+' ' * (18 - real_ir_length)} {bcolors.OKBLUE +str(IR.description()) + bcolors.ENDC}")
+            lines.append(f"PC: {pc + 1: > 5}, SP: {sp: > 5}, FP: {fp: > 5}")
+            lines.append("")
+        return "\n".join(lines)
@@ -0,0 +1,76 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+
+from ASTNode import CompilationResult
+from Instructions import encode, decode
+
+if TYPE_CHECKING:
+    from Context import Context
+    from Nodes import FunctionDefinition
+
+
+def compile_unit(function: FunctionDefinition, addressSpace: Context, n) -> CompilationResult:
+    """Code for the function with labels of its own"""
+    return function.code(addressSpace.unit(function.name), n)
+
+
+# Fewer functions are compiled serially; starting the processes would take
+# longer than compiling them
+PARALLEL_FUNCTIONS = 200
+
+# The functions, context and n of the compilation, which forked workers inherit
+_UNITS = None
+
+
+def processors() -> int:
+    """The processors this process may run on"""
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+
+def _compile(functions: list[FunctionDefinition], addressSpace: Context, n) -> list[list]:
+    return [encode(compile_unit(function, addressSpace, n).to_code()) for function in functions]
+
+
+def _compile_inherited(start: int, stop: int) -> list[list]:
+    """The encoded code of the functions start to stop, in a forked worker"""
+    (functions, addressSpace, n) = _UNITS
+    return _compile(functions[start:stop], addressSpace, n)
+
+
+def compile_units(functions: list[FunctionDefinition], addressSpace: Context, n, workers: int = 1) -> list[CompilationResult]:
+    """
+    Code for every function. As every function is compiled on its own, the
+    code is the same however the work is scheduled.
+
+    With more than one worker and at least PARALLEL_FUNCTIONS functions, the
+    functions are compiled in a pool of at most as many processes as there
+    are processors. Every worker compiles its own share of the functions and
+    sends back the encoded code of each. Workers forked from this process
+    inherit the functions and are only sent where their share starts and
+    stops, others are sent their share. Sending the compilation results with
+    their nodes would take longer than compiling them, so the result of a
+    function is its code alone
+    """
+    workers = min(workers, processors())
+    if workers <= 1 or len(functions) < max(2, PARALLEL_FUNCTIONS):
+        return [compile_unit(function, addressSpace, n) for function in functions]
+
+    global _UNITS
+    share = -(-len(functions) // workers)
+    bounds = [(start, min(start + share, len(functions))) for start in range(0, len(functions), share)]
+    if "fork" in multiprocessing.get_all_start_methods():
+        _UNITS = (functions, addressSpace, n)
+        try:
+            with ProcessPoolExecutor(len(bounds), mp_context=multiprocessing.get_context("fork")) as pool:
+                shares = list(pool.map(_compile_inherited, *zip(*bounds)))
+        finally:
+            _UNITS = None
+    else:
+        with ProcessPoolExecutor(len(bounds)) as pool:
+            shares = list(pool.map(_compile, [functions[start:stop] for (start, stop) in bounds],
+                                   [addressSpace] * len(bounds), [n] * len(bounds)))
+    return [CompilationResult(decode(code), "Code for function definition", function)
+            for (code, function) in zip((code for share in shares for code in share), functions)]
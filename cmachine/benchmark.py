@@ -0,0 +1,334 @@
+from time import perf_counter
+import io
+import sys
+
+from ASTNode import CompilationResult
+from Nodes import *
+from Instructions import Instructions0Params as I0P, Instructions1Params as I1P
+from Interpreter import Interpreter
+from Output import ListSink
+from Peephole import optimize
+from Loops import hoist_invariants
+from Image import link
+from Incremental import IncrementalCompiler
+from Linker import compile_object, link_objects
+from Parser import parse
+from Units import processors
+
+
+def fib(k: int) -> Program:
+    # the program measured in plot.ipynb. Its runs take one step less than
+    # the StepCount there, e.g. 437835 for fib(20): functions used to start
+    # with a label of their name and one of their own, and the prologue
+    # called main through the first, falling through the second
+    return Program([], [
+        FunctionDefinition("int", "fib", [
+            DeclareVariable("int", 1, 1, "n", StatementSequence())
+        ],
+            IfElse(
+            BinaryOperation(
+                Variable("int", "n"), I0P.I.LEQ, Number(1)),
+            Return(Variable("int", "n")),
+            Return(BinaryOperation(
+                FunctionCall(Variable("*fac(int)", "fib"), [BinaryOperation(
+                    Variable("int", "n"), I0P.I.SUB, Number(1))]),
+                I0P.I.ADD,
+                FunctionCall(Variable("*fac(int)", "fib"), [BinaryOperation(
+                    Variable("int", "n"), I0P.I.SUB, Number(2))])
+            ))
+        )
+        ),
+        FunctionDefinition("int", "main", [],
+                           DeclareVariable("int", 1, 1, "res",
+                           StatementSequence(
+                               Assignment(Variable("int", "res"),
+                                          FunctionCall(Variable("*fac(int)", "fib"), [Number(k)])),
+
+                               Return(Variable("int", "res")))
+        )
+        )
+    ])
+
+
+def straight_line(n: int) -> Program:
+    # x = x + k for k below n, about seven instructions per statement
+    statements = [Assignment(Variable("int", "x"), Number(0))]
+    for k in range(n):
+        statements.append(Assignment(Variable("int", "x"), BinaryOperation(
+            Variable("int", "x"), I0P.I.ADD, Number(k))))
+    statements.append(Return(Variable("int", "x")))
+    return Program([], [FunctionDefinition("int", "main", [],
+                                           DeclareVariable("int", 1, 1, "x", StatementSequence(*statements)))])
+
+
+def nested(n: int) -> Program:
+    # ((1 + 0) + 1) + ... with n additions, a compilation result n deep
+    expr = Number(1)
+    for k in range(n):
+        expr = BinaryOperation(expr, I0P.I.ADD, Number(k))
+    return Program([], [FunctionDefinition("int", "main", [], Return(expr))])
+
+
+def declarations(n: int) -> Program:
+    # n locals, each declared around the rest of the function, summed up
+    body = StatementSequence(Return(BinaryOperation(
+        Variable("int", "x0"), I0P.I.ADD, Variable("int", f"x{n - 1}"))))
+    for k in reversed(range(n)):
+        body = DeclareVariable("int", 1, 1, f"x{k}", StatementSequence(
+            Assignment(Variable("int", f"x{k}"), Number(k)), body))
+    return Program([], [FunctionDefinition("int", "main", [], body)])
+
+
+def functions(n: int) -> Program:
+    # n functions summing a loop, each adding the result of the one before
+    definitions = []
+    for k in range(n):
+        body = StatementSequence(
+            Assignment(Variable("int", "s"), Number(0)),
+            For(Assignment(Variable("int", "i"), Number(0)),
+                BinaryOperation(Variable("int", "i"), I0P.I.LT, Variable("int", "n")),
+                Assignment(Variable("int", "i"), BinaryOperation(Variable("int", "i"), I0P.I.ADD, Number(1))),
+                IfElse(BinaryOperation(Variable("int", "s"), I0P.I.GT, Number(1000)),
+                       Assignment(Variable("int", "s"), Number(0)),
+                       Assignment(Variable("int", "s"), BinaryOperation(Variable("int", "s"), I0P.I.ADD, Number(k))))),
+            Return(Variable("int", "s") if k == 0 else BinaryOperation(Variable("int", "s"), I0P.I.ADD, FunctionCall(
+                Variable(f"*f{k - 1}(int)", f"f{k - 1}"), [Variable("int", "n")]))))
+        definitions.append(FunctionDefinition("int", f"f{k}", [DeclareVariable("int", 1, 1, "n", StatementSequence())],
+                                              DeclareVariable("int", 1, 1, "s", DeclareVariable("int", 1, 1, "i", body))))
+    definitions.append(FunctionDefinition("int", "main", [], Return(FunctionCall(
+        Variable(f"*f{n - 1}(int)", f"f{n - 1}"), [Number(10)]))))
+    return Program([], definitions)
+
+
+def struct_copies(k: int, n: int, whole: bool) -> Program:
+    # a struct of k members copied n times, as a whole or member by member
+    members = " ".join(f"int m{j};" for j in range(k))
+    copy = "b = a;" if whole else " ".join(f"b.m{j} = a.m{j};" for j in range(k))
+    return parse(f"""
+struct s {{ {members} }};
+int main() {{
+    struct s a; struct s b; int i;
+    {" ".join(f"a.m{j} = {j};" for j in range(k))}
+    for (i = 0; i < {n}; i = i + 1) {{ {copy} }}
+    return b.m{k - 1};
+}}""")
+
+
+def loops(n: int, w: int, calls: int) -> Program:
+    # nested loops, the inner one with invariants of its own and of the outer
+    # one, in a function called often enough to be compiled
+    return parse(f"""
+int f(int n, int w) {{
+    int i; int j; int s;
+    s = 0;
+    for (i = 0; i < n - 1; i = i + 1) {{
+        j = 0;
+        while (j < w * 2) {{ s = s + i * w + (n - 1) - j; j = j + 1; }}
+    }}
+    return s;
+}}
+int main() {{ int k; int r; r = 0; for (k = 0; k < {calls}; k = k + 1) r = r + f({n}, {w}) - k; return r; }}""")
+
+
+def to_code_recursive(result: CompilationResult) -> list:
+    # the flattening to_code replaced, for comparison
+    code = []
+    for i in result.code:
+        if type(i) == CompilationResult:
+            code += to_code_recursive(i)
+        else:
+            code.append(i)
+    return code
+
+
+ENGINES = {
+    "instructions": Interpreter.run_instructions,
+    "image": Interpreter.run_image,
+    "threaded": Interpreter.run_threaded,
+    "jit": Interpreter.run_jit,
+}
+
+
+def measure(program: Program, engine: str, peephole=False, hoist=False):
+    if hoist:
+        program = hoist_invariants(program, [])
+    code = program.code({}, 0).to_code()
+    if peephole:
+        code = optimize(code)
+    s = Interpreter(code, output=ListSink())
+
+    start = perf_counter()
+    steps = ENGINES[engine](s)
+    elapsed = perf_counter() - start
+
+    return steps, s.stack.stack[0], elapsed
+
+
+def measure_export(program: Program, **options):
+    """Seconds to compile the program and to export its compilation result"""
+    start = perf_counter()
+    result = program.code({}, 0)
+    code = result.to_code()
+    compiled = perf_counter() - start
+
+    start = perf_counter()
+    result.write_json(io.StringIO(), **options)
+    exported = perf_counter() - start
+
+    return len(code), compiled, exported
+
+
+def measure_flatten(program: Program):
+    """Seconds to flatten the compiled program with to_code and recursively"""
+    result = program.code({}, 0)
+
+    start = perf_counter()
+    code = result.to_code()
+    iterative = perf_counter() - start
+
+    start = perf_counter()
+    try:
+        to_code_recursive(result)
+        recursive = perf_counter() - start
+    except RecursionError:
+        recursive = None
+
+    return len(code), iterative, recursive
+
+
+def measure_compile(program: Program, workers: int = 1):
+    """Seconds to compile the program and its code"""
+    start = perf_counter()
+    code = program.code({}, 0, workers).to_code()
+    return perf_counter() - start, code
+
+
+def measure_edit(program: Program, edits: int = 5):
+    """
+    Seconds to compile and link the program, and to compile it again
+    incrementally after changing a constant in its middle function
+    """
+    start = perf_counter()
+    link(program.code({}, 0).to_code())
+    full = perf_counter() - start
+    compiler = IncrementalCompiler()
+    compiler.compile(program)
+    # the first statement of functions(n), s = 0
+    function = program.functions[len(program.functions) // 2]
+    statement = function.body.ss.ss.nodes[0]
+    incremental = []
+    for k in range(edits):
+        statement.right = Number(k + 1)
+        start = perf_counter()
+        compiler.compile(program, [function.name])
+        incremental.append(perf_counter() - start)
+    return full, min(incremental), compiler.compiled
+
+
+def measure_link(n: int, programs: int = 100):
+    """
+    Seconds per program to compile small programs calling the last of the
+    functions of functions(n), along with the functions, and to link them
+    with the functions compiled once as a library
+    """
+    library = functions(n).functions[:-1]
+    call = f"*f{n - 1}(int)"
+    mains = [FunctionDefinition("int", "main", [], Return(FunctionCall(Variable(call, f"f{n - 1}"), [Number(k)])))
+             for k in range(programs)]
+    start = perf_counter()
+    for main in mains:
+        Program([], [*library, main]).code({}, 0).to_code()
+    full = (perf_counter() - start) / programs
+    start = perf_counter()
+    shared = compile_object(Program([], library), "library")
+    once = perf_counter() - start
+    start = perf_counter()
+    for main in mains:
+        unit = compile_object(Program([], [main], [], [DeclareVariable(call, 1, 1, f"f{n - 1}", StatementSequence())]))
+        link_objects([unit, shared])
+    linked = (perf_counter() - start) / programs
+    return full, once, linked
+
+
+if __name__ == '__main__':
+
+    InputNumber = [1, 4, 8, 16, 18, 20]
+
+    print(f"{'n':>4} {'engine':>14} {'peephole':>9} {'steps':>10} {'result':>8} {'time [s]':>10}")
+    for k in InputNumber:
+        for engine in ENGINES:
+            for peephole in [False, True]:
+                steps, result, elapsed = measure(fib(k), engine, peephole)
+                print(f"{k:>4} {engine:>14} {str(peephole):>9} {steps:>10} {result:>8} {elapsed:>10.4f}")
+
+    # compiled calls still set up the CMa frame in memory and are Python calls,
+    # which is most of what remains of a fib run
+    print(f"\n{'n':>4} {'image [s]':>10} {'jit [s]':>10} {'speedup':>8}")
+    for k in [18, 20, 22]:
+        image = min(measure(fib(k), "image")[2] for _ in range(3))
+        jit = min(measure(fib(k), "jit")[2] for _ in range(3))
+        print(f"{k:>4} {image:>10.4f} {jit:>10.4f} {image / jit:>8.2f}")
+    if image < 5 * jit:
+        raise Exception("The JIT runs fib less than five times as fast as the image")
+
+    print(f"\n{'instructions':>12} {'export':>34} {'compile [s]':>12} {'export [s]':>11}")
+    for options in [{}, {"indent": None}, {"indent": None, "nodes": False}]:
+        size, compiled, exported = measure_export(straight_line(7000), **options)
+        print(f"{size:>12} {str(options):>34} {compiled:>12.4f} {exported:>11.4f}")
+        # the compact export with the printed nodes takes no longer than compiling
+        if options == {"indent": None} and exported > compiled:
+            raise Exception("Exporting the compilation result takes longer than compiling it")
+
+    # compiling is recursive, flattening the result is not
+    sys.setrecursionlimit(100000)
+    print(f"\n{'depth':>6} {'instructions':>12} {'to_code [s]':>12} {'recursive [s]':>14}")
+    for n in [500, 1000, 2000, 4000, 8000]:
+        size, iterative, recursive = measure_flatten(nested(n))
+        recursive = "RecursionError" if recursive is None else f"{recursive:.4f}"
+        print(f"{n:>6} {size:>12} {iterative:>12.4f} {recursive:>14}")
+
+    print(f"\n{'declarations':>12} {'compile [s]':>12} {'per declaration [us]':>21} {'vs 1000':>8}")
+    per_declaration = {}
+    for n in [1000, 2000, 4000, 8000]:
+        (compiled, _) = measure_compile(declarations(n))
+        per_declaration[n] = compiled / n
+        print(f"{n:>12} {compiled:>12.4f} {compiled / n * 1e6:>21.2f} {per_declaration[n] / per_declaration[1000]:>8.2f}")
+    # compiling takes linear time in the declarations; it was quadratic
+    # whenever a declaration looked at the whole rest of its block
+    if per_declaration[8000] > 4 * per_declaration[1000]:
+        raise Exception("Compiling declarations no longer takes linear time")
+
+    # at most processors() workers run, fewer than PARALLEL_FUNCTIONS functions are compiled serially
+    print(f"\n{'functions':>9} {'workers':>8} {'compile [s]':>12} {'speedup':>8} {'same code':>10}  ({processors()} processors)")
+    for n in [100, 400, 1600, 6400]:
+        program = functions(n)
+        (serial, reference) = measure_compile(program)
+        for workers in [1, 2, 4]:
+            (compiled, code) = measure_compile(program, workers)
+            print(f"{n:>9} {workers:>8} {compiled:>12.4f} {serial / compiled:>8.2f} "
+                  f"{str(list(map(str, code)) == list(map(str, reference))):>10}")
+
+    print(f"\n{'functions':>9} {'compile and link [s]':>21} {'edit one [s]':>13} {'recompiled':>11}")
+    for n in [100, 400, 1600]:
+        (full, incremental, compiled) = measure_edit(functions(n))
+        print(f"{n:>9} {full:>21.4f} {incremental:>13.4f} {len(compiled):>11}")
+
+    print(f"\n{'library':>7} {'compile all [s]':>16} {'compile library [s]':>20} {'link [s]':>9}")
+    for n in [10, 100, 400]:
+        (full, once, linked) = measure_link(n)
+        print(f"{n:>7} {full:>16.4f} {once:>20.4f} {linked:>9.4f}")
+
+    print(f"\n{'members':>7} {'copy':>9} {'engine':>8} {'steps':>8} {'result':>7} {'time [s]':>9}")
+    for k in [4, 16, 64]:
+        for whole in [False, True]:
+            for engine in ["image", "threaded"]:
+                steps, result, elapsed = measure(struct_copies(k, 1000, whole), engine, peephole=True)
+                print(f"{k:>7} {'struct' if whole else 'members':>9} {engine:>8} {steps:>8} {result:>7} {elapsed:>9.4f}")
+
+    # the loops test their condition at the bottom, which saves the JUMP of every iteration
+    print(f"\n{'n':>4} {'engine':>8} {'hoisted':>8} {'steps':>8} {'per iteration':>14} {'result':>8} {'time [s]':>9}")
+    for n in [10, 50, 200]:
+        for engine in ["image", "threaded", "jit"]:
+            for hoist in [False, True]:
+                steps, result, elapsed = measure(loops(n, 10, 20), engine, peephole=True, hoist=hoist)
+                print(f"{n:>4} {engine:>8} {str(hoist):>8} {steps:>8} {steps / (20 * (n - 1) * 20):>14.2f} {result:>8} {elapsed:>9.4f}")
@@ -1,6 +1,10 @@
 from Nodes import *
 from Instructions import Instructions0Params as I0P, Instructions1Params as I1P
 from Interpreter import Interpreter
+from Cache import CompileCache
+from Loops import hoist_invariants
+from Parser import parse_file
+import sys
 
 
 if __name__ == '__main__':
@@ -60,18 +64,35 @@ if __name__ == '__main__':
 
     ])
 
+    # a MiniC source file replaces the program above
+    if len(sys.argv) > 1:
+        expr = parse_file(sys.argv[1])
+
     variable_adress: dict[str, (chr, int)] = {}
 
-    print(expr, "\n")
+    cache = CompileCache()
+    key = cache.key(expr, variable_adress, 0)
+    code = cache.get(key)
+
+    if code is None:
+        report: list[str] = []
+        expr = expr.simplify(report)
+        expr = hoist_invariants(expr, report)
+        print(f"Simplifications: [{len(report)}]")
+        for line in report:
+            print(line)
 
-    comp_result = expr.code(variable_adress, 0)
+        print(expr, "\n")
 
-    comp_result_json = comp_result.to_json()
+        comp_result = expr.code(variable_adress, 0)
 
-    with open("comp_result.json", "w") as f:
-        f.write(comp_result_json)
+        comp_result.save_json("comp_result.json")
 
-    code = comp_result.to_code()
+        code = comp_result.to_code()
+        cache.put(key, code)
+    else:
+        print(expr, "\n")
+        print(f"Code from the compile cache ({key[:12]})\n")
 
     print(f"Code: [{len(code)} instructions]\n{code}\n")
 
@@ -82,3 +103,4 @@ if __name__ == '__main__':
     s.run(debug=True)
 
     print("Exit code: ", s.stack.stack[0], "\n")
+    print("Heap: ", s.stack.heap.stats(s.stack.NP), "\n")
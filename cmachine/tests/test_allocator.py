@@ -0,0 +1,80 @@
+import pytest
+
+from Allocator import Allocator
+from Interpreter import Interpreter
+from Output import ListSink
+from Parser import parse
+
+SIZE = 100
+
+
+def blocks(allocator: Allocator, *sizes: int) -> tuple[list[int], int]:
+    """Allocates blocks of the sizes on an empty stack, returns their addresses and NP"""
+    (addresses, NP) = ([], SIZE)
+    for size in sizes:
+        (address, NP) = allocator.alloc(size, NP, 0)
+        addresses.append(address)
+    return (addresses, NP)
+
+
+def test_free_merges_with_both_neighbours():
+    allocator = Allocator(SIZE)
+    ([a, b, c, d], NP) = blocks(allocator, 2, 2, 2, 2)
+    assert [a, b, c, d, NP] == [98, 96, 94, 92, 92]
+    NP = allocator.release(a, NP)
+    NP = allocator.release(c, NP)
+    assert allocator.free_blocks == {98: 2, 94: 2}
+    assert allocator.stats(NP)["fragmentation"] == 0.5
+    NP = allocator.release(b, NP)
+    assert allocator.free_blocks == {94: 6}
+    assert allocator.stats(NP)["fragmentation"] == 0.0
+    assert NP == 92
+    # the merged block serves a larger request, the rest stays free
+    (address, NP) = allocator.alloc(5, NP, 0)
+    assert (address, NP) == (94, 92)
+    assert allocator.free_blocks == {99: 1}
+
+
+def test_block_at_np_goes_back_to_the_unused_memory():
+    allocator = Allocator(SIZE)
+    ([a, b, c], NP) = blocks(allocator, 3, 4, 5)
+    NP = allocator.release(b, NP)
+    assert NP == 88
+    # c merges with b, which is free, and a is still used
+    NP = allocator.release(c, NP)
+    assert NP == 97
+    assert allocator.free_blocks == {} and allocator.free_cells == 0
+    NP = allocator.release(a, NP)
+    assert NP == SIZE
+    stats = allocator.stats(NP)
+    assert (stats["heap"], stats["peak heap"], stats["in use"], stats["live blocks"]) == (0, 12, 0, 0)
+
+
+@pytest.mark.parametrize("address", [98, 97, 50])
+def test_free_of_no_block_raises(address):
+    allocator = Allocator(SIZE)
+    ([a, b], NP) = blocks(allocator, 2, 2)
+    NP = allocator.release(a, NP)
+    with pytest.raises(Exception, match=f"Free of {address}, which is not an allocated block"):
+        allocator.release(address, NP)
+
+
+def test_full_heap_returns_null():
+    allocator = Allocator(SIZE)
+    (address, NP) = allocator.alloc(60, SIZE, 30)
+    assert (address, NP) == (40, 40)
+    assert allocator.alloc(20, NP, 30) == (0, 40)
+
+
+@pytest.mark.parametrize("engine", ["instructions", "image", "threaded", "jit"])
+def test_malloc_free_loop_runs_in_bounded_heap(engine):
+    source = ("int main() { int i; int s; int *p; int *q; s = 0; for (i = 0; i < 2000; i++) { "
+              "p = malloc(3 + i / 500); q = malloc(2); p[0] = i; q[1] = 1; s = s + p[0] + q[1]; free(p); free(q); } "
+              "return s; }")
+    interpreter = Interpreter(parse(source).code({}, 0).to_code(), memory=200, output=ListSink())
+    getattr(interpreter, f"run_{engine}")()
+    S = interpreter.stack
+    assert S.stack[0] == sum(range(2000)) + 2000
+    stats = S.heap.stats(S.NP)
+    assert (stats["allocations"], stats["frees"], stats["heap"]) == (4000, 4000, 0)
+    assert stats["peak heap"] <= 8
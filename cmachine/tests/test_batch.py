@@ -0,0 +1,41 @@
+import pytest
+
+from Batch import Job, run_batch
+from Interpreter import Interpreter
+from Output import ListSink
+from Parser import parse
+
+PROGRAMS = [
+    "int n; int fib(int k) { if (k <= 1) return k; return fib(k - 1) + fib(k - 2); } "
+    "int main() { print(n); return fib(n); }",
+    "int main() { int *p; int i; int s; s = 0; for (i = 0; i < 50; i++) { p = malloc(4); p[0] = i; s = s + p[0]; "
+    "free(p); } print(s); return s; }",
+    "int main() { int *p; p = malloc(1); return p[0] + 1; }",
+]
+
+
+def serial(code, cells: dict[int, int], engine: str):
+    s = Interpreter(code, output=ListSink())
+    for (address, value) in cells.items():
+        s.stack[address] = value
+    try:
+        steps = getattr(s, f"run_{engine}")()
+    except Exception as e:
+        return (None, str(e))
+    return (s.stack.stack[0], s.output.getvalue(), steps)
+
+
+@pytest.mark.parametrize("engine", ["image", "threaded", "jit"])
+def test_pool_matches_serial_runs(engine):
+    programs = [parse(source).code({}, 0).to_code() for source in PROGRAMS]
+    # n is the first global, after the return cell of main
+    jobs = [Job(0, {1: k}) for k in [12, 3, 12, 0]] + [Job(1), Job(2), Job(1), Job(0, {1: 7})]
+    results = run_batch(programs, jobs, workers=2, engine=engine)
+    for (job, result) in zip(jobs, results):
+        expected = serial(programs[job.program], job.cells, engine)
+        if result.error is not None:
+            assert (result.exit_code, result.error) == expected
+        else:
+            assert (result.exit_code, result.output, result.steps) == expected
+    assert results[0].exit_code == 144 and results[1].exit_code == 2
+    assert results[5].error is not None
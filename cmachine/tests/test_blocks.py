@@ -0,0 +1,71 @@
+import pytest
+
+from Interpreter import Interpreter
+from Jit import JIT_THRESHOLD
+from Output import ListSink
+from Parser import parse
+from Peephole import optimize
+
+# struct values are copied with MOVE between memory, LOADK onto the stack
+# and STOREK from it
+SOURCE = """
+struct p { int a; int b[2]; int c; };
+struct p g;
+int sum(struct p v) { v.a = v.a + 100; return v.a + v.b[0] + v.b[1] + v.c; }
+struct p *make() { struct p *r; r = malloc(4); r->a = 7; r->b[0] = 8; r->b[1] = 9; r->c = 10; return r; }
+int main() { struct p x; struct p y; struct p z; struct p *r; int i; int s;
+  x.a = 1; x.b[0] = 2; x.b[1] = 3; x.c = 4;
+  y = x; g = y; r = make(); z = *r; *r = x; z = y = z;
+  x.a = 50;
+  print(sum(x)); print(sum(y)); print(x.a); print(y.a + g.a + r->c + z.c);
+  s = 0; for (i = 0; i < %d; i++) { y.c = i; s = s + sum(y); }
+  print(s); print(y.a);
+  return sum(g); }
+""" % (2 * JIT_THRESHOLD)
+
+
+def run(code, engine: str):
+    interpreter = Interpreter(code, output=ListSink())
+    steps = getattr(interpreter, f"run_{engine}")()
+    return (interpreter.stack.stack[0], interpreter.output.getvalue().split(), steps)
+
+
+@pytest.mark.parametrize("peephole", [False, True])
+@pytest.mark.parametrize("engine", ["instructions", "image", "threaded", "jit"])
+def test_struct_copies(engine, peephole):
+    code = parse(SOURCE).code({}, 0).to_code()
+    names = {i.instruction.name for i in code}
+    assert {"MOVE", "LOADK", "STOREK"} <= names
+    if peephole:
+        code = optimize(code)
+    loop = sum(107 + 8 + 9 + i for i in range(2 * JIT_THRESHOLD))
+    (result, output, steps) = run(code, engine)
+    assert result == 101 + 2 + 3 + 4
+    assert output == [">>", "159", ">>", "134", ">>", "50", ">>", "22", ">>", str(loop), ">>", "7"]
+    assert steps == run(code, "instructions")[2]
+
+# the same copies on the heap, where the JIT compiles every function
+HEAP = """
+struct q { int a; int b; int c; };
+int total(struct q v) { v.a = v.a + 1; return v.a + v.b + v.c; }
+int copy(struct q *d, struct q *s) { *d = *s; d->a = d->a + 1; return total(*d) + d->a; }
+int chain(struct q *d, struct q *s) { return total(*d = *s) + d->b; }
+int main() { struct q *x; struct q *y; int i; int s; x = malloc(3); y = malloc(3);
+  x->a = 1; x->b = 2; x->c = 3; s = 0;
+  for (i = 0; i < 30; i++) { x->c = i; s = s + copy(y, x) + chain(y, x); }
+  print(y->a + y->b + y->c); return s; }
+"""
+
+
+@pytest.mark.parametrize("engine", ["instructions", "image", "threaded", "jit"])
+def test_compiled_struct_copies(engine):
+    code = parse(HEAP).code({}, 0).to_code()
+    interpreter = Interpreter(code, output=ListSink())
+    steps = getattr(interpreter, f"run_{engine}")()
+    assert interpreter.stack.stack[0] == 1260
+    assert interpreter.output.getvalue().split() == [">>", "32"]
+    assert steps == run(code, "instructions")[2]
+    if engine == "jit":
+        assert not interpreter.jit.failures
+        assert len(interpreter.jit.compiled) == 3
+        assert None not in interpreter.jit.compiled.values()
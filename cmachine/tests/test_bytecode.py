@@ -0,0 +1,45 @@
+import pytest
+
+from Bytecode import write, load
+from Interpreter import Interpreter
+from Output import ListSink
+from Parser import parse
+
+SOURCE = """
+struct p { int a; int b; };
+int fib(int n) { if (n <= 1) return n; return fib(n - 1) + fib(n - 2); }
+int sum(int n, int a) { if (n <= 0) return a; return sum(n - 1, a + n); }
+int main() { struct p q; int *r; r = malloc(2); r[1] = fib(10); q.a = sum(20, 0); q.b = r[1];
+             print(q.a); print(q.b); free(r); return q.a - q.b; }
+"""
+
+
+def run(code, engine: str, image=None):
+    interpreter = Interpreter(code, output=ListSink(), image=image)
+    steps = getattr(interpreter, f"run_{engine}")()
+    return (interpreter.stack.stack[0], interpreter.output.getvalue(), steps)
+
+
+@pytest.mark.parametrize("copy", [False, True])
+@pytest.mark.parametrize("engine", ["instructions", "image", "threaded", "jit"])
+def test_round_trip(tmp_path, engine, copy):
+    result = parse(SOURCE).code({}, 0)
+    code = result.to_code()
+    path = tmp_path / "program.cma"
+    with open(path, "wb") as f:
+        write(f, code, result)
+    bytecode = load(str(path), copy)
+    assert run(bytecode.code, engine, bytecode.image) == run(code, engine)
+    assert [str(i) for i in bytecode.code] == [str(i) for i in code]
+    assert len(bytecode.debug) == len(code)
+
+
+def test_instructions_are_built_where_used(tmp_path):
+    code = parse(SOURCE).code({}, 0).to_code()
+    path = tmp_path / "program.cma"
+    with open(path, "wb") as f:
+        write(f, code)
+    bytecode = load(str(path))
+    run(bytecode.code, "image", bytecode.image)
+    assert bytecode.code.instructions.count(None) == len(code)
+    assert bytecode.debug is None
@@ -0,0 +1,38 @@
+import io
+import json
+
+import pytest
+
+import ASTNode
+from Parser import parse
+
+SOURCE = """
+struct p { int a; int b; };
+int f(int n) { int s; s = 0; while (n > 0) { s = s + n * 2; n--; } return s; }
+int main() { struct p q; q.a = f(3); q.b = -q.a; print(q.a != 1); return q.b; }
+"""
+
+
+@pytest.mark.parametrize("indent", [4, None])
+def test_json_is_the_map(indent):
+    result = parse(SOURCE).code({}, 0)
+    file = io.StringIO()
+    result.write_json(file, indent)
+    assert json.loads(file.getvalue()) == result.to_map()
+    # the printed nodes are only remembered while exporting
+    assert ASTNode._printed is None
+
+
+def test_json_without_nodes():
+    result = parse(SOURCE).code({}, 0)
+    file = io.StringIO()
+    result.write_json(file, None, nodes=False)
+    exported = json.loads(file.getvalue())
+    expected = result.to_map()
+    pending = [(exported, expected)]
+    while pending:
+        (left, right) = pending.pop()
+        assert left["description_node"] is None
+        assert left["description"] == right["description"]
+        assert [c for c in left["code"] if type(c) == str] == [c for c in right["code"] if type(c) == str]
+        pending += [(l, r) for (l, r) in zip(left["code"], right["code"]) if type(l) == dict]
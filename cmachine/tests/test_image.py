@@ -0,0 +1,51 @@
+import pytest
+
+from benchmark import fib
+from Image import link
+from Interpreter import Interpreter
+from Output import ListSink
+from Parser import parse
+from Peephole import optimize
+
+PROGRAMS = {
+    "loops": "int main() { int i; int s; s = 0; for (i = 0; i < 10; i++) { if (i / 2 * 2 == i) s = s + i; else s = s - 1; } "
+             "while (s > 3) { s = s - 3; print(s); } return s; }",
+    "calls": "int g; int sq(int x) { return x * x; } int sum(int n) { int s; s = 0; while (n > 0) { s = s + sq(n); n--; } "
+             "return s; } int main() { g = 3; print(sum(g)); return sum(10) + g; }",
+    "memory": "struct p { int a; int b; }; int main() { struct p q; int *r; int i; r = malloc(5); "
+              "for (i = 0; i < 5; i++) r[i] = i * i; q.a = r[4]; q.b = r[3]; free(r); print(q.a); return q.a - q.b; }",
+    # a function ending in labels: the jumps to them go to the code after it
+    "trailing": "int f(int n) { if (n > 0) { print(n); } } int main() { f(1); f(0); return 2; }",
+}
+
+
+def run(code, engine: str):
+    interpreter = Interpreter(code, output=ListSink())
+    steps = getattr(interpreter, f"run_{engine}")()
+    S = interpreter.stack
+    return (steps, S.to_list(), S.SP, S.FP, interpreter.output.getvalue())
+
+
+@pytest.mark.parametrize("peephole", [False, True])
+@pytest.mark.parametrize("name", PROGRAMS)
+def test_image_matches_instructions(name, peephole):
+    code = parse(PROGRAMS[name]).code({}, 0).to_code()
+    if peephole:
+        code = optimize(code)
+    assert run(code, "image") == run(code, "instructions")
+
+
+@pytest.mark.parametrize("k, result", [(1, 1), (4, 3), (8, 21), (12, 144)])
+def test_fib_steps(k, result):
+    code = fib(k).code({}, 0).to_code()
+    (steps, stack, *_) = run(code, "image")
+    assert (steps, stack) == run(code, "instructions")[:2]
+    assert stack[0] == result
+
+
+def test_image_drops_jump_targets():
+    code = parse(PROGRAMS["loops"]).code({}, 0).to_code()
+    image = link(code)
+    assert len(image) == len([i for i in code if i.instruction.name != "JUMP_TARGET"])
+    # unlinked addresses map to the instruction they execute next
+    assert [code[a] for a in image.addrs] == [i for i in code if i.instruction.name != "JUMP_TARGET"]
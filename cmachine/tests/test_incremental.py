@@ -0,0 +1,51 @@
+from Incremental import IncrementalCompiler
+from Interpreter import Interpreter
+from Nodes import Number
+from Output import ListSink
+from Parser import parse
+
+SOURCE = """
+int scale;
+int square(int x) { return x * x; }
+int sum(int n) { int i; int s; s = 0; for (i = 1; i <= n; i++) s = s + square(i); return s; }
+int main() { scale = 2; return scale * sum(10); }
+"""
+
+
+def run(code, image=None):
+    interpreter = Interpreter(code, image=image, output=ListSink())
+    interpreter.run()
+    return interpreter.stack.stack[0]
+
+
+def test_versions_match_full_compilation():
+    compiler = IncrementalCompiler()
+    versions = [SOURCE,
+                SOURCE.replace("return x * x;", "return x * x * x;"),
+                SOURCE.replace("scale * sum(10)", "scale * sum(5)"),
+                "int offset;\n" + SOURCE,
+                SOURCE.replace("int square(int x) { return x * x; }\n", "")
+                      .replace("square(i)", "i")]
+    compiled = []
+    for version in versions:
+        program = parse(version)
+        (code, image) = compiler.compile(program)
+        assert run(code, image) == run(parse(version).code({}, 0).to_code())
+        compiled.append(compiler.compiled)
+    assert compiled == [["square", "sum", "main"], ["square"], ["square", "main"], ["main"], ["sum", "main"]]
+
+
+def test_edits_in_place():
+    program = parse(SOURCE)
+    compiler = IncrementalCompiler()
+    compiler.compile(program)
+    # the first statement of sum, s = 0
+    (function,) = [function for function in program.functions if function.name == "sum"]
+    statement = function.body.ss.nodes[0].ss.nodes[0]
+    for k in range(1, 4):
+        statement.right = Number(k)
+        (code, image) = compiler.compile(program, ["sum"])
+        assert compiler.compiled == ["sum"]
+        assert run(code, image) == run(program.code({}, 0).to_code())
+    compiler.compile(program, [])
+    assert compiler.compiled == []
@@ -0,0 +1,39 @@
+import pytest
+
+from Interpreter import Interpreter
+from Jit import MAX_DEPTH
+from Output import ListSink
+from Parser import parse
+
+RECURSIVE = {
+    "sum": "int s(int n) { if (n <= 0) return 0; return n + s(n - 1); } int main() { return s(%d); }",
+    "locals": "int s(int n) { int k; if (n <= 0) return 0; k = s(n - 1); return k + n; } "
+              "int main() { int r; r = s(%d); return r + s(3); }",
+    "tail": "int t(int n, int a) { if (n <= 0) return a; return t(n - 1, a + n); } "
+            "int s(int n) { if (n <= 0) return 0; return t(2, n) + s(n - 1); } int main() { return s(%d); }",
+}
+
+
+def run(source: str, engine: str):
+    interpreter = Interpreter(parse(source).code({}, 0).to_code(), output=ListSink())
+    steps = getattr(interpreter, f"run_{engine}")()
+    S = interpreter.stack
+    return steps, S.stack[0], S.SP, S.FP
+
+
+@pytest.mark.parametrize("name", RECURSIVE)
+@pytest.mark.parametrize("depth", [MAX_DEPTH - 1, MAX_DEPTH + 10, 5 * MAX_DEPTH])
+def test_recursion_deeper_than_compiled_calls(name, depth):
+    # past MAX_DEPTH compiled code falls back to interpreting the callee
+    source = RECURSIVE[name] % depth
+    assert run(source, "jit") == run(source, "image")
+
+
+def test_recursive_calls_skip_the_jit():
+    source = "int fib(int n) { if (n <= 1) return n; return fib(n - 1) + fib(n - 2); } int main() { return fib(15); }"
+    interpreter = Interpreter(parse(source).code({}, 0).to_code(), output=ListSink())
+    steps = interpreter.run_jit()
+    ((pc, text),) = interpreter.jit.sources.items()
+    assert text.count(f"jit_{pc}(fp + ") == 2
+    assert interpreter.jit.depth == 0
+    assert (steps, interpreter.stack.stack[0]) == run(source, "image")[:2]
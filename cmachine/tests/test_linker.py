@@ -0,0 +1,63 @@
+import pytest
+
+from Interpreter import Interpreter
+from Linker import compile_object, link_objects
+from Output import ListSink
+from Parser import parse, parse_unit
+
+LIBRARY = """
+int calls;
+int table[3];
+int square(int x) { calls = calls + 1; return x * x; }
+int cube(int x) { return x * square(x); }
+int unused(int x) { return x; }
+"""
+
+PROGRAM = """
+extern int calls;
+extern int table[3];
+int cube(int x);
+int base;
+int main() { base = 2; calls = 0; table[1] = cube(3); print(calls); return table[1] + base + calls; }
+"""
+
+
+def run(code):
+    interpreter = Interpreter(code, output=ListSink())
+    steps = interpreter.run_image()
+    return (interpreter.stack.stack[0], interpreter.output.getvalue(), steps)
+
+
+def test_linked_units_run_like_the_program():
+    library = compile_object(parse_unit(LIBRARY, "library.c"), "library")
+    program = compile_object(parse_unit(PROGRAM, "program.c"), "program")
+    code = link_objects([program, library])
+    (result, output, _) = run(code)
+    assert (result, output) == (27 + 2 + 1, ">> 1\n")
+    # only the functions main reaches are linked
+    labels = {i.param1 for i in code if i.instruction.name == "JUMP_TARGET"}
+    assert {"main", "cube", "square"} <= labels and "unused" not in labels
+
+    whole = LIBRARY + PROGRAM.replace("extern int calls;", "").replace("extern int table[3];", "") \
+        .replace("int cube(int x);", "")
+    assert run(parse(whole).code({}, 0).to_code())[:2] == (result, output)
+
+
+def test_single_object_links_to_the_program():
+    source = "int g; int f(int x) { return x + g; } int main() { g = 4; return f(3); }"
+    code = link_objects([compile_object(parse_unit(source))])
+    assert [str(i) for i in code] == [str(i) for i in parse(source).code({}, 0).to_code()]
+
+
+@pytest.mark.parametrize("units, message", [
+    ([PROGRAM], "calls, which program0 imports, is not defined"),
+    ([PROGRAM, LIBRARY, "int square(int x) { return x; }"], "square is defined by unit1 and unit2"),
+    ([PROGRAM, LIBRARY.replace("int table[3];", "int table[4];")],
+     "table is int[3] in program0 but int[4] in unit1"),
+    ([LIBRARY], "No function main"),
+])
+def test_rejected_links(units, message):
+    objects = [compile_object(parse_unit(source), f"program{k}" if k == 0 else f"unit{k}") for (k, source) in enumerate(units)]
+    with pytest.raises(Exception) as error:
+        link_objects(objects)
+    assert str(error.value) == message
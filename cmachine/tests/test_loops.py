@@ -0,0 +1,26 @@
+import pytest
+
+from Interpreter import Interpreter
+from Loops import hoist_invariants
+from Output import ListSink
+from Parser import parse
+
+
+def run(source: str, hoist: bool):
+    program = parse(source)
+    report: list[str] = []
+    if hoist:
+        program = hoist_invariants(program, report)
+    interpreter = Interpreter(program.code({}, 0).to_code(), output=ListSink())
+    interpreter.run_image()
+    return (interpreter.stack.stack[0], report)
+
+
+@pytest.mark.parametrize("expression", ["-k + 1", "(k != 1) + 1", "!k + 1", "-k"])
+def test_hoist_unary_operands(expression):
+    source = ("int main() { int i; int s; int k; k = 4; s = 0; "
+              f"for (i = 0; i < 3; i++) s = s + ({expression}); return s; }}")
+    (expected, _) = run(source, hoist=False)
+    (result, report) = run(source, hoist=True)
+    assert result == expected
+    assert len(report) == 1
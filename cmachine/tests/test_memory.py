@@ -0,0 +1,53 @@
+import pytest
+
+from Interpreter import Interpreter, MEMORY_SIZE
+from Jit import JIT_THRESHOLD
+from Output import ListSink
+from Parser import parse
+
+ENGINES = ["instructions", "image", "threaded", "jit"]
+
+# the accesses run fine JIT_THRESHOLD times, so the JIT compiles them, and
+# then with the address a
+SOURCES = {
+    "load": "int get(int *p) { return *p; }",
+    "store": "int get(int *p) { *p = 3; return 0; }",
+    "loadk": "struct q { int a; int b; int c; }; "
+             "int total(struct q v) { return v.a + v.b + v.c; } "
+             "int get(struct q *p) { return total(*p); }",
+    "storek": "struct q { int a; int b; int c; }; "
+              "int total(struct q v) { return v.a; } "
+              "int get(struct q *p) { struct q *r; r = malloc(3); r->a = 1; r->b = 2; r->c = 3; "
+              "return total(*p = *r); }",
+    "move": "struct q { int a; int b; int c; }; "
+            "int get(struct q *p) { struct q *r; r = malloc(3); r->a = 1; r->b = 2; r->c = 3; *p = *r; return 0; }",
+}
+
+MAIN = " int main() { int *x; int i; int s; x = malloc(4); x[0] = 1; x[1] = 2; x[2] = 3; s = 0; " \
+       "for (i = 0; i < %d; i++) s = s + get(x); x = x - x + %d; return s + get(x); }"
+
+
+# negative addresses would wrap around to the end of the memory, blocks past
+# the end would shrink or grow it
+OUTSIDE = [(access, address) for access in SOURCES for address in [-1, -MEMORY_SIZE]] + \
+          [(access, address) for access in ["loadk", "storek", "move"] for address in [MEMORY_SIZE - 2, MEMORY_SIZE]]
+
+
+@pytest.mark.parametrize("access, address", OUTSIDE)
+@pytest.mark.parametrize("engine", ENGINES)
+def test_addresses_outside_of_memory_raise(engine, access, address):
+    source = SOURCES[access] + MAIN % (2 * JIT_THRESHOLD, address)
+    interpreter = Interpreter(parse(source).code({}, 0).to_code(), output=ListSink())
+    with pytest.raises(Exception, match=f"Access of address {address} outside of memory"):
+        getattr(interpreter, f"run_{engine}")()
+    assert len(interpreter.stack.stack) == MEMORY_SIZE
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_last_cells(engine):
+    # the highest addresses are the heap, the first blocks malloc hands out
+    source = SOURCES["move"] + MAIN % (2 * JIT_THRESHOLD, MEMORY_SIZE - 3)
+    interpreter = Interpreter(parse(source).code({}, 0).to_code(), output=ListSink())
+    getattr(interpreter, f"run_{engine}")()
+    assert interpreter.stack.stack[0] == 0
+    assert interpreter.stack.stack[-3:] == [1, 2, 3]
@@ -0,0 +1,68 @@
+import pytest
+
+from Interpreter import Interpreter
+from Output import ListSink
+from Parser import parse, ParseError
+
+
+def run(source: str, engine: str = "image"):
+    interpreter = Interpreter(parse(source).code({}, 0).to_code(), output=ListSink())
+    getattr(interpreter, f"run_{engine}")()
+    return interpreter.stack.stack[0]
+
+
+@pytest.mark.parametrize("engine", ["instructions", "image", "threaded", "jit"])
+def test_call_without_parameters(engine):
+    assert run("int f() { return 2; } int main() { return f() + 1; }", engine) == 3
+    assert run("int f(void) { return 7; } int g() { return f(); } "
+               "int main() { int a; int s; a = 1; s = 0; while (a < 20) { s = s + g() * a; a++; } return s; }", engine) == 1330
+
+
+@pytest.mark.parametrize("source, message", [
+    ("int f(int a) { return a; } int main() { return f(1, 2); }", "'f' takes 1 arguments but is called with 2"),
+    ("int f(int a) { return a; } int main() { return f(); }", "'f' takes 1 arguments but is called with 0"),
+    ("int f() { return 1; } int main() { return f(3); }", "'f' takes 0 arguments but is called with 1"),
+    ("int main() { int x; x = 1; x(); return 0; }", "'x' is no function"),
+    ("struct p { int a; }; int f(int a) { return a; } int main() { struct p q; q.a = 1; return f(q); }",
+     "Cannot pass 'p' to 'f' as 'int'"),
+])
+def test_rejected_calls(source, message):
+    with pytest.raises(ParseError) as error:
+        parse(source)
+    assert error.value.message == message
+
+
+@pytest.mark.parametrize("source, message", [
+    ("int main() { int a[3]; a = 5; return 0; }", "Cannot assign to the array 'a'"),
+    ("int a[3]; int main() { a += 1; return 0; }", "Cannot assign to the array 'a'"),
+    ("int main() { int a[3]; a++; return 0; }", "Cannot assign to the array 'a'"),
+    ("struct s { int m[2]; }; int main() { struct s x; x.m = 1; return 0; }", "Cannot assign to the array 'm'"),
+    ("struct s { int m[2]; }; int main() { struct s x; struct s *p; p = &x; p->m = 1; return 0; }",
+     "Cannot assign to the array 'm'"),
+])
+def test_rejected_array_assignments(source, message):
+    with pytest.raises(ParseError) as error:
+        parse(source)
+    assert error.value.message == message
+
+
+def test_array_elements_are_assignable():
+    assert run("int a[3]; int main() { int b[2]; a[2] = 5; b[1] = a[2] + 1; return b[1]; }") == 6
+
+
+def test_discarded_postfix_is_stable():
+    source = "int main() { int g = 0; " + "g++; print(4); " * 300 + "return g; }"
+    expected = parse(source).pretty_print(0)
+    assert expected.count("print(") == 300
+    for _ in range(20):
+        assert parse(source).pretty_print(0) == expected
+    for _ in range(50):
+        assert run("int main() { int g = 0; g++; print(4); return g; }") == 1
+
+
+@pytest.mark.parametrize("engine", ["instructions", "image", "threaded", "jit"])
+@pytest.mark.parametrize("argument, result", [("-x", -2), ("!x", 0), ("x != 1", 1), ("x != 2", 0), ("-x + 5", 3)])
+def test_unary_arguments(engine, argument, result):
+    assert run(f"int f(int a) {{ return a; }} int main() {{ int x = 2; return f({argument}); }}", engine) == result
+    assert run(f"int f(int a) {{ return a; }} int g(int x) {{ return f({argument}); }} "
+               f"int main() {{ return g(2); }}", engine) == result
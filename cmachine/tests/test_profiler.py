@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from Interpreter import Interpreter
+from Output import ListSink
+from Parser import parse
+from Profiler import PROGRAM, Profile
+
+# direct, mutual and tail recursion
+SOURCES = {
+    "fib": "int fib(int n) { if (n <= 1) return n; return fib(n - 1) + fib(n - 2); } "
+           "int main() { return fib(12); }",
+    "mutual": "int odd(int n); "
+              "int even(int n) { if (n == 0) return 1; return odd(n - 1); } "
+              "int odd(int n) { if (n == 0) return 0; return even(n - 1) + 0; } "
+              "int main() { int i; int s; s = 0; for (i = 0; i < 20; i++) s = s + even(i); return s; }",
+    "tail": "int t(int n, int a) { if (n <= 0) return a; return t(n - 1, a + n); } "
+            "int f(int n) { if (n <= 0) return 0; return t(n, 0) + f(n - 1); } "
+            "int main() { return f(15); }",
+}
+
+CALLS = {"fib": {"fib": 465, "main": 1}, "mutual": {"even": 110, "odd": 100, "main": 1},
+         "tail": {"f": 16, "t": 135, "main": 1}}
+
+
+def profiled(source: str):
+    code = parse(source).code({}, 0).to_code()
+    reference = Interpreter(code, output=ListSink())
+    steps = reference.run_image()
+    interpreter = Interpreter(code, output=ListSink())
+    profile = Profile(code, interpreter.image)
+    assert interpreter.run_profiled(profile) == steps
+    assert interpreter.stack.stack[0] == reference.stack.stack[0]
+    return profile, steps
+
+
+def from_collapsed(text: str) -> dict:
+    """Inclusive and exclusive steps per function, summed up from the collapsed stacks"""
+    result = {}
+    for line in text.splitlines():
+        (stack, steps) = line.rsplit(" ", 1)
+        names = stack.split(";")
+        for name in set(names):
+            entry = result.setdefault(name, {"inclusive": 0, "exclusive": 0})
+            entry["inclusive"] += int(steps)
+        result[names[-1]]["exclusive"] += int(steps)
+    return result
+
+
+@pytest.mark.parametrize("name", SOURCES)
+def test_steps_add_up(name):
+    (profile, steps) = profiled(SOURCES[name])
+    data = json.loads(profile.to_json())
+    functions = data["functions"]
+
+    assert data["steps"] == steps
+    assert sum(f["exclusive"] for f in functions.values()) == steps
+    # every step happens below the program, recursion counts a function once
+    assert functions[PROGRAM]["inclusive"] == steps
+    assert all(f["exclusive"] <= f["inclusive"] <= steps for f in functions.values())
+    assert functions["main"]["inclusive"] == steps - functions[PROGRAM]["exclusive"]
+    assert {f: v["calls"] for (f, v) in functions.items() if v["calls"]} == CALLS[name]
+    assert sum(data["opcodes"].values()) == sum(profile.hits)
+    assert sum(r["steps"] for r in data["hot ranges"]) <= steps
+
+    collapsed = profile.collapsed()
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in collapsed.splitlines()) == steps
+    assert from_collapsed(collapsed) == {f: {"inclusive": v["inclusive"], "exclusive": v["exclusive"]}
+                                         for (f, v) in functions.items()}
+
+
+def stacks(profile: Profile) -> list[str]:
+    return [line.rsplit(" ", 1)[0] for line in profile.collapsed().splitlines()]
+
+
+def test_recursive_stacks():
+    (profile, _) = profiled(SOURCES["fib"])
+    # fib(12) recurses down to fib(1)
+    assert max(stack.count(";fib") for stack in stacks(profile)) == 12
+    assert all(stack.startswith(f"{PROGRAM};main") for stack in stacks(profile) if stack != PROGRAM)
+    (tail, _) = profiled(SOURCES["tail"])
+    # a tail call replaces the caller, t never appears twice in one stack
+    assert all(stack.count(";t") <= 1 for stack in stacks(tail))
@@ -0,0 +1,52 @@
+import pytest
+
+from Instructions import Instructions1Params as I1P
+from Interpreter import Interpreter
+from Output import ListSink
+from Parser import parse
+from Trace import Trace, SP
+
+# t calls itself in tail position with parameters of its own size; v and w
+# call each other with parameters of another size, which needs new frames
+SOURCE = """
+int t(int n, int a) { if (n <= 0) return a; return t(n - 1, a + n); }
+int u(int n) { if (n <= 0) return 0; return t(n, 0) - t(n, 0); }
+int w(int n, int a);
+int v(int n, int a, int b) { if (n <= 0) return a; return w(n - 1, a + n); }
+int w(int n, int a) { return v(n, a, 0); }
+int main() { return %s; }
+"""
+
+
+def compile(main: str):
+    return parse(SOURCE % main).code({}, 0).to_code()
+
+
+def depth(main: str) -> tuple[int, int]:
+    """The result and the highest SP of the run"""
+    interpreter = Interpreter(compile(main), output=ListSink())
+    trace = Trace(1 << 20)
+    interpreter.run_traced(trace)
+    return (interpreter.stack.stack[0], max(trace[k][SP] for k in range(trace.first(), trace.count)))
+
+
+def test_tail_calls_reuse_the_frame():
+    tails = [i for i in compile("0") if i.instruction == I1P.I.TAILCALL]
+    assert [i.param1 for i in tails] == [2]
+    (results, depths) = zip(*(depth(f"t({n}, 0) + u({n})") for n in [10, 100, 1000]))
+    assert results == (55, 5050, 500500)
+    assert len(set(depths)) == 1
+    (results, depths) = zip(*(depth(f"v({n}, 0, 0)") for n in [10, 100]))
+    assert results == (55, 5050)
+    assert depths[1] - depths[0] > 90 * 3
+
+
+@pytest.mark.parametrize("engine", ["image", "threaded", "jit"])
+def test_tail_calls_on_every_engine(engine):
+    code = compile("t(300, 0) + u(300) + v(300, 0, 0)")
+    reference = Interpreter(code, output=ListSink())
+    steps = reference.run_instructions()
+    interpreter = Interpreter(code, output=ListSink())
+    assert getattr(interpreter, f"run_{engine}")() == steps
+    S = interpreter.stack
+    assert (S.stack[0], S.SP, S.FP) == (2 * 45150, reference.stack.SP, reference.stack.FP)
@@ -0,0 +1,88 @@
+import io
+import re
+
+import pytest
+
+from Interpreter import Interpreter
+from Output import ListSink
+from Parser import parse
+from Trace import ANSI, Trace, SP, TOP, NO_VALUE
+
+SOURCE = """
+int f(int n) { if (n <= 1) return 1; return f(n - 1) + f(n - 2); }
+int main() { int i; int s; s = 0; for (i = 0; i < 6; i++) { s = s + f(i); print(s); } return s; }
+"""
+
+
+def traced(capacity: int, file=None):
+    interpreter = Interpreter(parse(SOURCE).code({}, 0).to_code(), output=ListSink())
+    trace = Trace(capacity, file)
+    steps = interpreter.run_traced(trace)
+    return interpreter, trace, steps
+
+
+def fib(n: int) -> int:
+    return 1 if n <= 1 else fib(n - 1) + fib(n - 2)
+
+
+def records(trace: Trace) -> list:
+    return [trace[k] for k in range(trace.first(), trace.count)]
+
+
+@pytest.mark.parametrize("capacity", [1, 7, 64, 500])
+def test_ring_keeps_the_last_records(capacity):
+    (_, full, steps) = traced(1 << 16)
+    assert full.first() == 0 and capacity < full.count <= steps
+    (interpreter, trace, _) = traced(capacity)
+    assert interpreter.stack.stack[0] == sum(fib(i) for i in range(6))
+    assert trace.count == full.count
+    assert len(trace) == capacity
+    assert trace.first() == full.count - capacity
+    assert records(trace) == records(full)[-capacity:]
+    with pytest.raises(IndexError):
+        trace[trace.first() - 1]
+    with pytest.raises(IndexError):
+        trace[trace.count]
+
+
+@pytest.mark.parametrize("capacity", [7, 500])
+def test_file_keeps_every_record(capacity):
+    file = io.BytesIO()
+    (_, trace, _) = traced(capacity, file)
+    file.seek(0)
+    loaded = Trace.load(file)
+    assert records(loaded) == records(traced(1 << 16)[1])
+    assert records(loaded)[-capacity:] == records(trace)
+
+
+def test_empty_stack_has_no_top():
+    (_, trace, _) = traced(1 << 16)
+    assert trace[0][SP] < 0 and trace[0][TOP] == NO_VALUE
+
+
+@pytest.mark.parametrize("window", [(-20, None), (-45, -5), (0, 12)])
+def test_render_matches_the_debug_listing(capsys, window):
+    code = parse(SOURCE).code({}, 0).to_code()
+    Interpreter(code, output=ListSink()).run_instructions(debug=True)
+    lines = capsys.readouterr().out.split("\n")
+    # the debug listing prints the stack, the instruction and the registers of
+    # every step; the image skips JUMP_TARGETs, so does the trace
+    executed = [i for (i, line) in enumerate(lines)
+                if line.startswith("Instruction:") and "JUMP_TARGET" not in ANSI.sub("", line)]
+    listing = [(lines[i], lines[i + 1]) for i in executed]
+    stacks = [lines[i - 1] for i in executed]
+
+    (_, trace, _) = traced(50)
+    rendered = trace.render(code, *window).split("\n")
+    (start, stop, _) = slice(*window).indices(len(trace))
+    offset = len(listing) - len(trace)
+    assert len(rendered) == 4 * (stop - start)
+    for (k, i) in enumerate(range(start, stop)):
+        block = rendered[4 * k:4 * k + 4]
+        assert block[0].startswith(f"Record {trace.first() + i}, top of stack: ")
+        assert (block[1], block[2]) == listing[offset + i]
+        assert block[3] == ""
+        # the top of stack is the last cell the debug listing shows
+        top = block[0].rsplit(" ", 1)[1]
+        if top != "_":
+            assert re.findall(r"-?\d+|_", stacks[offset + i])[-1] == top
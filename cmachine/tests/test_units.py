@@ -0,0 +1,38 @@
+import multiprocessing
+
+import pytest
+
+import Units
+from Interpreter import Interpreter
+from Output import ListSink
+from Parser import parse
+
+SOURCE = "".join(f"int f{k}(int n) {{ int s; int i; s = 0; for (i = 0; i < n; i++) s = s + {k}; "
+                 f"return {'s' if k == 0 else f's + f{k - 1}(n)'}; }} " for k in range(24))
+SOURCE += "int main() { return f23(3); }"
+
+
+@pytest.mark.parametrize("inherited", [True, False])
+def test_labels_do_not_depend_on_the_workers(monkeypatch, inherited):
+    if inherited and "fork" not in multiprocessing.get_all_start_methods():
+        pytest.skip("workers cannot be forked")
+    monkeypatch.setattr(Units, "processors", lambda: 4)
+    monkeypatch.setattr(Units, "PARALLEL_FUNCTIONS", 2)
+    # workers not forked are sent their share of the functions
+    monkeypatch.setattr(multiprocessing, "get_all_start_methods", lambda: ["fork"] if inherited else [])
+    program = parse(SOURCE)
+    reference = list(map(str, program.code({}, 0).to_code()))
+    for workers in [2, 3, 4]:
+        assert list(map(str, program.code({}, 0, workers).to_code())) == reference
+    interpreter = Interpreter(program.code({}, 0, 3).to_code(), output=ListSink())
+    interpreter.run()
+    assert interpreter.stack.stack[0] == sum(3 * k for k in range(24))
+
+
+def test_small_programs_compile_serially(monkeypatch):
+    monkeypatch.setattr(Units, "processors", lambda: 4)
+
+    def pool(*args, **kwargs):
+        raise AssertionError("compiled in a pool")
+    monkeypatch.setattr(Units, "ProcessPoolExecutor", pool)
+    assert len(parse(SOURCE).code({}, 0, 4).to_code()) > 0
@@ -0,0 +1,213 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, BinaryIO, Optional
+from array import array
+import mmap
+import struct
+import sys
+
+from ASTNode import CompilationResult, strip_ansi_colour
+from Instructions import Instructions0Params as I0P, Instructions1Params as I1P
+from Batch import CODES, CODE
+
+if TYPE_CHECKING:
+    from Instructions import Instructions
+
+
+# A bytecode file is a header, a table of sections and the sections, each
+# aligned to 8 bytes. All numbers are in the byte order of the writer, which
+# the header records.
+MAGIC = b"MAMA"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI")
+SECTION = struct.Struct("<4sQQ")
+BIG_ENDIAN = 1
+
+# Kinds of operands
+NONE, INT, STR = 0, 1, 2
+
+# Sections and the typecodes of their arrays:
+#   OPS   int32   opcode of every instruction, numbered like Batch.CODES
+#   KIND  uint8   kind of the operand of every instruction
+#   ARG   int64   operand of every instruction, strings by their index
+#   STRO  int64   offsets of the strings in STRS, one more than strings
+#   STRS  bytes   the UTF-8 strings
+#   DBUG  int64   description string of every instruction (optional)
+TYPECODES = {
+    b"OPS ": "i", b"KIND": "B", b"ARG ": "q", b"STRO": "q", b"STRS": "B",
+    b"DBUG": "q",
+}
+
+
+def descriptions(result: CompilationResult) -> list[str]:
+    """The description of the innermost compilation result of every instruction"""
+    out = []
+    stack = [(result, iter(result.code))]
+    while stack:
+        (current, items) = stack[-1]
+        item = next(items, stack)
+        if item is stack:
+            stack.pop()
+        elif type(item) == CompilationResult:
+            stack.append((item, iter(item.code)))
+        else:
+            out.append(strip_ansi_colour(current.description))
+    return out
+
+
+class Strings:
+    def __init__(self):
+        self.index: dict[str, int] = {}
+
+    def __call__(self, string: str) -> int:
+        if string not in self.index:
+            self.index[string] = len(self.index)
+        return self.index[string]
+
+    def sections(self) -> dict[bytes, array]:
+        data = [s.encode() for s in self.index]
+        offsets = array("q", [0])
+        for d in data:
+            offsets.append(offsets[-1] + len(d))
+        return {b"STRO": offsets, b"STRS": array("B", b"".join(data))}
+
+
+def write(file: BinaryIO, code: list[Instructions], result: Optional[CompilationResult] = None):
+    """
+    Writes the code to file. With the compilation result of the code the
+    file gets a debug section
+    """
+    strings = Strings()
+
+    kinds, args = array("B"), array("q")
+    for instruction in code:
+        param = instruction.param1 if isinstance(instruction, I1P) else None
+        if param is None:
+            (kind, arg) = (NONE, 0)
+        elif type(param) == int:
+            (kind, arg) = (INT, param)
+        elif type(param) == str:
+            (kind, arg) = (STR, strings(param))
+        else:
+            raise Exception(f"Cannot write operand {param!r}")
+        kinds.append(kind)
+        args.append(arg)
+
+    sections = {
+        b"OPS ": array("i", [CODE[instruction.instruction] for instruction in code]),
+        b"KIND": kinds,
+        b"ARG ": args,
+    }
+    if result is not None:
+        sections[b"DBUG"] = array("q", [strings(d) for d in descriptions(result)])
+    sections.update(strings.sections())
+
+    flags = BIG_ENDIAN if sys.byteorder == "big" else 0
+    file.write(HEADER.pack(MAGIC, VERSION, flags, len(sections)))
+    offset = HEADER.size + SECTION.size * len(sections)
+    table = []
+    for (name, data) in sections.items():
+        offset += -offset % 8
+        length = len(data) * data.itemsize
+        table.append((name, offset, length))
+        offset += length
+    for entry in table:
+        file.write(SECTION.pack(*entry))
+    for ((name, offset, length), data) in zip(table, sections.values()):
+        file.write(b"\0" * (offset - file.tell()))
+        data.tofile(file)
+
+
+class Bytecode:
+    """
+    A bytecode file mapped into memory. The sections are memoryviews of the
+    mapping; the instructions are built from them once on loading
+    """
+
+    def __init__(self, file: BinaryIO):
+        self.mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.mapping)
+
+        (magic, version, flags, count) = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise Exception("Not a MaMa bytecode file")
+        if version != VERSION:
+            raise Exception(f"Unsupported bytecode version {version}")
+        if flags & BIG_ENDIAN != (sys.byteorder == "big"):
+            raise Exception("Bytecode file of another byte order")
+
+        self.sections: dict[bytes, memoryview] = {}
+        for k in range(count):
+            (name, offset, length) = SECTION.unpack_from(
+                view, HEADER.size + k * SECTION.size)
+            self.sections[name] = view[offset:offset + length].cast(TYPECODES[name])
+
+        s = self.sections
+        data = s[b"STRS"]
+        offsets = s[b"STRO"]
+        self.strings = [bytes(data[offsets[k]:offsets[k + 1]]).decode()
+                        for k in range(len(offsets) - 1)]
+
+        self.code = self.decode()
+        self.debug = [self.strings[d] for d in s[b"DBUG"]] if b"DBUG" in s else None
+
+    def decode(self) -> list[Instructions]:
+        strings = self.strings
+        s = self.sections
+        code = []
+        append = code.append
+        for (op, kind, arg) in zip(s[b"OPS "].tolist(), s[b"KIND"].tolist(), s[b"ARG "].tolist()):
+            if kind == NONE:
+                append(I0P(CODES[op]))
+            else:
+                append(I1P(CODES[op], strings[arg] if kind == STR else arg))
+        return code
+
+
+def load(path: str) -> Bytecode:
+    with open(path, "rb") as f:
+        return Bytecode(f)
+
+
+if __name__ == '__main__':
+    import os
+    import tempfile
+
+    from Nodes import *
+    from Interpreter import Interpreter
+    from Output import ListSink
+
+    def numbers(n):
+        expr = Nil()
+        for k in reversed(range(n)):
+            expr = Cons(BaseType(k), expr)
+        return expr
+
+    expr = LetRecIn(
+        [(Variable("sum"), Fun(
+            [Variable("l")],
+            MatchList(
+                Variable("l"),
+                BaseType(0),
+                [Variable("h"), Variable("t")],
+                BinaryOperation(Variable("h"), I0P.I.ADD,
+                                Apply(Variable("sum"), [Variable("t")]))
+            )
+        ))],
+        Apply(Variable("sum"), [numbers(100)])
+    )
+
+    result = expr.codeV({}, 0)
+    code = result.to_code()
+
+    path = os.path.join(tempfile.mkdtemp(), "program.mama")
+    with open(path, "wb") as f:
+        write(f, code, result)
+    bytecode = load(path)
+
+    s = Interpreter(code, output=ListSink())
+    t = Interpreter(bytecode.code, output=ListSink())
+    s.run()
+    t.run()
+    print(f"{len(code)} instructions, {os.path.getsize(path)} bytes")
+    print(f"same code: {[str(i) for i in code] == [str(i) for i in bytecode.code]}")
+    print(f"exit codes: {s.stack.stack[0]} {t.stack.stack[0]}")
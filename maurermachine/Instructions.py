@@ -106,7 +106,7 @@ class Instructions0Params(Instructions):
         elif self.instruction == Instructions0Params.I.NOT:
             S[S.SP] = 1 if S[S.SP] == 0 else 0
         elif self.instruction == Instructions0Params.I.PRINT:
-            print(">>", S[S.SP])
+            state.output.write(f">> {S[S.SP]}")
         elif self.instruction == Instructions0Params.I.GETBASIC:
             if (H[S[S.SP]].tag != "B"):
                 raise Exception("Expected basic value")
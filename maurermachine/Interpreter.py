@@ -6,6 +6,7 @@ from typing import TYPE_CHECKING, List, Union
 from collections import defaultdict
 
 from Instructions import Instructions1Params, bcolors
+from Output import Sink, FileSink
 
 if TYPE_CHECKING:
     from Instructions import Instructions
@@ -224,7 +225,7 @@ def uncolor(str):
 
 
 class Interpreter:
-    def __init__(self, code: list[Instructions]):
+    def __init__(self, code: list[Instructions], output: Sink = None):
         self.stack: Stack = Stack()
         self.heap: Heap = Heap()
         self.code = code
@@ -232,10 +233,25 @@ class Interpreter:
         self.PC: int = 0
         self.FP: int = -1
         self.GP: int = -1
+        self.steps: int = 0
+        self.output = output if output is not None else FileSink()
 
     def run(self, debug=False, pretty=False):
         print("Running...\n\n")
 
+        try:
+            step = self.run_instructions(debug)
+        finally:
+            self.output.flush()
+        self.steps = step
+
+        print(f"\n\nExecution finished in {step} steps")
+        print(f"Heap Size: {len(self.heap.heap)}")
+
+    def run_instructions(self, debug=False) -> int:
+        """
+        Runs the program by interpreting the instruction objects. Returns the number of steps
+        """
         step = 0
         while True:
             if self.PC >= len(self.code):
@@ -246,6 +262,7 @@ class Interpreter:
             IR.interpret(self)
 
             if debug:
+                self.output.flush()
                 real_ir_length = len(uncolor(str(IR)))
 
                 registers = f"PC: {self.PC: > 5}, SP: {self.stack.SP: > 5}, FP: {self.FP: > 5}, GP: {self.GP: > 5}"
@@ -264,5 +281,4 @@ class Interpreter:
 
         self.heap.collect_garbage(self.stack)
 
-        print(f"\n\nExecution finished in {step} steps")
-        print(f"Heap Size: {len(self.heap.heap)}")
+        return step
@@ -0,0 +1,80 @@
+from __future__ import annotations
+from typing import Callable, Optional, TextIO
+import sys
+
+
+# Lines buffered sinks collect before writing them at once
+BUFFER_LINES = 1024
+
+
+class Sink:
+    """
+    Receives the lines a program prints. Sinks may buffer; the interpreter
+    flushes them when a run ends
+    """
+
+    def write(self, line: str):
+        pass
+
+    def flush(self):
+        pass
+
+
+class FileSink(Sink):
+    """
+    Writes to a text file, by default whatever sys.stdout is when flushing,
+    in bulks of lines lines
+    """
+
+    def __init__(self, file: Optional[TextIO] = None, lines: int = BUFFER_LINES):
+        self.file = file
+        self.lines = lines
+        self.buffer: list[str] = []
+
+    def write(self, line: str):
+        self.buffer.append(line)
+        if len(self.buffer) >= self.lines:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            file = self.file if self.file is not None else sys.stdout
+            file.write("\n".join(self.buffer) + "\n")
+            file.flush()
+            self.buffer = []
+
+
+class ListSink(Sink):
+    """Keeps the lines in memory"""
+
+    def __init__(self):
+        self.lines: list[str] = []
+
+    def write(self, line: str):
+        self.lines.append(line)
+
+    def getvalue(self) -> str:
+        return "".join(line + "\n" for line in self.lines)
+
+
+class CallbackSink(Sink):
+    """Passes the lines to callback in bulks of lines lines"""
+
+    def __init__(self, callback: Callable[[list[str]], None], lines: int = BUFFER_LINES):
+        self.callback = callback
+        self.lines = lines
+        self.buffer: list[str] = []
+
+    def write(self, line: str):
+        self.buffer.append(line)
+        if len(self.buffer) >= self.lines:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            (buffer, self.buffer) = (self.buffer, [])
+            self.callback(buffer)
+
+
+class NullSink(Sink):
+    """Discards the output"""
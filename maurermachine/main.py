@@ -1,6 +1,8 @@
 from Nodes import *
 from Instructions import Instructions0Params as I0P, Instructions1Params as I1P
 from Interpreter import Interpreter
+from Cache import CompileCache
+import Nodes
 
 
 if __name__ == '__main__':
@@ -73,14 +75,19 @@ if __name__ == '__main__':
 
     print(expr, "\n")
 
-    comp_result = expr.codeV(variable_adress, 0)
+    cache = CompileCache()
+    key = cache.key(expr, variable_adress, 0, Nodes.CALL_TYPE)
+    code = cache.get(key)
 
-    comp_result_json = comp_result.to_json()
+    if code is None:
+        comp_result = expr.codeV(variable_adress, 0)
 
-    with open("comp_result.json", "w") as f:
-        f.write(comp_result_json)
+        comp_result.save_json("comp_result.json")
 
-    code = comp_result.to_code()
+        code = comp_result.to_code()
+        cache.put(key, code)
+    else:
+        print(f"Code from the compile cache ({key[:12]})\n")
 
     print(f"Code: [{len(code)} instructions]\n{code}\n")
 
@@ -0,0 +1,34 @@
+from Batch import run_batch
+from Instructions import Instructions0Params as I0P
+from Interpreter import Interpreter
+from Nodes import *
+from Output import ListSink
+
+
+def fib(k: int) -> ASTNode:
+    return LetRecIn(
+        [(Variable("fib"), Fun(
+            [Variable("n")],
+            IfThenElse(
+                BinaryOperation(Variable("n"), I0P.I.LEQ, BaseType(1)),
+                Variable("n"),
+                BinaryOperation(
+                    Apply(Variable("fib"), [BinaryOperation(Variable("n"), I0P.I.SUB, BaseType(1))]),
+                    I0P.I.ADD,
+                    Apply(Variable("fib"), [BinaryOperation(Variable("n"), I0P.I.SUB, BaseType(2))])
+                )
+            )
+        ))],
+        Print(Apply(Variable("fib"), [BaseType(k)]))
+    )
+
+
+def test_pool_matches_serial_runs():
+    programs = [fib(k).codeV({}, 0).to_code() for k in range(1, 8)]
+    results = run_batch(programs * 2, workers=2)
+    for (code, result) in zip(programs * 2, results):
+        s = Interpreter(code, output=ListSink())
+        steps = s.run_instructions()
+        assert result.error is None
+        assert (result.exit_code, result.output, result.steps) == (s.stack.stack[0], s.output.getvalue(), steps)
+    assert [result.output.strip() for result in results[:7]] == [f">> {n}" for n in [1, 1, 2, 3, 5, 8, 13]]
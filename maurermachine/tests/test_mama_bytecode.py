@@ -0,0 +1,38 @@
+from Bytecode import write, load
+from Instructions import Instructions0Params as I0P
+from Interpreter import Interpreter
+from Nodes import *
+from Output import ListSink
+
+
+def numbers(n):
+    expr = Nil()
+    for k in reversed(range(n)):
+        expr = Cons(BaseType(k), expr)
+    return expr
+
+
+def run(code):
+    interpreter = Interpreter(code, output=ListSink())
+    steps = interpreter.run_instructions()
+    return (interpreter.stack.stack[0], interpreter.output.getvalue(), steps)
+
+
+def test_round_trip(tmp_path):
+    expr = LetRecIn(
+        [(Variable("sum"), Fun(
+            [Variable("l")],
+            MatchList(Variable("l"), BaseType(0), [Variable("h"), Variable("t")],
+                      BinaryOperation(Variable("h"), I0P.I.ADD, Apply(Variable("sum"), [Variable("t")])))
+        ))],
+        Apply(Variable("sum"), [numbers(20)])
+    )
+    result = expr.codeV({}, 0)
+    code = result.to_code()
+    path = tmp_path / "program.mama"
+    with open(path, "wb") as f:
+        write(f, code, result)
+    bytecode = load(str(path))
+    assert [str(i) for i in bytecode.code] == [str(i) for i in code]
+    assert run(bytecode.code) == run(code)
+    assert len(bytecode.debug) == len(code)
@@ -1,6 +1,9 @@
+from typing import Iterator, Optional, TextIO
+from json.encoder import encode_basestring_ascii
+import gzip
 import io
 from abc import abstractmethod, ABCMeta
-import json
+import re
 from Instructions import Instructions, Instructions0Params as I0P, Instructions1Params as I1P
 
 
@@ -29,24 +32,23 @@ def label_generator():
     return f"{base10ToBase26Letter_A_is_ONE(LABEL_COUNTER)}"
 
 
-def strip_ansi_colour(text: str) -> iter:
+ANSI_COLOUR = re.compile("\x1b[^m]*m")
+
+# Pieces the streaming JSON writer collects before writing them
+JSON_CHUNK = 1 << 12
+
+
+def strip_ansi_colour(text: str) -> str:
     """Strip ANSI colour sequences from a string.
 
     Args:
         text (str): Text string to be stripped.
 
     Returns:
-        iter[str]: A generator for each returned character. Note,
-        this will include newline characters.
+        str: The text without the sequences.
 
     """
-    buff = io.StringIO(text)
-    while (b := buff.read(1)):
-        if b == '\x1b':
-            while (b := buff.read(1)) != 'm':
-                continue
-        else:
-            yield b
+    return ANSI_COLOUR.sub("", text)
 
 
 class CompilationResult:
@@ -55,6 +57,12 @@ class CompilationResult:
         self.description = description
         self.node = node
 
+    def description_text(self) -> str:
+        return strip_ansi_colour(self.description)
+
+    def node_text(self) -> Optional[str]:
+        return strip_ansi_colour(self.node.pretty_print(0)) if self.node is not None else None
+
     def to_map(self):
         children = []
 
@@ -62,29 +70,132 @@ class CompilationResult:
             if type(i) == CompilationResult:
                 children.append(i.to_map())
             else:
-                children.append("".join(strip_ansi_colour(str(i))))
+                children.append(strip_ansi_colour(str(i)))
 
         data = {
-            "description": "".join(strip_ansi_colour(self.description)),
-            "description_node": "".join(strip_ansi_colour(self.node.pretty_print(0))) if self.node is not None else None,
+            "description": self.description_text(),
+            "description_node": self.node_text(),
             "code": children
         }
 
         return data
 
-    def to_json(self):
-        map = self.to_map()
-        string = json.dumps(map, indent=4)
+    def to_json(self, indent: Optional[int] = 4):
+        string = io.StringIO()
+        self.write_json(string, indent)
+
+        return string.getvalue()
+
+    def write_json(self, file: TextIO, indent: Optional[int] = 4, nodes: bool = True):
+        """
+        Writes the JSON of to_map to file while walking the result, without
+        building the map or recursing. Without indent the JSON is compact.
+        Without nodes the printed nodes are left out (null), which keeps the
+        output linear in the size of the code for deep trees
+        """
+        key_separator = ":" if indent is None else ": "
+        newlines = {}
+        # encoded texts by instruction text, description and node
+        instructions = {}
+        descriptions = {}
+        printed = {}
+
+        def newline(depth: int) -> str:
+            if depth not in newlines:
+                newlines[depth] = "" if indent is None else "\n" + " " * (indent * depth)
+            return newlines[depth]
+
+        chunk = []
+        append = chunk.append
+
+        def open_result(result: CompilationResult, depth: int) -> bool:
+            if result.description not in descriptions:
+                descriptions[result.description] = encode_basestring_ascii(result.description_text())
+            node = id(result.node) if nodes else None
+            if node not in printed:
+                text = result.node_text()
+                printed[node] = encode_basestring_ascii(text) if text is not None else "null"
+
+            inner = "," + newline(depth + 1)
+            append("{" + newline(depth + 1) + '"description"' + key_separator + descriptions[result.description]
+                   + inner + '"description_node"' + key_separator + printed[node]
+                   + inner + '"code"' + key_separator)
+            if result.code:
+                append("[")
+                # the separators of the items and the end of the result
+                stack.append((iter(result.code), depth + 2, newline(depth + 2), "," + newline(depth + 2),
+                              newline(depth + 1) + "]" + newline(depth) + "}"))
+                return True
+            append("[]" + newline(depth) + "}")
+            return False
+
+        printed[None] = "null"
+        stack = []
+        first = open_result(self, 0)
+        while stack:
+            (items, depth, first_separator, separator, end) = stack[-1]
+            item = next(items, stack)
+            if item is stack:
+                stack.pop()
+                append(end)
+                first = False
+                continue
+
+            append(first_separator if first else separator)
+            if type(item) == CompilationResult:
+                first = open_result(item, depth)
+            else:
+                text = str(item)
+                if text not in instructions:
+                    instructions[text] = encode_basestring_ascii(strip_ansi_colour(text))
+                append(instructions[text])
+                first = False
+
+            if len(chunk) >= JSON_CHUNK:
+                file.write("".join(chunk))
+                chunk.clear()
 
-        return string
+        file.write("".join(chunk))
 
-    def to_code(self):
+    def save_json(self, path: str, indent: Optional[int] = 4, compress: Optional[bool] = None, nodes: bool = True):
+        """
+        Writes the JSON to the file at path, compressed with gzip if compress
+        or, by default, if the path ends with .gz
+        """
+        if compress is None:
+            compress = path.endswith(".gz")
+        opener = gzip.open if compress else open
+        with opener(path, "wt", encoding="utf-8") as f:
+            self.write_json(f, indent, nodes)
+
+    def instructions(self) -> Iterator[Instructions]:
+        """The instructions of the result in order, generated without recursion"""
+        stack = [iter(self.code)]
+        while stack:
+            for i in stack[-1]:
+                if type(i) == CompilationResult:
+                    stack.append(iter(i.code))
+                    break
+                yield i
+            else:
+                stack.pop()
+
+    def to_code(self) -> list[Instructions]:
+        """
+        The instructions of the result as one list. Every instruction is
+        appended once, so flattening takes linear time at any depth
+        """
         code = []
-        for i in self.code:
-            if type(i) == CompilationResult:
-                code += i.to_code()
+        append = code.append
+        stack = [iter(self.code)]
+        while stack:
+            for i in stack[-1]:
+                if type(i) == CompilationResult:
+                    stack.append(iter(i.code))
+                    break
+                append(i)
             else:
-                code.append(i)
+                stack.pop()
         return code
 
 
@@ -0,0 +1,123 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Optional
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+import marshal
+import os
+
+from Instructions import Instructions0Params as I0P, Instructions1Params as I1P
+from Interpreter import Interpreter
+from Output import ListSink
+
+if TYPE_CHECKING:
+    from Instructions import Instructions
+
+
+# Opcodes of the serialized code. An instruction without parameters is its
+# opcode, one with parameters the tuple (opcode, parameter, ...).
+CODES = [*I0P.I, *I1P.I]
+CODE = {instruction: op for op, instruction in enumerate(CODES)}
+
+
+def encode(code: list[Instructions]) -> list:
+    def instruction(i: Instructions):
+        if not isinstance(i, I1P):
+            return CODE[i.instruction]
+        if i.param2 is None:
+            return (CODE[i.instruction], i.param1)
+        return (CODE[i.instruction], i.param1, i.param2)
+
+    return [instruction(i) for i in code]
+
+
+def decode(encoded: list) -> list[Instructions]:
+    return [I0P(CODES[e]) if type(e) == int else I1P(CODES[e[0]], *e[1:]) for e in encoded]
+
+
+class Job:
+    """
+    One run of the program with index program. Before the run, the cells
+    are written to the stack
+    """
+
+    def __init__(self, program: int = 0, cells: dict[int, int] = None):
+        self.program = program
+        self.cells = cells if cells is not None else {}
+
+
+class Result:
+    def __init__(self, exit_code: int, output: str, steps: int, time: float, error: Optional[str] = None):
+        self.exit_code = exit_code
+        self.output = output
+        self.steps = steps
+        self.time = time
+        self.error = error
+
+    def __repr__(self):
+        if self.error is not None:
+            return f"Result(error={self.error!r}, steps={self.steps}, time={self.time:.4f})"
+        return f"Result(exit_code={self.exit_code}, steps={self.steps}, time={self.time:.4f}, output={self.output!r})"
+
+
+# State of a worker process, set once by the pool initializer
+_programs: list[list[Instructions]] = []
+
+
+def _initialize(blob: bytes):
+    global _programs
+    _programs = [decode(encoded) for encoded in marshal.loads(blob)]
+
+
+def _run(job: tuple[int, dict[int, int]]):
+    (program, cells) = job
+    output = ListSink()
+    s = Interpreter(_programs[program], output=output)
+    s.interactive = False
+    for (address, value) in cells.items():
+        s.stack[address] = value
+
+    error = None
+    start = perf_counter()
+    try:
+        s.steps = s.run_instructions()
+    except Exception as e:
+        error = str(e)
+    elapsed = perf_counter() - start
+
+    exit_code = s.stack.stack[0] if error is None else None
+    return (exit_code, output.getvalue(), s.steps, elapsed, error)
+
+
+def run_batch(programs: list[list[Instructions]], jobs: list[Job] = None, workers: int = None) -> list[Result]:
+    """
+    Runs the jobs on a pool of worker processes and returns their results in
+    order. Without jobs, every program runs once. HALT does not wait for the
+    user, so each job enumerates all solutions. The programs are sent to
+    each worker once; jobs only carry the program index and the inputs
+    """
+    if jobs is None:
+        jobs = [Job(i) for i in range(len(programs))]
+
+    workers = workers or os.cpu_count() or 1
+    blob = marshal.dumps([encode(code) for code in programs])
+    chunksize = max(1, len(jobs) // (workers * 4))
+
+    with ProcessPoolExecutor(workers, initializer=_initialize, initargs=(blob,)) as executor:
+        results = executor.map(
+            _run, [(job.program, job.cells) for job in jobs], chunksize=chunksize)
+        return [Result(*result) for result in results]
+
+
+if __name__ == '__main__':
+    from main import listcompose, test
+
+    programs = [listcompose.code().to_code(), test.code().to_code()]
+
+    for workers in sorted({1, os.cpu_count() or 1}):
+        start = perf_counter()
+        results = run_batch(programs * 50, workers=workers)
+        elapsed = perf_counter() - start
+        print(f"{len(results)} jobs on {workers:>3} workers: {elapsed:.4f}s")
+
+    for result in results[:2]:
+        print(f"{result.steps:>7} steps\n{result.output}")
@@ -0,0 +1,212 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, BinaryIO, Optional
+from array import array
+import mmap
+import struct
+import sys
+
+from ASTNode import CompilationResult, strip_ansi_colour
+from Instructions import Instructions0Params as I0P, Instructions1Params as I1P
+from Batch import CODES, CODE
+
+if TYPE_CHECKING:
+    from Instructions import Instructions
+
+
+# A bytecode file is a header, a table of sections and the sections, each
+# aligned to 8 bytes. All numbers are in the byte order of the writer, which
+# the header records.
+MAGIC = b"WIM\0"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI")
+SECTION = struct.Struct("<4sQQ")
+BIG_ENDIAN = 1
+
+# Kinds of operands
+NONE, INT, STR = 0, 1, 2
+
+# Sections and the typecodes of their arrays:
+#   OPS   int32   opcode of every instruction, numbered like Batch.CODES
+#   KIND  uint8   kind of the operand of every instruction
+#   ARG   int64   operand of every instruction, strings by their index
+#   KND2  uint8   kind of the second operand of every instruction
+#   ARG2  int64   second operand of every instruction
+#   STRO  int64   offsets of the strings in STRS, one more than strings
+#   STRS  bytes   the UTF-8 strings
+#   DBUG  int64   description string of every instruction (optional)
+TYPECODES = {
+    b"OPS ": "i", b"KIND": "B", b"ARG ": "q", b"KND2": "B", b"ARG2": "q",
+    b"STRO": "q", b"STRS": "B",
+    b"DBUG": "q",
+}
+
+
+def descriptions(result: CompilationResult) -> list[str]:
+    """The description of the innermost compilation result of every instruction"""
+    out = []
+    stack = [(result, iter(result.code))]
+    while stack:
+        (current, items) = stack[-1]
+        item = next(items, stack)
+        if item is stack:
+            stack.pop()
+        elif type(item) == CompilationResult:
+            stack.append((item, iter(item.code)))
+        else:
+            out.append(strip_ansi_colour(current.description))
+    return out
+
+
+class Strings:
+    def __init__(self):
+        self.index: dict[str, int] = {}
+
+    def __call__(self, string: str) -> int:
+        if string not in self.index:
+            self.index[string] = len(self.index)
+        return self.index[string]
+
+    def sections(self) -> dict[bytes, array]:
+        data = [s.encode() for s in self.index]
+        offsets = array("q", [0])
+        for d in data:
+            offsets.append(offsets[-1] + len(d))
+        return {b"STRO": offsets, b"STRS": array("B", b"".join(data))}
+
+
+def operand(param, strings: Strings) -> tuple[int, int]:
+    if param is None:
+        return (NONE, 0)
+    if type(param) == int:
+        return (INT, param)
+    if type(param) == str:
+        return (STR, strings(param))
+    raise Exception(f"Cannot write operand {param!r}")
+
+
+def write(file: BinaryIO, code: list[Instructions], result: Optional[CompilationResult] = None):
+    """
+    Writes the code to file. With the compilation result of the code the
+    file gets a debug section
+    """
+    strings = Strings()
+
+    kinds, args = array("B"), array("q")
+    kinds2, args2 = array("B"), array("q")
+    for instruction in code:
+        params = (instruction.param1, instruction.param2) if isinstance(instruction, I1P) else (None, None)
+        (kind, arg) = operand(params[0], strings)
+        kinds.append(kind)
+        args.append(arg)
+        (kind, arg) = operand(params[1], strings)
+        kinds2.append(kind)
+        args2.append(arg)
+
+    sections = {
+        b"OPS ": array("i", [CODE[instruction.instruction] for instruction in code]),
+        b"KIND": kinds,
+        b"ARG ": args,
+        b"KND2": kinds2,
+        b"ARG2": args2,
+    }
+    if result is not None:
+        sections[b"DBUG"] = array("q", [strings(d) for d in descriptions(result)])
+    sections.update(strings.sections())
+
+    flags = BIG_ENDIAN if sys.byteorder == "big" else 0
+    file.write(HEADER.pack(MAGIC, VERSION, flags, len(sections)))
+    offset = HEADER.size + SECTION.size * len(sections)
+    table = []
+    for (name, data) in sections.items():
+        offset += -offset % 8
+        length = len(data) * data.itemsize
+        table.append((name, offset, length))
+        offset += length
+    for entry in table:
+        file.write(SECTION.pack(*entry))
+    for ((name, offset, length), data) in zip(table, sections.values()):
+        file.write(b"\0" * (offset - file.tell()))
+        data.tofile(file)
+
+
+class Bytecode:
+    """
+    A bytecode file mapped into memory. The sections are memoryviews of the
+    mapping; the instructions are built from them once on loading
+    """
+
+    def __init__(self, file: BinaryIO):
+        self.mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.mapping)
+
+        (magic, version, flags, count) = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise Exception("Not a WiM bytecode file")
+        if version != VERSION:
+            raise Exception(f"Unsupported bytecode version {version}")
+        if flags & BIG_ENDIAN != (sys.byteorder == "big"):
+            raise Exception("Bytecode file of another byte order")
+
+        self.sections: dict[bytes, memoryview] = {}
+        for k in range(count):
+            (name, offset, length) = SECTION.unpack_from(
+                view, HEADER.size + k * SECTION.size)
+            self.sections[name] = view[offset:offset + length].cast(TYPECODES[name])
+
+        s = self.sections
+        data = s[b"STRS"]
+        offsets = s[b"STRO"]
+        self.strings = [bytes(data[offsets[k]:offsets[k + 1]]).decode()
+                        for k in range(len(offsets) - 1)]
+
+        self.code = self.decode()
+        self.debug = [self.strings[d] for d in s[b"DBUG"]] if b"DBUG" in s else None
+
+    def decode(self) -> list[Instructions]:
+        strings = self.strings
+        s = self.sections
+        code = []
+        append = code.append
+        for (op, kind, arg, kind2, arg2) in zip(s[b"OPS "].tolist(), s[b"KIND"].tolist(), s[b"ARG "].tolist(),
+                                                s[b"KND2"].tolist(), s[b"ARG2"].tolist()):
+            if kind == NONE:
+                append(I0P(CODES[op]))
+            elif kind2 == NONE:
+                append(I1P(CODES[op], strings[arg] if kind == STR else arg))
+            else:
+                append(I1P(CODES[op], strings[arg] if kind == STR else arg,
+                           strings[arg2] if kind2 == STR else arg2))
+        return code
+
+
+def load(path: str) -> Bytecode:
+    with open(path, "rb") as f:
+        return Bytecode(f)
+
+
+if __name__ == '__main__':
+    import os
+    import tempfile
+
+    from main import listcompose
+    from Interpreter import Interpreter
+    from Output import ListSink
+
+    result = listcompose.code()
+    code = result.to_code()
+
+    path = os.path.join(tempfile.mkdtemp(), "program.wim")
+    with open(path, "wb") as f:
+        write(f, code, result)
+    bytecode = load(path)
+
+    outputs = []
+    for program in (code, bytecode.code):
+        s = Interpreter(program, output=ListSink())
+        s.interactive = False
+        s.run()
+        outputs.append(s.output.getvalue())
+    print(f"{len(code)} instructions, {os.path.getsize(path)} bytes")
+    print(f"same code: {[str(i) for i in code] == [str(i) for i in bytecode.code]}")
+    print(f"same answers: {outputs[0] == outputs[1]}")
+    print(outputs[1])
@@ -0,0 +1,144 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Callable, Optional
+from enum import Enum
+import hashlib
+import marshal
+import os
+
+from ASTNode import ASTNode
+from Batch import encode, decode
+
+if TYPE_CHECKING:
+    from Instructions import Instructions
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CACHE_DIRECTORY = os.path.join(HERE, ".compile_cache")
+
+# Bytes all entries of a cache may take together
+CACHE_SIZE = 64 * 1024 * 1024
+
+# Entries compiled by other versions of these files are never hit
+COMPILER_SOURCES = ["ASTNode.py", "Nodes.py", "Instructions.py"]
+
+
+def compiler_version() -> str:
+    h = hashlib.sha256()
+    for name in COMPILER_SOURCES:
+        with open(os.path.join(HERE, name), "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def fingerprint(*values) -> str:
+    """
+    Structural hash of the values: AST nodes with all their attributes,
+    containers, enums and plain values. The tree is walked without
+    recursion, so deep ASTs are fine
+    """
+    h = hashlib.sha256()
+    stack = [(False, value) for value in reversed(values)]
+    while stack:
+        (token, value) = stack.pop()
+        if token:
+            h.update(value.encode())
+        elif isinstance(value, ASTNode):
+            h.update(f"{type(value).__name__}(".encode())
+            stack.append((True, ")"))
+            for (name, attribute) in sorted(vars(value).items(), reverse=True):
+                stack.append((False, attribute))
+                stack.append((True, f",{name}="))
+        elif isinstance(value, (list, tuple)):
+            h.update(b"[")
+            stack.append((True, "]"))
+            for item in reversed(value):
+                stack.append((False, item))
+                stack.append((True, ","))
+        elif isinstance(value, dict):
+            h.update(b"{")
+            stack.append((True, "}"))
+            for (key, item) in sorted(value.items(), key=lambda item: repr(item[0]), reverse=True):
+                stack.append((False, item))
+                stack.append((True, f",{key!r}:"))
+        elif isinstance(value, Enum):
+            h.update(f"{type(value).__name__}.{value.name}".encode())
+        else:
+            h.update(repr(value).encode())
+    return h.hexdigest()
+
+
+class CompileCache:
+    """
+    Compiled code on disk, keyed by the structure of the AST and the compiler
+    options. When the entries take more than size bytes, the least recently
+    used ones are evicted
+    """
+
+    def __init__(self, directory: str = CACHE_DIRECTORY, size: int = CACHE_SIZE):
+        self.directory = directory
+        self.size = size
+        self.version = compiler_version()
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, expr: ASTNode, *options) -> str:
+        return fingerprint(self.version, expr, *options)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".code")
+
+    def get(self, key: str) -> Optional[list[Instructions]]:
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                code = decode(marshal.load(f))
+        except FileNotFoundError:
+            return None
+        except (EOFError, ValueError, TypeError, IndexError):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return None
+        # another process may have evicted the entry since it was read
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return code
+
+    def put(self, key: str, code: list[Instructions]):
+        path = self.path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            marshal.dump(encode(code), f)
+        os.replace(tmp, path)
+        self.evict()
+
+    def code(self, key: str, compile: Callable[[], list[Instructions]]) -> list[Instructions]:
+        """The cached code for key, compiling and storing it if there is none"""
+        code = self.get(key)
+        if code is None:
+            code = compile()
+            self.put(key, code)
+        return code
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".code"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for (_, size, _) in entries)
+        for (_, size, path) in sorted(entries):
+            if total <= self.size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -109,7 +109,7 @@ class Instructions0Params(Instructions):
         elif self.instruction == Instructions0Params.I.DELBTP:
             state.BP = BPOld(S, state.FP)
         elif self.instruction == Instructions0Params.I.NO:
-            print("No")
+            state.output.write("No")
             state.PC = len(state.code) + 1
         elif self.instruction == Instructions0Params.I.PRUNE:
             state.BP = BPOld(S, state.FP)
@@ -293,11 +293,13 @@ class Instructions1Params(Instructions):
             # returns bindings of all self.param1 globals
             for i in range(self.param1-1, -1, -1):
                 adress = S[state.FP+i+1]
-                print(f">> X{i} = {H.pretty_print(adress)}")
+                state.output.write(f">> X{i} = {H.pretty_print(adress)}")
             if self.param1 == 0:
-                print(">> Yes")
+                state.output.write(">> Yes")
             # wait for user input
-            input("\nPress Enter to continue...\n")
+            if state.interactive:
+                state.output.flush()
+                input("\nPress Enter to continue...\n")
             backtrack(S, state)
         else:
             raise Exception("Unknown instruction" + str(self.instruction))
@@ -6,6 +6,7 @@ from typing import TYPE_CHECKING, List, Union
 from collections import defaultdict
 
 from Instructions import Instructions1Params, bcolors
+from Output import Sink, FileSink
 
 if TYPE_CHECKING:
     from Instructions import Instructions
@@ -167,7 +168,7 @@ def uncolor(str):
 
 
 class Interpreter:
-    def __init__(self, code: list[Instructions]):
+    def __init__(self, code: list[Instructions], output: Sink = None):
         self.stack: Stack = Stack()
         self.heap: Heap = Heap()
         self.trail: Stack = Stack()
@@ -176,10 +177,26 @@ class Interpreter:
         self.PC: int = 0
         self.FP: int = -1
         self.BP: int = -1
+        self.steps: int = 0
+        self.output = output if output is not None else FileSink()
+        # HALT waits for the user before backtracking for further solutions
+        self.interactive = True
 
     def run(self, debug=False, pretty=False):
         print("Running...\n\n")
 
+        try:
+            step = self.run_instructions(debug, pretty)
+        finally:
+            self.output.flush()
+        self.steps = step
+
+        print(f"\n\nExecution finished in {step} steps")
+
+    def run_instructions(self, debug=False, pretty=False) -> int:
+        """
+        Runs the program by interpreting the instruction objects. Returns the number of steps
+        """
         step = 0
         while True:
             if self.PC >= len(self.code):
@@ -187,6 +204,8 @@ class Interpreter:
             IR = self.code[self.PC]
 
             if debug:
+                # the output of the instructions so far comes before the trace of this one
+                self.output.flush()
                 # sleep(0.001)
                 real_ir_length = len(uncolor(str(IR)))
                 registers = f"PC: {self.PC: > 5}, SP: {self.stack.SP: > 5}, FP: {self.FP: > 5}, BP: {self.BP: > 5}" + \
@@ -217,4 +236,4 @@ class Interpreter:
 
             step += 1
 
-        print(f"\n\nExecution finished in {step} steps")
+        return step
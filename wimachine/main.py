@@ -1,6 +1,7 @@
 from Nodes import *
 from Instructions import Instructions0Params as I0P, Instructions1Params as I1P
 from Interpreter import Interpreter
+from Cache import CompileCache
 
 
 def makeList(args: List[ASTNode]) -> ASTNode:
@@ -70,13 +71,18 @@ if __name__ == '__main__':
 
     print(expr, "\n")
 
-    comp_result = expr.code()
-    comp_result_json = comp_result.to_json()
+    cache = CompileCache()
+    key = cache.key(expr)
+    code = cache.get(key)
 
-    with open("comp_result.json", "w") as f:
-        f.write(comp_result_json)
+    if code is None:
+        comp_result = expr.code()
+        comp_result.save_json("comp_result.json")
 
-    code = comp_result.to_code()
+        code = comp_result.to_code()
+        cache.put(key, code)
+    else:
+        print(f"Code from the compile cache ({key[:12]})\n")
 
     print(f"Code: [{len(code)} instructions]\n{code}\n")
 
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+# the modules of the machine import each other by their flat names
+MACHINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The machines have modules of the same names, e.g. Interpreter. While the
+# tests of this machine are collected and run, its modules are the ones
+# imported by these names; those of the other machines are kept in
+# sys.modules by their paths meanwhile, so that their tests find them again
+NAMES = [name[:-3] for name in os.listdir(MACHINE) if name.endswith(".py")]
+
+
+def activate():
+    if sys.path[0] != MACHINE:
+        if MACHINE in sys.path:
+            sys.path.remove(MACHINE)
+        sys.path.insert(0, MACHINE)
+    for name in NAMES:
+        module = sys.modules.get(name)
+        path = getattr(module, "__file__", None)
+        if module is not None and path is not None and os.path.dirname(os.path.abspath(path)) != MACHINE:
+            sys.modules[os.path.abspath(path)] = sys.modules.pop(name)
+        ours = sys.modules.get(os.path.join(MACHINE, f"{name}.py"))
+        if name not in sys.modules and ours is not None:
+            sys.modules[name] = ours
+
+
+activate()
+
+
+def pytest_make_collect_report(collector):
+    # the test modules of this machine import its modules when they are collected
+    activate()
+
+
+@pytest.fixture(autouse=True)
+def machine():
+    activate()
@@ -0,0 +1,16 @@
+from Batch import run_batch
+from Interpreter import Interpreter
+from Output import ListSink
+from main import listcompose, test
+
+
+def test_pool_matches_serial_runs():
+    programs = [listcompose.code().to_code(), test.code().to_code()]
+    results = run_batch(programs * 3, workers=2)
+    for (code, result) in zip(programs * 3, results):
+        s = Interpreter(code, output=ListSink())
+        s.interactive = False
+        steps = s.run_instructions()
+        assert result.error is None
+        assert (result.exit_code, result.output, result.steps) == (s.stack.stack[0], s.output.getvalue(), steps)
+        assert result.output
@@ -0,0 +1,25 @@
+from Bytecode import write, load
+from Interpreter import Interpreter
+from Output import ListSink
+from main import listcompose
+
+
+def run(code):
+    interpreter = Interpreter(code, output=ListSink())
+    interpreter.interactive = False
+    steps = interpreter.run_instructions()
+    return (interpreter.output.getvalue(), steps)
+
+
+def test_round_trip(tmp_path):
+    result = listcompose.code()
+    code = result.to_code()
+    path = tmp_path / "program.wim"
+    with open(path, "wb") as f:
+        write(f, code, result)
+    bytecode = load(str(path))
+    assert [str(i) for i in bytecode.code] == [str(i) for i in code]
+    (output, steps) = run(bytecode.code)
+    assert (output, steps) == run(code)
+    assert output
+    assert len(bytecode.debug) == len(code)